@@ -0,0 +1,173 @@
+"""Array placement with automatic pitch detection.
+
+Regular grids of identical references are emitted as a single CellArray
+(a GDSII AREF record) instead of one DeviceReference (SREF) per
+instance, which keeps the written file small and fast to read back.
+"""
+
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from phidl import Device
+from phidl.device_layout import CellArray, DeviceReference
+
+# positions closer than this (in microns) are treated as identical
+TOLERANCE = 1e-6
+
+
+def _frame(rotation: float, x_reflection: bool) -> np.ndarray:
+    """Returns the matrix R.F that maps array lattice offsets to layout
+    coordinates (see gdspy.CellArray)."""
+    c = np.cos(np.radians(rotation))
+    s = np.sin(np.radians(rotation))
+    M = np.array([[c, -s], [s, c]])
+    if x_reflection:
+        M = M @ np.diag((1, -1))
+    return M
+
+
+def _regular(values: np.ndarray) -> Optional[float]:
+    """Returns the pitch of sorted, unique values if they are evenly spaced (0
+    for a single value), otherwise None."""
+    if len(values) == 1:
+        return 0
+    steps = np.diff(values)
+    if np.all(np.abs(steps - steps[0]) < TOLERANCE):
+        return steps[0]
+    return None
+
+
+def detect_pitch(
+    positions: Sequence[Tuple[float, float]],
+) -> Optional[Tuple[Tuple[float, float], int, int, Tuple[float, float]]]:
+    """Checks whether positions form a complete, regularly pitched grid.
+
+    Parameters:
+        positions (array-like[N][2]): positions in lattice coordinates
+
+    Returns:
+        tuple or None: (origin, columns, rows, spacing) of the grid, or None
+            if the positions are not a full regular grid
+    """
+    P = np.round(np.asarray(positions, dtype=float) / TOLERANCE) * TOLERANCE
+    xs = np.unique(P[:, 0])
+    ys = np.unique(P[:, 1])
+    if len(xs) * len(ys) != len(P) or len(np.unique(P, axis=0)) != len(P):
+        return None
+    dx = _regular(xs)
+    dy = _regular(ys)
+    if dx is None or dy is None:
+        return None
+    return (xs[0], ys[0]), len(xs), len(ys), (dx, dy)
+
+
+def _runs(xs: np.ndarray) -> List[np.ndarray]:
+    """Splits sorted values into maximal evenly spaced runs."""
+    runs = [[xs[0]]]
+    for x in xs[1:]:
+        run = runs[-1]
+        if len(run) < 2 or abs((x - run[-1]) - (run[1] - run[0])) < TOLERANCE:
+            run.append(x)
+        else:
+            runs.append([x])
+    return [np.array(r) for r in runs]
+
+
+def place_array(
+    D: Device,
+    device: Device,
+    positions: Sequence[Tuple[float, float]],
+    rotation: float = 0,
+    x_reflection: bool = False,
+) -> List[Union[CellArray, DeviceReference]]:
+    """Places references to device at each of positions, using as few
+    CellArrays as possible.
+
+    A complete regular grid becomes a single array. Otherwise each row of
+    the grid is split into evenly pitched runs, and runs of a single
+    instance fall back to plain references.
+
+    Parameters:
+        D (Device): device to add the references to
+        device (Device): referenced device
+        positions (array-like[N][2]): origin of each instance
+        rotation (float): rotation of every instance in degrees
+        x_reflection (bool): if True, every instance is mirrored about x
+
+    Returns:
+        List[CellArray or DeviceReference]: the placed elements
+    """
+    if len(positions) == 0:
+        return []
+    M = _frame(rotation, x_reflection)
+    # lattice coordinates: positions = M @ local
+    local = np.asarray(positions, dtype=float) @ np.linalg.inv(M).T
+
+    grid = detect_pitch(local)
+    if grid is not None:
+        runs = [grid]
+    else:
+        runs = []
+        P = np.round(local / TOLERANCE) * TOLERANCE
+        for y in np.unique(P[:, 1]):
+            for xs in _runs(np.unique(P[P[:, 1] == y, 0])):
+                runs.append(((xs[0], y), len(xs), 1, (_regular(xs), 0)))
+
+    placed = []
+    for origin, columns, rows, spacing in runs:
+        origin = M @ np.array(origin)
+        if columns * rows == 1:
+            e = DeviceReference(
+                device, origin=origin, rotation=rotation, x_reflection=x_reflection
+            )
+        else:
+            e = CellArray(
+                device,
+                columns,
+                rows,
+                spacing,
+                origin=origin,
+                rotation=rotation,
+                x_reflection=x_reflection,
+            )
+        e.owner = D
+        D.add(e)
+        placed.append(e)
+    return placed
+
+
+def arrayize(D: Device, device: Device) -> List[Union[CellArray, DeviceReference]]:
+    """Replaces the plain references to device in D by arrays wherever they lie
+    on a regular pitch.
+
+    References are grouped by orientation; references with magnification
+    are left untouched.
+
+    Parameters:
+        D (Device): device whose references are rewritten
+        device (Device): referenced device to convert
+
+    Returns:
+        List[CellArray or DeviceReference]: the placed elements
+    """
+    groups = {}
+    for r in D.references:
+        if (
+            r.parent is device
+            and not isinstance(r, CellArray)
+            and r.magnification is None
+        ):
+            key = (round((r.rotation or 0) % 360, 9), bool(r.x_reflection))
+            groups.setdefault(key, []).append(r)
+    placed = []
+    for (rotation, x_reflection), refs in groups.items():
+        for r in refs:
+            D.remove(r)
+        placed += place_array(
+            D,
+            device,
+            [r.origin for r in refs],
+            rotation=rotation,
+            x_reflection=x_reflection,
+        )
+    return placed
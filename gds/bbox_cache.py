@@ -0,0 +1,207 @@
+"""Cached bounding boxes of Devices and references.
+
+gdspy caches the bounding box of a cell, but validates the cache on every
+query by walking all of the cell's dependencies, and computes the bounding
+box of a reference with a non-cardinal rotation from its flattened
+polygons. Placement code queries .xmin, .center, .size etc. thousands of
+times while building a chip, so enable() replaces both with:
+
+    - a per-Device cache that is invalidated when the Device is mutated
+      (phidl and gdspy already clear Device._bb_valid there) and, through
+      the Devices that computed their bounding box from it, in every
+      Device above it in the hierarchy
+    - a per-reference cache keyed on the referenced Device's cache version
+      and the reference transformation; rotated references are bounded
+      through the convex hull of the referenced Device, which is computed
+      once per version
+
+so that a repeated query costs a dictionary lookup. The patches apply to
+every Device in the process, so they are installed for the duration of a
+build rather than on import:
+
+    with bbox_cache.enabled():
+        D = test_chip(True, ls)
+"""
+
+import contextlib
+import weakref
+from typing import Optional
+
+import gdspy
+import numpy as np
+from phidl.device_layout import CellArray, Device, DeviceReference
+
+_VALID = gdspy.Cell.__dict__["_bb_valid"]
+_ORIGINAL = {}
+
+
+def _get_valid(self) -> bool:
+    try:
+        return _VALID.__get__(self)
+    except AttributeError:
+        return False
+
+
+def _set_valid(self, value: bool) -> None:
+    was_valid = _get_valid(self)
+    _VALID.__set__(self, value)
+    if was_valid and not value:
+        state = self.__dict__
+        state["_bb_version"] = state.get("_bb_version", 0) + 1
+        # every Device whose cached bbox was computed from this one
+        for ref in state.pop("_bb_parents", {}).values():
+            parent = ref()
+            if parent is not None:
+                parent._bb_valid = False
+
+
+def _device_bbox(self) -> Optional[np.ndarray]:
+    if not _get_valid(self):
+        points = [p for polygon in self.polygons for p in polygon.polygons]
+        for path in self.paths:
+            points.extend(path.to_polygonset().polygons)
+        for reference in self.references:
+            cell = reference.ref_cell
+            if isinstance(cell, Device):
+                parents = cell.__dict__.setdefault("_bb_parents", {})
+                parents[id(self)] = weakref.ref(self)
+            bb = reference.get_bounding_box()
+            if bb is not None:
+                points.append(bb)
+        if points:
+            points = np.concatenate(points)
+            self._bounding_box = np.array((points.min(axis=0), points.max(axis=0)))
+        else:
+            self._bounding_box = None
+        self._bb_valid = True
+    if self._bounding_box is None:
+        return None
+    return np.array(self._bounding_box)
+
+
+def _convex_hull(points: np.ndarray) -> np.ndarray:
+    """Convex hull (monotone chain) of a point cloud."""
+    points = np.unique(points, axis=0)
+    if len(points) < 3:
+        return points
+
+    def half(pts):
+        chain = []
+        for p in pts:
+            while len(chain) >= 2:
+                a, b = chain[-2], chain[-1]
+                if (b[0] - a[0]) * (p[1] - a[1]) - (b[1] - a[1]) * (p[0] - a[0]) > 0:
+                    break
+                chain.pop()
+            chain.append(p)
+        return chain[:-1]
+
+    return np.array(half(points) + half(points[::-1]))
+
+
+def _hull(cell: Device) -> np.ndarray:
+    version = cell.__dict__.get("_bb_version", 0)
+    cached = cell.__dict__.get("_bb_hull")
+    if cached is None or cached[0] != version:
+        polygons = cell.get_polygons()
+        points = np.concatenate(polygons) if polygons else np.zeros((0, 2))
+        cached = (version, _convex_hull(points))
+        cell.__dict__["_bb_hull"] = cached
+    return cached[1]
+
+
+def _reference_bbox(self) -> Optional[np.ndarray]:
+    cell = self.ref_cell
+    if not isinstance(cell, Device):
+        base = (
+            gdspy.CellArray
+            if isinstance(self, gdspy.CellArray)
+            else gdspy.CellReference
+        )
+        return base.get_bounding_box(self)
+    cell_bbox = cell.get_bounding_box()
+    if cell_bbox is None:
+        return None
+    key = (
+        id(cell),
+        cell.__dict__.get("_bb_version", 0),
+        tuple(np.asarray(self.origin, dtype=float)),
+        self.rotation,
+        self.magnification,
+        self.x_reflection,
+        getattr(self, "columns", None),
+        getattr(self, "rows", None),
+        tuple(getattr(self, "spacing", ())),
+    )
+    cached = self.__dict__.get("_bb_cache")
+    if cached is None or cached[0] != key:
+        if self.rotation is None or self.rotation % 90 == 0:
+            points = cell_bbox
+        else:
+            points = _hull(cell)
+        points = np.concatenate(self._transform_polygons([np.array(points)]))
+        cached = (key, np.array((points.min(axis=0), points.max(axis=0))))
+        self.__dict__["_bb_cache"] = cached
+    return np.array(cached[1])
+
+
+def _invalidating(function):
+    def wrapper(self, *args, **kwargs):
+        result = function(self, *args, **kwargs)
+        self._bb_valid = False
+        return result
+
+    wrapper.__name__ = function.__name__
+    wrapper.__doc__ = function.__doc__
+    return wrapper
+
+
+def _patches():
+    return [
+        (Device, "_bb_valid", property(_get_valid, _set_valid)),
+        (Device, "get_bounding_box", _device_bbox),
+        (DeviceReference, "get_bounding_box", _reference_bbox),
+        (CellArray, "get_bounding_box", _reference_bbox),
+        # gdspy leaves the cached bbox in place when geometry is removed
+        (Device, "remove_polygons", _invalidating(gdspy.Cell.remove_polygons)),
+        (Device, "remove_paths", _invalidating(gdspy.Cell.remove_paths)),
+    ]
+
+
+def enable() -> None:
+    """Installs the cached bounding boxes on phidl Devices and references.
+
+    Calling enable() again has no effect.
+    """
+    if _ORIGINAL:
+        return
+    for cls, name, replacement in _patches():
+        _ORIGINAL[cls, name] = cls.__dict__.get(name)
+        setattr(cls, name, replacement)
+
+
+def disable() -> None:
+    """Restores the phidl/gdspy bounding box computation."""
+    for (cls, name), original in _ORIGINAL.items():
+        if original is None:
+            delattr(cls, name)
+        else:
+            setattr(cls, name, original)
+    _ORIGINAL.clear()
+
+
+@contextlib.contextmanager
+def enabled():
+    """Context manager (or decorator) that installs the cached bounding boxes
+    for the duration of the block.
+
+    If they are enabled already, they are left enabled on exit.
+    """
+    if _ORIGINAL:
+        yield
+        return
+    enable()
+    try:
+        yield
+    finally:
+        disable()
@@ -0,0 +1,414 @@
+"""Layout generation benchmarks.
+
+Times every factory across the parameter ranges swept in test_chip(),
+test_chip() itself and the 64-die array export, and records peak memory,
+polygon/vertex counts per layer and GDS size. The import time of the build
+entry points is measured in fresh interpreters. Results are written as
+JSON so that runs from different commits can be compared:
+
+    python benchmark.py -o before.json
+    (change something)
+    python benchmark.py -o after.json --compare before.json
+
+The boolean engines (gdspy and the Manhattan fast path) are compared on
+arrays of the factory cells, of growing size, with:
+
+    python benchmark.py --booleans
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Sequence
+
+import gdspy
+import numpy as np
+import phidl
+from phidl import Device
+
+import bbox_cache
+import make_gds as mg
+import manhattan
+from cell_cache import CELL_CACHE
+from gds_stream import GdsStream, build_timestamp
+from labels import LABEL_CACHE
+
+
+def geometry_stats(D: Device) -> Dict:
+    """Counts polygons and vertices per layer of the flattened device.
+
+    Parameters:
+        D (Device): device to measure
+
+    Returns:
+        dict: per-layer polygon/vertex counts and totals
+    """
+    layers = {}
+    for (layer, datatype), polygons in sorted(D.get_polygons(by_spec=True).items()):
+        layers[f"{layer}/{datatype}"] = {
+            "polygons": len(polygons),
+            "vertices": int(sum(len(p) for p in polygons)),
+        }
+    return {
+        "layers": layers,
+        "polygons": sum(l["polygons"] for l in layers.values()),
+        "vertices": sum(l["vertices"] for l in layers.values()),
+    }
+
+
+def gds_bytes(D: Device) -> int:
+    """Size of D written as GDSII the way make_gds.build() writes it, through a
+    GdsStream under hashed cell names."""
+    f = io.BytesIO()
+    with GdsStream(f, cellname="top", timestamp=build_timestamp()) as stream:
+        stream.write(D, top=True)
+    return f.tell()
+
+
+def _cold() -> None:
+    """Empties the in-memory caches so that every build starts from scratch."""
+    CELL_CACHE.clear()
+    LABEL_CACHE.clear()
+
+
+def run_case(build: Callable[[], List[Device]], repeat: int = 3) -> Dict:
+    """Benchmarks one case.
+
+    Parameters:
+        build (Callable): builds and returns the devices of the case
+        repeat (int): number of timed runs
+
+    Returns:
+        dict: build time, peak memory, geometry, GDS size and GDS write time
+            of the case
+    """
+    times = []
+    for _ in range(repeat):
+        _cold()
+        t = time.perf_counter()
+        devices = build()
+        times.append(time.perf_counter() - t)
+    # separate run for memory, tracemalloc slows down allocation
+    _cold()
+    tracemalloc.start()
+    build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    top = Device("benchmark")
+    for D in devices:
+        top << D
+    t = time.perf_counter()
+    size = gds_bytes(top)
+    result = {
+        "time_min": min(times),
+        "time_median": float(np.median(times)),
+        "repeat": repeat,
+        "peak_memory": peak,
+        "devices": len(devices),
+        "gds_bytes": size,
+        "gds_write_time": time.perf_counter() - t,
+    }
+    result.update(geometry_stats(top))
+    return result
+
+
+def cases(ls) -> Dict[str, Callable[[], List[Device]]]:
+    """Benchmark cases: each factory over the ranges swept in test_chip(),
+    test_chip() and the wafer array."""
+    pad_size = (100, 100)
+    L_cap = [5, 10, 20, 50, 100, 200]
+    W_cap = [5, 10, 20, 50, 100]
+    L_gate = [1, 2, 3, 5, 10, 20, 50]
+    L_overlap = [2, 5, 10]
+    W_channel = [5, 10, 20, 50, 100]
+    tlm_layers = dict(
+        via_layer=ls["via"].gds_layer,
+        pad_layer=ls["sourcedrain"].gds_layer,
+        mesa_layer=ls["mesa"].gds_layer,
+    )
+
+    def sweep(function, *ranges) -> Callable[[], List[Device]]:
+        return lambda: [function(*p) for p in itertools.product(*ranges)]
+
+    return {
+        "mos_cap": sweep(
+            lambda L, W: mg.mos_cap(L, 10, W, True, ls, pad_size), L_cap, W_cap
+        ),
+        "mim_cap": sweep(
+            lambda L, W: mg.mim_cap(L, W, True, ls, pad_size), L_cap, W_cap
+        ),
+        "transistor": sweep(
+            lambda L_g, L_ov, W: mg._transistor_sweep(L_ov, W, L_g, True, ls, pad_size),
+            L_gate,
+            L_overlap,
+            W_channel,
+        ),
+        "gated_vdp": sweep(
+            lambda gated, rotation: mg.gated_vdp(gated, rotation, pad_size, True, ls),
+            [True, False],
+            [0, 45],
+        ),
+        "vdp_metal": sweep(
+            lambda layer: mg.vdp_metal(layer, 45, pad_size, ls),
+            ["sourcedrain", "gate"],
+        ),
+        "metal_resistor": sweep(
+            lambda sq, layer: mg.metal_resistor(5, sq, layer, True, pad_size, ls),
+            [50, 100, 500],
+            ["gate", "sourcedrain"],
+        ),
+        "step_heights": lambda: [mg.step_heights(ls)],
+        "via_tests": lambda: [
+            mg.via_tests([5, 10, 20], 8, pad_size, ls),
+            mg.via_tests([2, 50], 8, pad_size, ls),
+        ],
+        "tlm": sweep(
+            lambda gated, bot: mg.tlm(
+                50,
+                [10, 20, 50, 80, 100, 150],
+                50,
+                finger_layer=ls["gate" if bot else "sourcedrain"].gds_layer,
+                gate_layer=ls["gate"].gds_layer if gated else None,
+                pad_size=(100, 100),
+                **tlm_layers,
+            ),
+            [False, True],
+            [True, False],
+        ),
+        "test_chip": lambda: [mg.test_chip(False, ls), mg.test_chip(True, ls)],
+        "wafer_array": lambda: [mg.wafer_array(ls)],
+    }
+
+
+def booleans(
+    ls,
+    names: List[str] = None,
+    copies: Sequence[int] = (1, 2, 4, 8),
+    repeat: int = 3,
+    width: float = 1,
+) -> Dict:
+    """Times the boolean engines (gdspy and manhattan, without its size
+    threshold) on the polygons of the factory cells.
+
+    The cells of a case are placed in a row, which is repeated in an
+    n x n array for every n of copies. Per layer, the Manhattan polygons
+    are merged and opened by width (the DRC width check: shrink, grow, then
+    the part of the merged shape that was lost).
+
+    Parameters:
+        ls (LayerSet): layer set passed to the factories
+        names (List[str] or None): cases of cases() to use (default: the
+            factory cells)
+        copies (Sequence[int]): array sizes
+        repeat (int): the minimum of this many runs is reported
+        width (float): width of the opening
+
+    Returns:
+        dict: per case and array size, the number of vertices, the time of
+            both engines (seconds) and the area of the XOR of their results
+    """
+    if names is None:
+        names = ["mos_cap", "mim_cap", "transistor", "tlm", "step_heights"]
+    builders = cases(ls)
+
+    def check(engine, polygons):
+        merged = engine.boolean(polygons, None, "or", precision=1e-3)
+        shrunk = engine.offset(
+            merged, -width / 2, join="miter", precision=1e-3, join_first=True
+        )
+        opened = engine.offset(
+            shrunk, width / 2, join="miter", precision=1e-3, join_first=True
+        )
+        return merged, engine.boolean(merged, opened, "not", precision=1e-3)
+
+    results = {}
+    min_vertices = manhattan.MIN_VERTICES
+    manhattan.MIN_VERTICES = 0
+    try:
+        for name in names:
+            row = Device(name)
+            x = 0
+            for D in builders[name]():
+                (row << D).move((x - D.xmin, -D.ymin))
+                x += D.xsize + 50
+            layers = [
+                [p for p in polygons if manhattan.is_manhattan([p])]
+                for polygons in row.get_polygons(by_spec=True).values()
+            ]
+            for n in copies:
+                pitch = (row.xsize + 50, row.ysize + 50)
+                shifts = np.array(list(itertools.product(range(n), repeat=2))) * pitch
+                arrays = [[p + s for s in shifts for p in q] for q in layers]
+                found = {}
+                for engine in (gdspy, manhattan):
+                    times = []
+                    for _ in range(repeat):
+                        t = time.perf_counter()
+                        found[engine] = [check(engine, p) for p in arrays if p]
+                        times.append(time.perf_counter() - t)
+                    found[engine.__name__] = min(times)
+                mismatch = 0.0
+                for a, b in zip(found[gdspy], found[manhattan]):
+                    for x, y in zip(a, b):
+                        xor = gdspy.boolean(x, y, "xor", precision=1e-3)
+                        mismatch += sum(r[1] for r in manhattan.regions(xor))
+                results[f"{name} {n}x{n}"] = {
+                    "vertices": sum(len(p) for q in arrays for p in q),
+                    "gdspy": found["gdspy"],
+                    "manhattan": found["manhattan"],
+                    "mismatch_area": mismatch,
+                }
+    finally:
+        manhattan.MIN_VERTICES = min_vertices
+    return results
+
+
+def import_time(module: str, repeat: int = 5, top: int = 8) -> Dict:
+    """Measures the time to import module in a fresh interpreter.
+
+    Parameters:
+        module (str): module to import, from the directory of this file
+        repeat (int): number of interpreters started
+        top (int): number of slowest top-level imports to report
+
+    Returns:
+        dict: wall time of the import and the cumulative import time of the
+            slowest packages (python -X importtime), in seconds
+    """
+    times = []
+    packages = {}
+    for _ in range(repeat):
+        t = time.perf_counter()
+        stderr = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stderr
+        times.append(time.perf_counter() - t)
+        for line in stderr.splitlines():
+            if not line.startswith("import time:"):
+                continue
+            _, cumulative, name = line[len("import time:") :].split("|")
+            name = name.strip()
+            # top-level packages only, wherever they were first imported,
+            # without the interpreter startup
+            if (
+                not cumulative.strip().isdigit()
+                or "." in name
+                or name in (module, "site", "encodings")
+            ):
+                continue
+            seconds = int(cumulative) * 1e-6
+            packages[name] = min(packages.get(name, seconds), seconds)
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {"time_min": min(times), "packages": dict(slowest)}
+
+
+def git_commit() -> str:
+    """Returns the current commit hash, or an empty string outside git."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.1) -> List[str]:
+    """Compares two benchmark result files.
+
+    Parameters:
+        results (dict): current results
+        baseline (dict): results to compare against
+        threshold (float): relative slowdown reported as a regression
+
+    Returns:
+        List[str]: one formatted line per case
+    """
+    lines = []
+    for name, r in results.get("imports", {}).items():
+        b = baseline.get("imports", {}).get(name)
+        if b is not None:
+            lines.append(
+                f"import {name:9s} {b['time_min']:8.3f}s -> {r['time_min']:8.3f}s"
+            )
+    for name, r in results["cases"].items():
+        b = baseline["cases"].get(name)
+        if b is None:
+            lines.append(f"{name:16s} (new)")
+            continue
+        ratio = r["time_min"] / b["time_min"] if b["time_min"] else float("inf")
+        flag = "REGRESSION" if ratio > 1 + threshold else ""
+        lines.append(
+            f"{name:16s} time {b['time_min']:8.3f}s -> {r['time_min']:8.3f}s "
+            f"(x{ratio:.2f})  polygons {b['polygons']} -> {r['polygons']}  "
+            f"gds {b['gds_bytes']} -> {r['gds_bytes']}  {flag}"
+        )
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-c", "--compare", help="earlier result file")
+    parser.add_argument(
+        "-k", "--cases", nargs="*", help="only run these cases (default: all)"
+    )
+    parser.add_argument(
+        "--booleans",
+        action="store_true",
+        help="only compare the boolean engines (gdspy, manhattan)",
+    )
+    args = parser.parse_args()
+
+    # the cached bounding boxes of the build, for the factory cases too
+    bbox_cache.enable()
+    ls = mg.default_layer_set()
+    if args.booleans:
+        for name, r in booleans(ls, args.cases, repeat=args.repeat).items():
+            print(
+                f"{name:20s} {r['vertices']:7d} vertices  gdspy {r['gdspy']:8.3f}s  "
+                f"manhattan {r['manhattan']:8.3f}s  "
+                f"(x{r['gdspy'] / r['manhattan']:.1f})  "
+                f"XOR area {r['mismatch_area']:.3g}"
+            )
+        sys.exit()
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "phidl": phidl.__version__,
+        "imports": {},
+        "cases": {},
+    }
+    # make_gds as imported by an interactive session, build as the headless
+    # entry point
+    for module in ("make_gds", "build"):
+        r = results["imports"][module] = import_time(module)
+        slowest = ", ".join(f"{n} {t:.2f}s" for n, t in r["packages"].items())
+        print(f"import {module:9s} {r['time_min']:8.3f}s  ({slowest})")
+    for name, build in cases(ls).items():
+        if args.cases and name not in args.cases:
+            continue
+        results["cases"][name] = run_case(build, repeat=args.repeat)
+        r = results["cases"][name]
+        print(
+            f"{name:16s} {r['time_min']:8.3f}s  {r['peak_memory'] / 2**20:7.1f} MiB  "
+            f"{r['polygons']:8d} polygons  {r['gds_bytes']:9d} B"
+        )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(results, json.load(f))))
@@ -0,0 +1,18 @@
+"""Headless mask build.
+
+phidl imports matplotlib (and, through it, the default GUI backend) when
+it is loaded. This entry point selects the non-interactive Agg backend
+first, so batch builds never start Qt, then runs make_gds.main()::
+
+    python build.py [--format gds|gds.gz|oas] [-o ito_test.gds] [-j 4]
+                    [--no-store] [--preview ito_test.png]
+"""
+
+import os
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import make_gds  # noqa: E402
+
+if __name__ == "__main__":
+    make_gds.main()
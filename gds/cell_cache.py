@@ -0,0 +1,175 @@
+"""Parameter-keyed memoization for device factories.
+
+The factories in make_gds.py are deterministic functions of their
+arguments, so repeated calls with identical parameters (e.g. across
+gridsweeps or between the two variants of test_chip) can share a single
+Device instead of regenerating the geometry.
+"""
+
+import functools
+import inspect
+from collections import OrderedDict, namedtuple
+from typing import Any, Callable, Hashable, List, Tuple
+
+import numpy as np
+from phidl import Device, LayerSet
+
+from cell_names import factory_name
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def freeze(value: Any) -> Hashable:
+    """Converts a factory argument into a hashable cache key component.
+
+    Parameters:
+        value (Any): argument passed to a factory
+
+    Returns:
+        Hashable: key component that compares equal for equal arguments
+    """
+    if isinstance(value, LayerSet):
+        return ("LayerSet",) + tuple(
+            (name, l.gds_layer, l.gds_datatype) for name, l in value._layers.items()
+        )
+    if isinstance(value, np.ndarray):
+        return ("ndarray", value.shape, tuple(value.flatten().tolist()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__,) + tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return ("dict",) + tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    # keep the type so that e.g. 1 and 1.0 (which produce different cell
+    # names) map to different entries
+    hash(value)
+    return (type(value).__name__, value)
+
+
+def arguments(function: Callable, *args, **kwargs) -> List[Tuple[str, Any]]:
+    """Name and value of every argument of a call, defaults included."""
+    bound = inspect.signature(function).bind(*args, **kwargs)
+    bound.apply_defaults()
+    return list(bound.arguments.items())
+
+
+class CellCache:
+    """Bounded LRU cache of generated Devices.
+
+    Parameters:
+        maxsize (int): maximum number of Devices kept before the least
+            recently used entry is evicted
+        store (CellStore or None): optional persistent store consulted on a
+            miss and filled with newly generated Devices
+        hashed_names (bool): if True, a hash of the call is appended to the
+            name of generated Devices (see cell_names.py), so that cell
+            names are unique and stable between builds
+    """
+
+    def __init__(self, maxsize: int = 1024, store=None, hashed_names: bool = True):
+        self.maxsize = maxsize
+        self.store = store
+        self.hashed_names = hashed_names
+        self.hits = 0
+        self.misses = 0
+        self.context = {}
+        self._cells = OrderedDict()
+
+    def set_context(self, name: str, value: Hashable) -> None:
+        """Sets a global build option that changes the generated geometry (e.g.
+        the label mode); it becomes part of every cache key.
+
+        Parameters:
+            name (str): option name
+            value (Hashable): option value
+        """
+        self.context[name] = value
+
+    def key(self, function: Callable, *args, **kwargs) -> Hashable:
+        """Builds the cache key for a call, with defaults filled in so that
+        positional and keyword calls map to the same entry."""
+        return (
+            function.__module__,
+            function.__qualname__,
+            tuple(
+                (name, freeze(v)) for name, v in arguments(function, *args, **kwargs)
+            ),
+            tuple(sorted(self.context.items())),
+        )
+
+    def get(self, key: Hashable) -> Device:
+        """Returns the cached Device for key (or None), updating the LRU order
+        and the hit/miss counters."""
+        D = self._cells.get(key)
+        if D is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._cells.move_to_end(key)
+        return D
+
+    def put(self, key: Hashable, D: Device) -> None:
+        """Stores D under key, evicting the least recently used entries if the
+        cache is full."""
+        self._cells[key] = D
+        self._cells.move_to_end(key)
+        while len(self._cells) > self.maxsize:
+            self._cells.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drops all cached Devices and resets the counters."""
+        self._cells.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def devices(self) -> List[Device]:
+        """Returns the cached Devices, least recently used first."""
+        return list(self._cells.values())
+
+    def info(self) -> CacheInfo:
+        """Returns hit/miss statistics."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._cells))
+
+    def __call__(self, function: Callable) -> Callable:
+        """Decorates a factory so that calls with identical arguments return
+        the same (shared) Device.
+
+        Callers must not mutate the returned Device; place it with a
+        reference instead.
+        """
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            try:
+                key = self.key(function, *args, **kwargs)
+            except TypeError:
+                # unhashable argument, fall back to an uncached call
+                return function(*args, **kwargs)
+            D = self.get(key)
+            if D is None:
+                if self.store is not None:
+                    D = self.store.get(key, function)
+                stored = D is not None
+                if not stored:
+                    D = function(*args, **kwargs)
+                # also renames cells stored before hashed names were used
+                if self.hashed_names:
+                    D.name = factory_name(D.name, key)
+                # the call that made the cell, for the device metadata
+                # sidecar (see metadata.py); layer sets are not recorded
+                D.info["factory"] = function.__name__
+                D.info["parameters"] = {
+                    name: value
+                    for name, value in arguments(function, *args, **kwargs)
+                    if not isinstance(value, LayerSet)
+                }
+                if self.store is not None and not stored:
+                    self.store.put(key, function, D)
+                self.put(key, D)
+            return D
+
+        wrapper.uncached = function
+        wrapper.cache = self
+        return wrapper
+
+
+CELL_CACHE = CellCache()
+cached_cell = CELL_CACHE
@@ -0,0 +1,186 @@
+"""Deterministic cell names.
+
+Device.write_gds(auto_rename=True) makes cell names unique by appending a
+counter in creation order, so the name of a cell depends on everything that
+was built before it (and on whether it came from the cell store or a
+parallel worker). Here names are instead derived from what the cell is:
+
+    - factory cells (see CellCache) are named by a hash of the factory and
+      its arguments when they are generated, e.g. TRANSISTOR(8,2,2,12,10)
+      becomes TRANSISTOR_3f2a9c1b07d4
+    - other cells are named at write time by a hash of their content, i.e.
+      their polygons, labels and the names and placements of the cells
+      they reference
+
+Equal names therefore mean equal cells, and two builds of the same layout
+produce the same names in the same order.
+"""
+
+import hashlib
+import re
+from collections import ChainMap
+from typing import Dict, Hashable, Mapping
+
+import numpy as np
+from phidl import Device
+from phidl.device_layout import CellArray
+
+# hex digits of the hash appended to the cell name (48 bits, so that distinct
+# cells of a layout do not share a name by chance; see also GdsStream, which
+# checks the content of cells written under the same name)
+HASH_LENGTH = 12
+
+_hashed = re.compile(r"[A-Za-z0-9_?$]*_[0-9a-f]{%d}" % HASH_LENGTH)
+
+
+def _name(base: str, digest: str, max_length: int = 28) -> str:
+    base = re.sub(r"[^A-Za-z0-9_?$]", "_", base).strip("_") or "CELL"
+    if max_length is not None:
+        base = base[: max_length - HASH_LENGTH - 1]
+    return f"{base}_{digest[:HASH_LENGTH]}"
+
+
+def _grid(values, scale: float) -> tuple:
+    return tuple(np.round(np.asarray(values) * scale).astype(np.int64).tolist())
+
+
+def is_hashed(name: str) -> bool:
+    """Returns True if name was assigned by factory_name() or
+    content_name()."""
+    return _hashed.fullmatch(name) is not None
+
+
+def factory_name(name: str, key: Hashable) -> str:
+    """Name of a factory cell.
+
+    Parameters:
+        name (str): name given to the cell by the factory, e.g.
+            TRANSISTOR(8,2,2,12,10); only the part before the parameters is
+            kept
+        key (Hashable): CellCache key of the call
+
+    Returns:
+        str: cell name followed by a hash of the factory and its arguments
+    """
+    if is_hashed(name):
+        name = name[: -HASH_LENGTH - 1]
+    # leave out the module name, which is __main__ when make_gds.py is run
+    # as a script
+    digest = hashlib.sha1(repr(key[1:]).encode()).hexdigest()
+    return _name(name.split("(")[0], digest)
+
+
+def content_digest(D: Device, names: Dict[int, str], scale: float = 1e3) -> str:
+    """Hash of the content of a cell: its polygons, labels and the names and
+    placements of the cells it references.
+
+    Parameters:
+        D (Device): the cell
+        names (dict): names of the cells referenced by D, by id
+        scale (float): user units per database unit; coordinates are hashed
+            as written, rounded to the database grid
+
+    Returns:
+        str: SHA-1 hex digest
+    """
+    h = hashlib.sha1()
+    for p in D.polygons:
+        for points, layer, datatype in zip(p.polygons, p.layers, p.datatypes):
+            h.update(repr((layer, datatype)).encode())
+            h.update(np.round(np.asarray(points) * scale).astype(np.int64).tobytes())
+    for l in D.labels:
+        h.update(
+            repr(
+                (
+                    l.text,
+                    _grid(l.position, scale),
+                    l.anchor,
+                    l.rotation,
+                    l.magnification,
+                    l.x_reflection,
+                    l.layer,
+                    l.texttype,
+                )
+            ).encode()
+        )
+    for r in D.references:
+        if isinstance(r, CellArray):
+            array = (r.columns, r.rows, _grid(r.spacing, scale))
+        else:
+            array = None
+        h.update(
+            repr(
+                (
+                    names[id(r.parent)],
+                    _grid(r.origin, scale),
+                    r.rotation,
+                    r.magnification,
+                    r.x_reflection,
+                    array,
+                )
+            ).encode()
+        )
+    return h.hexdigest()
+
+
+def content_name(
+    D: Device, names: Dict[int, str], scale: float = 1e3, max_length: int = 28
+) -> str:
+    """Name of a cell from its content.
+
+    Parameters:
+        D (Device): the cell
+        names (dict): names of the cells referenced by D, by id
+        scale (float): user units per database unit
+        max_length (int or None): maximum length of the name
+
+    Returns:
+        str: name of D (truncated) followed by a hash of its content
+    """
+    return _name(D.name, content_digest(D, names, scale), max_length)
+
+
+def hierarchy_names(
+    D: Device,
+    names: Dict[int, str],
+    known: Mapping[int, str] = None,
+    scale: float = 1e3,
+    max_length: int = 28,
+    digests: Dict[int, str] = None,
+) -> Dict[int, str]:
+    """Names of D and the cells it depends on: factory cells keep their
+    hashed names, other cells are named by content_name().
+
+    Parameters:
+        D (Device): the top cell of the hierarchy
+        names (dict): names by id, updated in place
+        known (dict or None): names of cells that were named before, by id;
+            these cells and their dependencies are not named again
+        scale (float): user units per database unit
+        max_length (int or None): maximum length of the names
+        digests (dict or None): if given, the content_digest() of each named
+            cell is added to it, by id
+
+    Returns:
+        dict: names
+    """
+    lookup = names if known is None else ChainMap(names, known)
+
+    def visit(cell):
+        if id(cell) in lookup:
+            return
+        for child in cell.get_dependencies():
+            visit(child)
+        if is_hashed(cell.name) and digests is None:
+            names[id(cell)] = cell.name
+            return
+        digest = content_digest(cell, lookup, scale)
+        if digests is not None:
+            digests[id(cell)] = digest
+        if is_hashed(cell.name):
+            names[id(cell)] = cell.name
+        else:
+            names[id(cell)] = _name(cell.name, digest, max_length)
+
+    visit(D)
+    return names
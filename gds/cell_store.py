@@ -0,0 +1,246 @@
+"""Persistent, content-addressed store of generated cells.
+
+Attached to a CellCache, the store lets a rebuild load every factory
+cell whose arguments (and the source of the factory and its helpers) are
+unchanged from disk and only regenerate the ones that changed. Cells are
+saved in the serialized form used by the parallel gridsweep, one file
+per cell, named by a hash of the factory and its arguments.
+"""
+
+import hashlib
+import inspect
+import os
+import pickle
+import sys
+from typing import Callable, Dict, Hashable, List, Optional
+
+import phidl
+from phidl import Device
+
+from parallel import deserialize_device, serialize_device
+
+# version of the serialized cell format (2: with Device.info)
+FORMAT = 2
+# installed packages whose source is part of the digest, like the modules
+# next to the factory
+TRACKED_PACKAGES = ("qnngds", "phidlfem")
+
+
+def _tracked(module, root: str) -> bool:
+    file = getattr(module, "__file__", None)
+    if not file:
+        return False
+    package = module.__name__.split(".")[0]
+    return package in TRACKED_PACKAGES or (
+        os.path.dirname(os.path.abspath(file)) == root
+    )
+
+
+def source_files(function: Callable) -> List[str]:
+    """Source files a factory depends on.
+
+    These are the file of the factory and of every module it reaches
+    through the globals of these files (imported modules, and the modules
+    of imported functions and classes), as far as the module is in the
+    directory of the factory or in TRACKED_PACKAGES.
+
+    Parameters:
+        function (Callable): the factory
+
+    Returns:
+        List[str]: sorted paths of the source files
+    """
+    filename = os.path.abspath(function.__code__.co_filename)
+    root = os.path.dirname(filename)
+    files = {filename}
+    seen = set()
+    namespaces = [function.__globals__]
+    while namespaces:
+        for value in list(namespaces.pop().values()):
+            if inspect.ismodule(value):
+                module = value
+            else:
+                module = sys.modules.get(getattr(value, "__module__", None) or "")
+            if module is None or module.__name__ in seen:
+                continue
+            seen.add(module.__name__)
+            if _tracked(module, root):
+                files.add(os.path.abspath(module.__file__))
+                namespaces.append(vars(module))
+    return sorted(files)
+
+
+class CellStore:
+    """On-disk cell store with a size-bounded LRU eviction policy.
+
+    The key includes the source files of the factory and of the helpers it
+    imports (see source_files()), so editing a factory, a sub-factory or a
+    helper module invalidates its cells.
+
+    Several processes (e.g. parallel_gridsweep workers) may use the same
+    directory at once, so a file can be evicted by another process at any
+    time; that counts as a miss or as already evicted.
+
+    Parameters:
+        path (str): directory holding the stored cells
+        max_bytes (int): total size of stored cells above which the least
+            recently used cells are deleted
+    """
+
+    def __init__(
+        self,
+        path: str = os.path.join(".layout_cache", "cells"),
+        max_bytes: int = 2**30,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._sources = {}
+        self._bytes = None
+        # loaded cells by content, so that subcells common to several stored
+        # cells (labels, pads) stay shared
+        self._shared = {}
+
+    def digest(self, key: Hashable, function: Callable) -> str:
+        """Returns the content address of a factory call.
+
+        Parameters:
+            key (Hashable): CellCache key of the call
+            function (Callable): the factory
+
+        Returns:
+            str: hex digest naming the stored cell
+        """
+        source = self._sources.get(function.__module__)
+        if source is None:
+            h = hashlib.sha1()
+            for filename in source_files(function):
+                with open(filename, "rb") as f:
+                    h.update(hashlib.sha1(f.read()).digest())
+            source = h.hexdigest()
+            self._sources[function.__module__] = source
+        # leave out the module and file names: the module is __main__ when
+        # make_gds.py is run as a script
+        h = hashlib.sha1()
+        h.update(repr((FORMAT, phidl.__version__, source, key[1:])).encode())
+        return h.hexdigest()
+
+    def _file(self, digest: str) -> str:
+        return os.path.join(self.path, digest[:2], digest + ".pkl")
+
+    def get(self, key: Hashable, function: Callable) -> Optional[Device]:
+        """Loads a stored cell.
+
+        Parameters:
+            key (Hashable): CellCache key of the call
+            function (Callable): the factory
+
+        Returns:
+            Device or None: the stored cell, or None if it is not in the store
+        """
+        filename = self._file(self.digest(key, function))
+        try:
+            with open(filename, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        # mark as recently used for eviction
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            # evicted by another process since it was read
+            pass
+        self.hits += 1
+        return deserialize_device(data, self._shared)
+
+    def put(self, key: Hashable, function: Callable, D: Device) -> None:
+        """Saves a newly generated cell and enforces the size bound.
+
+        Parameters:
+            key (Hashable): CellCache key of the call
+            function (Callable): the factory
+            D (Device): the generated cell
+        """
+        filename = self._file(self.digest(key, function))
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp = f"{filename}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(serialize_device(D), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, filename)
+        self.writes += 1
+        if self._bytes is None:
+            self._bytes = sum(size for _, size, _ in self._entries())
+        else:
+            try:
+                self._bytes += os.path.getsize(filename)
+            except FileNotFoundError:
+                pass
+        if self._bytes > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        entries = []
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".pkl"):
+                    filename = os.path.join(root, name)
+                    try:
+                        st = os.stat(filename)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, filename))
+        return entries
+
+    def evict(self) -> None:
+        """Deletes least recently used cells until the store fits in
+        max_bytes."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, filename in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._bytes = total
+
+    def clear(self) -> None:
+        """Deletes every stored cell."""
+        for _, _, filename in self._entries():
+            try:
+                os.remove(filename)
+            except FileNotFoundError:
+                pass
+        self._bytes = 0
+
+    def stats(self) -> Dict:
+        """Returns hit/miss/write/eviction counters and the store size."""
+        entries = self._entries()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "cells": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def report(self) -> str:
+        """Returns a one-line summary of stats()."""
+        s = self.stats()
+        lookups = s["hits"] + s["misses"]
+        rate = 100 * s["hits"] / lookups if lookups else 0
+        return (
+            f"cell store {self.path}: {s['hits']}/{lookups} hits ({rate:.0f}%), "
+            f"{s['writes']} written, {s['evictions']} evicted, "
+            f"{s['cells']} cells, {s['bytes'] / 2**20:.1f}/"
+            f"{s['max_bytes'] / 2**20:.1f} MiB"
+        )
@@ -0,0 +1,489 @@
+"""Connectivity extraction: checks that every probe pad of a test structure
+reaches the structure and that no two pads are shorted.
+
+Conductors connect where their polygons overlap or touch on the same layer,
+and through vias: a via polygon joins the polygons of the conductor layers
+below and above it that it overlaps (see default_stack()). The mesa (the
+ITO/IGZO under test) is not a conductor, so e.g. the source and drain pads
+of a transistor are separate nets. Polygons are merged into nets with
+union-find; candidate pairs come from the grid index of drc.py, and only
+non-rectangular candidates are intersected exactly.
+
+Extraction is hierarchical:
+    - each test structure (a cell whose name starts with one of STRUCTURES)
+      is flattened and extracted once, however often it is placed; its pads
+      are the pad stacks it places (cells whose name starts with PAD, see
+      make_gds.pad_stack)
+    - a pad is open if its net contains nothing but pad polygons, i.e. no
+      wire leaves the pad; pads of one structure on the same net are
+      shorted, except in SHORTED_CELLS (the metal resistors)
+    - the cells above the structures (sweeps, dies, the array) add no
+      connections of their own; they are only checked for conductors of
+      two placements (or of a placement and the cell itself) touching,
+      which would short structures to each other or to marks and labels.
+      Only placements whose bounding boxes overlap are compared, polygon
+      by polygon, in the overlap. Marks drawn on several layers on
+      purpose (STACKED_CELLS) may touch each other
+Faults found in a cell are reported at every placement of the cell.
+
+    python connectivity.py                # check the wafer array
+    python connectivity.py ito_test.gds   # check a written layout
+"""
+
+import time
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import gdspy
+import numpy as np
+from phidl import Device, LayerSet
+from phidl.device_layout import CellArray
+
+from drc import TOLERANCE, GridIndex, flatten
+
+# cells extracted as one test structure
+STRUCTURES = (
+    "TRANSISTOR",
+    "MOS_CAP",
+    "MIM_CAP",
+    "VDP",
+    "RESISTOR",
+    "TLM",
+    "VIA_TEST",
+)
+# cells that are probe pads
+PAD_CELLS = ("PAD",)
+# structures whose pads are connected by design
+SHORTED_CELLS = ("RESISTOR",)
+# marks stacked on several layers by design (alignment marks, corner squares)
+STACKED_CELLS = ("ALIGN", "CORNER")
+# grid of the exact polygon intersections, finer than TOLERANCE so that
+# polygons grown by TOLERANCE still overlap after snapping
+PRECISION = TOLERANCE / 10
+
+
+class Pad(NamedTuple):
+    """Center of a probe pad and the index of its net."""
+
+    x: float
+    y: float
+    net: int
+
+
+class StructureNets(NamedTuple):
+    """Nets of one test structure, in its coordinates.
+
+    open and shorted hold pad indices; each group in shorted is a set of
+    pads on the same net.
+    """
+
+    name: str
+    pads: Tuple[Pad, ...]
+    nets: int
+    open: Tuple[int, ...]
+    shorted: Tuple[Tuple[int, ...], ...]
+
+
+class Fault(NamedTuple):
+    """One connectivity fault.
+
+    kind is "open" (a pad connected to nothing), "short" (pads of one
+    structure on the same net) or "contact" (conductors of two placed
+    cells touching); pads are the centers of the pads involved.
+    """
+
+    kind: str
+    x: float
+    y: float
+    cells: Tuple[str, ...]
+    pads: Tuple[Tuple[float, float], ...]
+
+
+def default_stack() -> List[str]:
+    """Interconnect of the ITO/IGZO transistor process, from bottom to top.
+
+    Conductor layers alternate with the via layers joining them; a layer
+    connects to itself and to its neighbours in the list.
+
+    Returns:
+        List[str]: layer names
+    """
+    return ["gate", "via", "sourcedrain"]
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i: int, j: int) -> None:
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+    def roots(self) -> np.ndarray:
+        return np.array([self.find(i) for i in range(len(self.parent))], dtype=int)
+
+
+class _Polygons(NamedTuple):
+    """Conductor polygons with their stack level and bounding box; rect marks
+    axis-aligned rectangles."""
+
+    points: List[np.ndarray]
+    levels: np.ndarray
+    bboxes: np.ndarray
+    rect: np.ndarray
+    pad: np.ndarray
+
+
+def _polygons(
+    points: List[np.ndarray], levels: Sequence[int], pad: Sequence[bool]
+) -> _Polygons:
+    bboxes = np.array(
+        [np.concatenate((p.min(axis=0), p.max(axis=0))) for p in points]
+    ).reshape(-1, 4)
+    rect = np.array(
+        [
+            len(p) == 4
+            and np.all(
+                (np.abs(p - b[:2]) < TOLERANCE) | (np.abs(p - b[2:]) < TOLERANCE)
+            )
+            for p, b in zip(points, bboxes)
+        ],
+        dtype=bool,
+    )
+    return _Polygons(
+        points, np.asarray(levels, dtype=int), bboxes, rect, np.asarray(pad, bool)
+    )
+
+
+def _overlap(a: _Polygons, i: int, b: _Polygons, j: int, distance: float) -> bool:
+    """True if polygon i of a, grown by distance (shrunk if negative), and
+    polygon j of b, whose bounding boxes overlap, intersect."""
+    if a.rect[i] and b.rect[j]:
+        lo = np.maximum(a.bboxes[i, :2], b.bboxes[j, :2])
+        hi = np.minimum(a.bboxes[i, 2:], b.bboxes[j, 2:])
+        return bool(np.all(hi - lo > -distance))
+    grown = gdspy.offset([a.points[i]], distance, join="miter", precision=PRECISION)
+    if grown is None:
+        return False
+    return gdspy.boolean(grown, [b.points[j]], "and", precision=PRECISION) is not None
+
+
+def _touch(a: _Polygons, i: int, b: _Polygons, j: int) -> bool:
+    """True if polygon i of a and polygon j of b, whose bounding boxes overlap,
+    are connected."""
+    if abs(a.levels[i] - b.levels[j]) > 1:
+        return False
+    return _overlap(a, i, b, j, TOLERANCE)
+
+
+def _index(bboxes: np.ndarray) -> GridIndex:
+    size = np.max(bboxes[:, 2:] - bboxes[:, :2], axis=1)
+    return GridIndex(bboxes, max(float(np.median(size)), 1.0))
+
+
+def _placements(ref) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Linear part and translation of every instance placed by ref (gdspy
+    conventions: reflection, magnification, rotation; array lattice
+    offsets are added before the rotation and are not magnified)."""
+    theta = np.radians(ref.rotation or 0)
+    c, s = np.cos(theta), np.sin(theta)
+    R = np.array([[c, -s], [s, c]])
+    if ref.x_reflection:
+        R = R @ np.diag([1.0, -1.0])
+    M = R * (ref.magnification or 1)
+    origin = np.asarray(ref.origin, dtype=float)
+    if isinstance(ref, CellArray):
+        return [
+            (M, R @ (ref.spacing[0] * col, ref.spacing[1] * row) + origin)
+            for col in range(ref.columns)
+            for row in range(ref.rows)
+        ]
+    return [(M, origin)]
+
+
+def _box(bbox: np.ndarray, M: np.ndarray, t: np.ndarray) -> np.ndarray:
+    """Bounding box (xmin, ymin, xmax, ymax) of bbox mapped by M, t."""
+    corners = bbox[[0, 1, 2, 1, 2, 3, 0, 3]].reshape(4, 2) @ M.T + t
+    return np.concatenate((corners.min(axis=0), corners.max(axis=0)))
+
+
+def extract(
+    D: Device,
+    levels: Dict[int, int],
+    pad_cells: Sequence[str] = PAD_CELLS,
+    shorted_cells: Sequence[str] = SHORTED_CELLS,
+) -> StructureNets:
+    """Extracts the nets of one test structure.
+
+    Parameters:
+        D (Device): the structure
+        levels (dict): position in the stack (see default_stack()) of each
+            conductor and via GDS layer
+        pad_cells (Sequence[str]): polygons drawn in cells whose name starts
+            with one of these prefixes are pads; pad polygons overlapping by
+            more than TOLERANCE (a pad stack) form one pad
+        shorted_cells (Sequence[str]): structures whose pads may share a
+            net
+
+    Returns:
+        StructureNets: pads and faults of D
+    """
+    flat = flatten(D)
+    ids = np.nonzero(np.isin(flat.layers, list(levels)))[0]
+    pad_names = [k for k, n in enumerate(flat.names) if n.startswith(tuple(pad_cells))]
+    P = _polygons(
+        [flat.polygon(i) for i in ids],
+        [levels[l] for l in flat.layers[ids]],
+        np.isin(flat.cells[ids], pad_names),
+    )
+    nets = _UnionFind(len(ids))
+    stacks = _UnionFind(len(ids))
+    if len(ids):
+        index = _index(P.bboxes)
+        for i, box in enumerate(P.bboxes):
+            for j in index.query(box):
+                if j <= i:
+                    continue
+                if P.pad[i] and P.pad[j] and _overlap(P, i, P, j, -TOLERANCE):
+                    stacks.union(i, j)
+                if _touch(P, i, P, j):
+                    nets.union(i, j)
+    roots = nets.roots()
+    # renumber the nets in order of their first polygon
+    _, net = np.unique(roots, return_inverse=True)
+    wires = np.bincount(net, weights=~P.pad, minlength=net.max(initial=-1) + 1)
+
+    pads = []
+    stack = stacks.roots()
+    for root in np.unique(stack[P.pad]):
+        members = np.nonzero((stack == root) & P.pad)[0]
+        b = P.bboxes[members]
+        center = (b[:, :2].min(axis=0) + b[:, 2:].max(axis=0)) / 2
+        # the probe lands on the top layer of the stack
+        top = members[np.argmax(P.levels[members])]
+        pads.append(Pad(float(center[0]), float(center[1]), int(net[top])))
+    pads.sort(key=lambda p: (-round(p.y, 3), round(p.x, 3)))
+
+    open_pads = tuple(k for k, p in enumerate(pads) if wires[p.net] == 0)
+    groups = {}
+    for k, p in enumerate(pads):
+        groups.setdefault(p.net, []).append(k)
+    shorted = ()
+    if not D.name.startswith(tuple(shorted_cells)):
+        shorted = tuple(tuple(g) for g in groups.values() if len(g) > 1)
+    return StructureNets(D.name, tuple(pads), len(wires), open_pads, shorted)
+
+
+def _first_contact(a: _Polygons, b: _Polygons) -> np.ndarray:
+    """Center of the overlap of the first connected pair of polygons of a and
+    b, or None."""
+    if not len(a.points) or not len(b.points):
+        return None
+    index = _index(b.bboxes)
+    for i, box in enumerate(a.bboxes):
+        for j in index.query(box):
+            if _touch(a, i, b, j):
+                lo = np.maximum(box[:2], b.bboxes[j, :2])
+                hi = np.minimum(box[2:], b.bboxes[j, 2:])
+                return (lo + hi) / 2
+    return None
+
+
+def check(
+    D: Device,
+    layer_set: LayerSet,
+    stack: Sequence[str] = None,
+    structures: Sequence[str] = STRUCTURES,
+    pad_cells: Sequence[str] = PAD_CELLS,
+    shorted_cells: Sequence[str] = SHORTED_CELLS,
+    stacked_cells: Sequence[str] = STACKED_CELLS,
+) -> List[Fault]:
+    """Checks the connectivity of every test structure placed in D.
+
+    Parameters:
+        D (Device): layout to check
+        layer_set (LayerSet): maps the layer names of the stack to GDS
+            layers
+        stack (Sequence[str]): interconnect layers from bottom to top,
+            defaults to default_stack()
+        structures (Sequence[str]): cells whose name starts with one of
+            these prefixes are extracted as one test structure
+        pad_cells (Sequence[str]): cells whose name starts with one of these
+            prefixes are probe pads
+        shorted_cells (Sequence[str]): structures whose pads may share a
+            net
+        stacked_cells (Sequence[str]): placements of cells whose name starts
+            with one of these prefixes may touch each other and are not
+            checked inside
+
+    Returns:
+        List[Fault]: faults sorted by kind and position
+    """
+    if stack is None:
+        stack = default_stack()
+    levels = {layer_set[name].gds_layer: k for k, name in enumerate(stack)}
+    flats = {}
+    memo = {}
+
+    def conductors(cell) -> _Polygons:
+        """Conductor polygons of cell, flattened once."""
+        if id(cell) not in flats:
+            flat = flatten(cell)
+            ids = np.nonzero(np.isin(flat.layers, list(levels)))[0]
+            flats[id(cell)] = _polygons(
+                [flat.polygon(i) for i in ids],
+                [levels[l] for l in flat.layers[ids]],
+                np.zeros(len(ids), bool),
+            )
+        return flats[id(cell)]
+
+    def window(cell, M, t, box) -> _Polygons:
+        """Conductor polygons of cell placed by M, t that overlap box."""
+        P = conductors(cell)
+        inverse = np.linalg.inv(M)
+        local = _box(box, inverse, -inverse @ t)
+        hit = np.nonzero(
+            (P.bboxes[:, 0] <= local[2])
+            & (P.bboxes[:, 2] >= local[0])
+            & (P.bboxes[:, 1] <= local[3])
+            & (P.bboxes[:, 3] >= local[1])
+        )[0]
+        return _polygons(
+            [P.points[i] @ M.T + t for i in hit], P.levels[hit], P.pad[hit]
+        )
+
+    def contacts(cell) -> List[Fault]:
+        """Conductors of the placements in cell touching each other or the
+        polygons of cell itself."""
+        own = [
+            (points, layer)
+            for p in cell.polygons
+            for points, layer in zip(p.polygons, p.layers)
+            if layer in levels
+        ]
+        own = _polygons(
+            [points for points, _ in own],
+            [levels[l] for _, l in own],
+            np.zeros(len(own), bool),
+        )
+        placed = []
+        for ref in cell.references:
+            bb = ref.parent.bbox
+            if bb is None:
+                continue
+            for M, t in _placements(ref):
+                placed.append((ref.parent, M, t, _box(np.ravel(bb), M, t)))
+        if not placed:
+            return []
+        boxes = np.vstack([own.bboxes] + [[box for *_, box in placed]])
+        index = _index(boxes)
+        n = len(own.points)
+        found = []
+        for k, (child, M, t, box) in enumerate(placed):
+            for h in index.query(box):
+                # each pair of placements once
+                if n <= h <= n + k:
+                    continue
+                other = boxes[h]
+                overlap = np.concatenate(
+                    (np.maximum(box[:2], other[:2]), np.minimum(box[2:], other[2:]))
+                )
+                overlap += (-TOLERANCE, -TOLERANCE, TOLERANCE, TOLERANCE)
+                a = window(child, M, t, overlap)
+                if h < n:
+                    b = _polygons([own.points[h]], own.levels[[h]], [False])
+                    names = (child.name, cell.name)
+                else:
+                    other_child, M2, t2, _ = placed[h - n]
+                    names = (child.name, other_child.name)
+                    if all(name.startswith(tuple(stacked_cells)) for name in names):
+                        continue
+                    b = window(other_child, M2, t2, overlap)
+                point = _first_contact(a, b)
+                if point is not None:
+                    found.append(
+                        Fault("contact", float(point[0]), float(point[1]), names, ())
+                    )
+        return found
+
+    def faults(cell) -> List[Fault]:
+        """Faults of cell, in its coordinates."""
+        if id(cell) in memo:
+            return memo[id(cell)]
+        if cell.name.startswith(tuple(stacked_cells)):
+            found = []
+        elif cell.name.startswith(tuple(structures)):
+            nets = extract(cell, levels, pad_cells, shorted_cells)
+            found = [
+                Fault("open", p.x, p.y, (cell.name,), ((p.x, p.y),))
+                for p in (nets.pads[k] for k in nets.open)
+            ]
+            for group in nets.shorted:
+                pads = tuple((nets.pads[k].x, nets.pads[k].y) for k in group)
+                found.append(Fault("short", *pads[0], (cell.name,), pads))
+        else:
+            found = contacts(cell)
+            for ref in cell.references:
+                sub = faults(ref.parent)
+                if not sub:
+                    continue
+                for M, t in _placements(ref):
+                    for f in sub:
+                        x, y = M @ (f.x, f.y) + t
+                        pads = tuple(tuple((M @ p + t).tolist()) for p in f.pads)
+                        found.append(f._replace(x=float(x), y=float(y), pads=pads))
+        memo[id(cell)] = found
+        return found
+
+    return sorted(faults(D), key=lambda f: (f.kind, f.y, f.x))
+
+
+def report(faults: Sequence[Fault]) -> str:
+    """Formats faults, one per line, with a per-cell summary.
+
+    Parameters:
+        faults (Sequence[Fault]): result of check()
+
+    Returns:
+        str: the report
+    """
+    counts = {}
+    lines = []
+    for f in faults:
+        key = f"{f.kind} {' / '.join(f.cells)}"
+        counts[key] = counts.get(key, 0) + 1
+        pads = "  ".join(f"({x:.1f}, {y:.1f})" for x, y in f.pads)
+        lines.append(f"{f.kind:8s} ({f.x:10.3f}, {f.y:10.3f})  {pads}")
+    lines.append(f"{len(faults)} faults")
+    lines += [f"  {k}: {n}" for k, n in sorted(counts.items())]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import phidl.geometry as pg
+
+    import make_gds
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("gds", nargs="?", help="layout to check (default: build)")
+    args = parser.parse_args()
+
+    ls = make_gds.default_layer_set()
+    if args.gds:
+        D = pg.import_gds(args.gds, flatten=False)
+    else:
+        D = make_gds.wafer_array(ls)
+    t = time.perf_counter()
+    faults = check(D, ls)
+    print(report(faults))
+    print(f"checked in {time.perf_counter() - t:.1f}s")
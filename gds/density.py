@@ -0,0 +1,392 @@
+"""Per-layer pattern density and dummy fill.
+
+density() flattens a layout (drc.flatten) and accumulates the area of every
+polygon into a grid of tiles without rasterizing: by Green's theorem the
+area of a polygon left of x = X within a row of tiles is the integral of
+min(x, X) dy along its edges, so after splitting the edges at the tile
+boundaries each piece adds its exact partial area to the tile it lies in
+and a full tile width to every tile left of it (a cumulative sum). Only
+edges with a vertical extent contribute, so Manhattan layouts cost little
+more than their vertical edges. Polygons of a layer whose bounding boxes
+overlap are first merged (manhattan.boolean "or", per group of
+overlapping polygons), so that overlaps are counted once.
+
+fill() adds dummy squares to tiles below a target density, on a lattice
+aligned to the origin (so the squares become AREFs), keeping a distance
+from existing geometry on every layer and out of keep-out boxes.
+
+    python density.py                    # density of the wafer array
+    python density.py --fill fill.gds    # and dummy fill for test_chip()
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from phidl import Device
+
+import manhattan
+from arrays import place_array
+from drc import FlatLayout, _gather, flatten
+from rects import rectangles
+
+
+class DensityMap(NamedTuple):
+    """Density of each layer per tile: maps[layer][j, i] is the covered
+    fraction of the tile whose lower left corner is
+    origin + (i, j) * tile_size."""
+
+    origin: Tuple[float, float]
+    tile_size: float
+    maps: Dict[int, np.ndarray]
+
+
+def _grid_bounds(
+    flat: FlatLayout, tile_size: float
+) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """Origin (on the tile lattice) and shape of the tile grid over flat."""
+    if len(flat.bboxes) == 0:
+        return np.zeros(2), (0, 0)
+    lo = np.floor(flat.bboxes[:, :2].min(axis=0) / tile_size) * tile_size
+    hi = np.ceil(flat.bboxes[:, 2:].max(axis=0) / tile_size) * tile_size
+    nx, ny = np.maximum(np.round((hi - lo) / tile_size).astype(int), 1)
+    return lo, (int(ny), int(nx))
+
+
+def _crossings(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Edge index and parameter of each crossing of the edges a -> b (in tile
+    units, one coordinate) with the integer grid lines strictly between their
+    ends."""
+    lo, hi = np.minimum(a, b), np.maximum(a, b)
+    count = np.maximum(np.ceil(hi) - np.floor(lo) - 1, 0).astype(int)
+    edges = np.repeat(np.arange(len(a)), count)
+    k = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    lines = np.floor(lo)[edges] + 1 + k
+    return edges, (lines - a[edges]) / (b[edges] - a[edges])
+
+
+def _overlapping(boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Index pairs i < j of the boxes (xmin, ymin, xmax, ymax) whose interiors
+    overlap.
+
+    Each box is entered in the grid of cell size base * 4**level of the
+    smallest level at least as large as the box, where it spans at most
+    2 x 2 cells, and looked up in the grids of its own and every larger
+    level.
+    """
+    n = len(boxes)
+    if n < 2:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    size = np.max(boxes[:, 2:] - boxes[:, :2], axis=1)
+    base = max(float(np.median(size)), 1e-3)
+    level = np.ceil(np.log(np.maximum(size, base) / base) / np.log(4)).astype(int)
+    # against rounding in the logarithm
+    level += size > base * 4.0**level
+    first, second = [], []
+    for L in np.unique(level):
+        cell = base * 4.0**L
+
+        def entries(ids):
+            lo = np.floor(boxes[ids, :2] / cell).astype(np.int64)
+            hi = np.floor(boxes[ids, 2:] / cell).astype(np.int64)
+            keys, owners = [], []
+            for dx in (0, 1):
+                for dy in (0, 1):
+                    x, y = lo[:, 0] + dx, lo[:, 1] + dy
+                    inside = (x <= hi[:, 0]) & (y <= hi[:, 1])
+                    keys.append(((x << 32) + y)[inside])
+                    owners.append(ids[inside])
+            return np.concatenate(keys), np.concatenate(owners)
+
+        keys, owners = entries(np.flatnonzero(level == L))
+        order = np.argsort(keys, kind="stable")
+        keys, owners = keys[order], owners[order]
+        queries, askers = entries(np.flatnonzero(level <= L))
+        lo = np.searchsorted(keys, queries, "left")
+        counts = np.searchsorted(keys, queries, "right") - lo
+        offsets = np.cumsum(counts) - counts
+        k = np.arange(counts.sum()) - np.repeat(offsets, counts)
+        first.append(np.repeat(askers, counts))
+        second.append(owners[np.repeat(lo, counts) + k])
+    i, j = np.concatenate(first), np.concatenate(second)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    a, b = boxes[i], boxes[j]
+    overlap = (np.minimum(a[:, 2], b[:, 2]) > np.maximum(a[:, 0], b[:, 0])) & (
+        np.minimum(a[:, 3], b[:, 3]) > np.maximum(a[:, 1], b[:, 1])
+    )
+    pairs = np.unique((i * n + j)[overlap & (i != j)])
+    return pairs // n, pairs % n
+
+
+def _groups(n: int, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+    """Label (the smallest member) of the connected group of each of n items
+    joined by the pairs i, j."""
+    labels = np.arange(n)
+    while True:
+        a, b = labels[i], labels[j]
+        if np.array_equal(a, b):
+            return labels
+        low = np.minimum(a, b)
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+
+
+def _merged(flat: FlatLayout, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vertices and lengths of polygons ids, with the groups of polygons whose
+    bounding boxes overlap replaced by their union."""
+    i, j = _overlapping(flat.bboxes[ids])
+    grouped = np.zeros(len(ids), dtype=bool)
+    grouped[i] = grouped[j] = True
+    vertices, lengths = _gather(flat, ids[~grouped])
+    points, counts = [flat.points[vertices]], [lengths]
+    labels = _groups(len(ids), i, j)[grouped]
+    members = ids[grouped][np.argsort(labels, kind="stable")]
+    starts = np.flatnonzero(np.diff(np.sort(labels), prepend=-1))
+    for group in np.split(members, starts[1:]) if len(members) else ():
+        union = manhattan.boolean(
+            [flat.polygon(k) for k in group], None, "or", precision=1e-6
+        )
+        if union is not None:
+            points += union.polygons
+            counts.append([len(p) for p in union.polygons])
+    return np.concatenate(points).reshape(-1, 2), np.concatenate(counts).astype(int)
+
+
+def _layer_density(
+    flat: FlatLayout, ids: np.ndarray, origin: np.ndarray, tile_size: float, shape
+) -> np.ndarray:
+    """Density of the union of polygons ids on the tile grid."""
+    ny, nx = shape
+    points, lengths = _merged(flat, ids)
+    if len(points) == 0:
+        return np.zeros(shape)
+    p = (points - origin) / tile_size
+    starts = np.cumsum(lengths) - lengths
+    nxt = np.arange(len(p)) + 1
+    nxt[starts + lengths - 1] = starts
+    q = p[nxt]
+    # orient every polygon counterclockwise
+    cross = p[:, 0] * q[:, 1] - q[:, 0] * p[:, 1]
+    sign = np.sign(np.add.reduceat(cross, starts))
+    sign = np.repeat(sign, lengths)
+    keep = p[:, 1] != q[:, 1]
+    p, q, sign = p[keep], q[keep], sign[keep]
+
+    # split the edges at the tile boundaries
+    ex, tx = _crossings(p[:, 0], q[:, 0])
+    ey, ty = _crossings(p[:, 1], q[:, 1])
+    n = np.arange(len(p))
+    edges = np.concatenate((n, n, ex, ey))
+    params = np.concatenate((np.zeros(len(p)), np.ones(len(p)), tx, ty))
+    order = np.lexsort((params, edges))
+    edges, params = edges[order], params[order]
+    same = edges[1:] == edges[:-1]
+    e, t0, t1 = edges[:-1][same], params[:-1][same], params[1:][same]
+    d = q[e] - p[e]
+    a = p[e] + t0[:, None] * d
+    b = p[e] + t1[:, None] * d
+    mid = (a + b) / 2
+    dy = (b[:, 1] - a[:, 1]) * sign[e]
+    i = np.clip(np.floor(mid[:, 0]).astype(int), 0, nx)
+    j = np.clip(np.floor(mid[:, 1]).astype(int), 0, ny - 1)
+    cell = j * (nx + 1) + i
+    # partial area in the tile of the piece, and a full tile width in every
+    # tile to its left
+    partial = np.bincount(cell, (mid[:, 0] - i) * dy, minlength=ny * (nx + 1))
+    full = np.bincount(cell, dy, minlength=ny * (nx + 1))
+    partial = partial.reshape(ny, nx + 1)
+    full = full.reshape(ny, nx + 1)
+    left = np.cumsum(full[:, ::-1], axis=1)[:, ::-1] - full
+    return np.clip((partial + left)[:, :nx], 0, 1)
+
+
+def density(
+    D: Device,
+    layers: Sequence[int] = None,
+    tile_size: float = 200,
+    flat: Optional[FlatLayout] = None,
+) -> DensityMap:
+    """Computes the pattern density of each layer of D.
+
+    Parameters:
+        D (Device): layout
+        layers (Sequence[int]): GDS layers, defaults to every layer of D
+        tile_size (float): tile pitch
+        flat (FlatLayout): D already flattened, to avoid doing it again
+
+    Returns:
+        DensityMap: density per layer and tile
+    """
+    if flat is None:
+        flat = flatten(D)
+    if layers is None:
+        layers = sorted(set(flat.layers.tolist()))
+    origin, shape = _grid_bounds(flat, tile_size)
+    maps = {
+        layer: _layer_density(
+            flat, np.flatnonzero(flat.layers == layer), origin, tile_size, shape
+        )
+        for layer in layers
+    }
+    return DensityMap(tuple(origin), tile_size, maps)
+
+
+def _blocked(
+    boxes: np.ndarray, origin: np.ndarray, pitch: float, shape, margin: float
+) -> np.ndarray:
+    """Lattice points (origin + (i, j) * pitch) within margin of any box."""
+    ny, nx = shape
+    lo = np.ceil((boxes[:, :2] - margin - origin) / pitch).astype(int)
+    hi = np.floor((boxes[:, 2:] + margin - origin) / pitch).astype(int) + 1
+    lo = np.clip(lo, 0, (nx, ny))
+    hi = np.clip(hi, 0, (nx, ny))
+    keep = np.all(hi > lo, axis=1)
+    lo, hi = lo[keep], hi[keep]
+    diff = np.zeros((ny + 1, nx + 1), dtype=np.int32)
+    np.add.at(diff, (lo[:, 1], lo[:, 0]), 1)
+    np.add.at(diff, (lo[:, 1], hi[:, 0]), -1)
+    np.add.at(diff, (hi[:, 1], lo[:, 0]), -1)
+    np.add.at(diff, (hi[:, 1], hi[:, 0]), 1)
+    return np.cumsum(np.cumsum(diff, axis=0), axis=1)[:ny, :nx] > 0
+
+
+def fill(
+    D: Device,
+    layers: Sequence[int],
+    target: float = 0.2,
+    tile_size: float = 200,
+    size: float = 10,
+    pitch: float = 20,
+    keepout: float = 10,
+    keepouts: Sequence[Sequence[float]] = (),
+) -> Device:
+    """Generates dummy squares that raise every tile of layers to the target
+    density where there is room.
+
+    Parameters:
+        D (Device): layout to fill
+        layers (Sequence[int]): GDS layers to fill; a lattice site is used
+            for at most one layer
+        target (float or dict): density to reach, or target per layer
+        tile_size (float): tile pitch of the density map
+        size (float): side of the dummy squares
+        pitch (float): pitch of the fill lattice, a divisor of tile_size
+        keepout (float): minimum distance from the squares to existing
+            geometry on any layer
+        keepouts (Sequence[array-like[4]]): further xmin, ymin, xmax, ymax
+            boxes to keep free (e.g. the die label)
+
+    Returns:
+        Device: the fill, in the coordinates of D, to be placed at the origin
+    """
+    flat = flatten(D)
+    dmap = density(D, layers, tile_size, flat=flat)
+    origin = np.asarray(dmap.origin)
+    ny, nx = next(iter(dmap.maps.values())).shape if dmap.maps else (0, 0)
+    per_tile = int(round(tile_size / pitch))
+    shape = (ny * per_tile, nx * per_tile)
+    # lattice sites are the centers of the squares
+    start = origin + pitch / 2
+    boxes = flat.bboxes
+    if len(keepouts):
+        boxes = np.vstack((boxes, np.asarray(keepouts, dtype=float).reshape(-1, 4)))
+    free = ~_blocked(boxes, start, pitch, shape, keepout + size / 2)
+    FILL = Device("FILL")
+    if not isinstance(target, dict):
+        target = {layer: target for layer in layers}
+    for layer in layers:
+        deficit = np.clip(target[layer] - dmap.maps[layer], 0, None)
+        needed = np.ceil(deficit * tile_size**2 / size**2).astype(int)
+        jj, ii = np.nonzero(free)
+        tile = (jj // per_tile) * nx + ii // per_tile
+        # spread the squares evenly over the free sites of each tile
+        order = np.argsort(tile, kind="stable")
+        jj, ii, tile = jj[order], ii[order], tile[order]
+        counts = np.bincount(tile, minlength=ny * nx)
+        rank = np.arange(len(tile)) - np.repeat(np.cumsum(counts) - counts, counts)
+        n = needed.ravel()[tile]
+        m = counts[tile]
+        take = np.floor((rank + 1) * n / m) > np.floor(rank * n / m)
+        if not np.any(take):
+            continue
+        positions = start + np.column_stack((ii[take], jj[take])) * pitch
+        free[jj[take], ii[take]] = False
+        square = rectangles(
+            [(-size / 2, -size / 2, size / 2, size / 2, layer)], name=f"FILL({layer})"
+        )
+        place_array(FILL, square, positions)
+    return FILL
+
+
+def summary(dmap: DensityMap, names: Dict[int, str] = None) -> List[str]:
+    """Formats min/mean/max density per layer.
+
+    Parameters:
+        dmap (DensityMap): result of density()
+        names (dict): layer names by GDS layer
+
+    Returns:
+        List[str]: one line per layer
+    """
+    names = names or {}
+    return [
+        f"{names.get(layer, layer)!s:12s} min {m.min():6.1%}  mean {m.mean():6.1%}  "
+        f"max {m.max():6.1%}  ({m.shape[1]} x {m.shape[0]} tiles of "
+        f"{dmap.tile_size:g} um)"
+        for layer, m in dmap.maps.items()
+    ]
+
+
+def density_image(m: np.ndarray) -> np.ndarray:
+    """Grayscale RGB image of a density map (black = empty), top row first, for
+    preview.write_png()."""
+    gray = np.round(np.clip(m, 0, 1)[::-1] * 255).astype(np.uint8)
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import make_gds
+    from preview import write_png
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-t", "--tile-size", type=float, default=200)
+    parser.add_argument("--png", help="write density maps to PNG_<layer>.png")
+    parser.add_argument("--fill", help="write test_chip() with dummy fill")
+    parser.add_argument("--target", type=float, default=0.2)
+    args = parser.parse_args()
+
+    ls = make_gds.default_layer_set()
+    names = {l.gds_layer: name for name, l in ls._layers.items()}
+    A = make_gds.wafer_array(ls)
+    t = time.perf_counter()
+    dmap = density(A, list(names), args.tile_size)
+    print(f"wafer array density in {time.perf_counter() - t:.1f}s")
+    print("\n".join(summary(dmap, names)))
+    if args.png:
+        for layer, m in dmap.maps.items():
+            write_png(f"{args.png}_{names[layer]}.png", density_image(m))
+    if args.fill:
+        T = make_gds.test_chip(True, ls)
+        label = T.info["die_label"]
+        size = make_gds.die_label_size(ls)
+        t = time.perf_counter()
+        F = fill(
+            T,
+            [ls[name].gds_layer for name in ("gate", "sourcedrain", "mesa")],
+            target=args.target,
+            tile_size=args.tile_size,
+            keepouts=[(label[0], label[1], label[0] + size[0], label[1] + size[1])],
+        )
+        print(f"test_chip fill in {time.perf_counter() - t:.1f}s")
+        FILLED = Device("filled")
+        FILLED << T
+        FILLED << F
+        print("\n".join(summary(density(FILLED, list(names), args.tile_size), names)))
+        FILLED.write_gds(args.fill, cellname="top", auto_rename=True)
@@ -0,0 +1,683 @@
+"""Design-rule checks driven by a per-layer rule table.
+
+The layout is flattened into NumPy arrays (every polygon keeps the name of
+the cell it was drawn in), the polygon bounding boxes are put into a
+uniform grid index, and the die is cut into tiles. Each tile is checked on
+its own, with a halo wide enough for the largest rule, so tiles can be
+farmed out to a process pool. Tiles with identical content (the same die
+repeated across the array) are checked only once.
+
+Checks are morphological, on the merged geometry of each layer:
+    width: parts of a layer that disappear when it is shrunk and regrown by
+        half the minimum width
+    spacing: gaps and notches that close when a layer is grown and shrunk by
+        half the minimum spacing
+    enclosure: parts of the inner layer, grown by the enclosure, that are
+        not covered by the outer layer
+Offsets use mitered corners, so corner-to-corner separations are checked
+conservatively (as if the corners were square). Lithography test structures
+and text are below the rules on purpose and are skipped (WAIVED_CELLS).
+
+The dies of the wafer array are checked with the rules of their own
+cover_bottom option; for a written layout it is read from the metadata
+sidecar of the build (ito_test.npz next to ito_test.gds), or given per die
+cell with --cover.
+
+    python drc.py                           # check the wafer array
+    python drc.py ito_test.gds              # check a written layout
+    python drc.py --no-cover ito_test.gds   # without the via cover rule
+    python drc.py --cover CHIP=false x.gds  # dies placed as CHIP without it
+"""
+
+import hashlib
+import multiprocessing
+import os
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from phidl import Device, LayerSet
+from phidl.device_layout import CellArray
+
+import manhattan
+
+# geometry closer than this (in microns) to a rule limit passes
+TOLERANCE = 1e-3
+# cells that are below the design rules by design (lithography tests, text)
+WAIVED_CELLS = (
+    "VERNIER",
+    "RESOLUTION TEST",
+    # as written under hashed names (see cell_names.py)
+    "RESOLUTION_TEST",
+    "LABEL",
+    "TEXT",
+    "ALIGN",
+    "CROSS",
+    "CORNER",
+    "STEPS",
+)
+
+
+class LayerRules(NamedTuple):
+    """Minimum width and spacing of one layer (0 disables a check)."""
+
+    width: float = 0
+    spacing: float = 0
+
+
+class Enclosure(NamedTuple):
+    """The outer layer must extend at least distance beyond the inner layer,
+    except in cells whose name starts with one of waived."""
+
+    outer: str
+    inner: str
+    distance: float
+    waived: Tuple[str, ...] = ()
+
+
+class Violation(NamedTuple):
+    """One violation region."""
+
+    rule: str
+    layer: str
+    x: float
+    y: float
+    bbox: Tuple[float, float, float, float]
+    cells: Tuple[str, ...]
+
+
+def default_rules(
+    cover_bottom: bool = True,
+) -> Tuple[Dict[str, LayerRules], List[Enclosure]]:
+    """Rule table of the ITO/IGZO transistor process.
+
+    Parameters:
+        cover_bottom (bool): if True, require gate-level vias to be covered
+            by sourcedrain (the cover_bottom option of the factories)
+
+    Returns:
+        tuple: per-layer rules and enclosure rules
+    """
+    layers = {
+        "gate": LayerRules(width=1, spacing=1),
+        "via": LayerRules(width=2, spacing=2),
+        "sourcedrain": LayerRules(width=1, spacing=1),
+        "mesa": LayerRules(width=1, spacing=1),
+    }
+    enclosures = [Enclosure("gate", "via", 0)]
+    if cover_bottom:
+        # the vias over bottom-contact TLM fingers open the contact to the
+        # semiconductor and must not be covered
+        enclosures.append(Enclosure("sourcedrain", "via", 1, waived=("TLM",)))
+    return layers, enclosures
+
+
+def die_cover_bottom(D: Device, columns: Dict[str, np.ndarray]) -> Dict[str, bool]:
+    """The cover_bottom option of the cells placed in D (the dies of the wafer
+    array), recovered from the device metadata of the build for layouts read
+    back from a file, where Device.info is lost.
+
+    Every structure whose factory takes cover_bottom and whose center is
+    inside an instance of a cell votes for that cell.
+
+    Parameters:
+        D (Device): layout, e.g. the imported wafer array
+        columns (dict): device metadata of D (see metadata.py)
+
+    Returns:
+        dict: cell name to cover_bottom, for the cells with such structures
+
+    Raises:
+        ValueError: if the structures of a cell disagree
+    """
+    # connectivity imports this module
+    from connectivity import _box, _placements
+
+    if "cover_bottom" not in columns:
+        return {}
+    cover = np.asarray(columns["cover_bottom"], dtype=float)
+    known = ~np.isnan(cover)
+    centers = np.column_stack((columns["x"], columns["y"]))[known]
+    cover = cover[known] != 0
+    votes = {}
+    for ref in D.references:
+        cell = ref.parent
+        for M, t in _placements(ref):
+            box = _box(np.ravel(cell.bbox), M, t)
+            inside = np.all((centers >= box[:2]) & (centers <= box[2:]), axis=1)
+            votes.setdefault(cell.name, set()).update(cover[inside].tolist())
+    found = {}
+    for name, values in votes.items():
+        if len(values) > 1:
+            raise ValueError(f"the structures of {name} disagree on cover_bottom")
+        if values:
+            found[name] = values.pop()
+    return found
+
+
+class FlatLayout(NamedTuple):
+    """Flattened polygons: polygon i has vertices
+    points[offsets[i]:offsets[i + 1]]."""
+
+    points: np.ndarray
+    offsets: np.ndarray
+    layers: np.ndarray
+    datatypes: np.ndarray
+    cells: np.ndarray
+    names: List[str]
+    bboxes: np.ndarray
+
+    def polygon(self, i: int) -> np.ndarray:
+        return self.points[self.offsets[i] : self.offsets[i + 1]]
+
+
+def _transform(
+    points: np.ndarray,
+    origin: Sequence[float],
+    rotation: Optional[float] = None,
+    magnification: Optional[float] = None,
+    x_reflection: bool = False,
+) -> np.ndarray:
+    """Applies a reference transformation (gdspy conventions) to points."""
+    if x_reflection:
+        points = points * (1, -1)
+    if magnification is not None:
+        points = points * magnification
+    if rotation:
+        c = np.cos(np.radians(rotation))
+        s = np.sin(np.radians(rotation))
+        points = points @ np.array([[c, s], [-s, c]])
+    return points + np.asarray(origin, dtype=float)
+
+
+def flatten(D: Device) -> FlatLayout:
+    """Flattens a Device hierarchy into arrays.
+
+    Each unique cell is flattened once and its instances are produced by
+    transforming the whole vertex array at once.
+
+    Parameters:
+        D (Device): top-level device
+
+    Returns:
+        FlatLayout: polygons of D with their layers and owning cell names
+    """
+    names = []
+    name_index = {}
+    memo = {}
+
+    def walk(cell):
+        if id(cell) in memo:
+            return memo[id(cell)]
+        if cell.name not in name_index:
+            name_index[cell.name] = len(names)
+            names.append(cell.name)
+        parts = []
+        polygons = [
+            (points, layer, datatype)
+            for p in cell.polygons
+            for points, layer, datatype in zip(p.polygons, p.layers, p.datatypes)
+        ]
+        if polygons:
+            points, layers, datatypes = zip(*polygons)
+            parts.append(
+                (
+                    np.concatenate(points).astype(float),
+                    np.array([len(p) for p in points]),
+                    np.array(layers),
+                    np.array(datatypes),
+                    np.full(len(points), name_index[cell.name]),
+                )
+            )
+        for ref in cell.references:
+            child = walk(ref.parent)
+            if child is None:
+                continue
+            points, lengths, layers, datatypes, cells = child
+            if isinstance(ref, CellArray):
+                # lattice offsets are added before reflection and rotation,
+                # and are not magnified
+                mag = ref.magnification or 1
+                shifts = np.array(
+                    [
+                        (ref.spacing[0] * c, ref.spacing[1] * r)
+                        for c in range(ref.columns)
+                        for r in range(ref.rows)
+                    ]
+                )
+                local = (points[None] * mag + shifts[:, None]).reshape(-1, 2)
+                n = len(shifts)
+                moved = _transform(
+                    local, ref.origin, ref.rotation, None, ref.x_reflection
+                )
+                parts.append(
+                    (
+                        moved,
+                        np.tile(lengths, n),
+                        np.tile(layers, n),
+                        np.tile(datatypes, n),
+                        np.tile(cells, n),
+                    )
+                )
+            else:
+                moved = _transform(
+                    points,
+                    ref.origin,
+                    ref.rotation,
+                    ref.magnification,
+                    ref.x_reflection,
+                )
+                parts.append((moved, lengths, layers, datatypes, cells))
+        result = None
+        if parts:
+            result = tuple(np.concatenate(a) for a in zip(*parts))
+        memo[id(cell)] = result
+        return result
+
+    flat = walk(D)
+    if flat is None:
+        flat = (np.zeros((0, 2)), np.zeros(0, int), *(np.zeros(0, int),) * 3)
+    points, lengths, layers, datatypes, cells = flat
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
+    bboxes = np.zeros((0, 4))
+    if len(lengths):
+        start = offsets[:-1]
+        bboxes = np.column_stack(
+            (
+                np.minimum.reduceat(points[:, 0], start),
+                np.minimum.reduceat(points[:, 1], start),
+                np.maximum.reduceat(points[:, 0], start),
+                np.maximum.reduceat(points[:, 1], start),
+            )
+        )
+    return FlatLayout(points, offsets, layers, datatypes, cells, names, bboxes)
+
+
+class GridIndex:
+    """Uniform grid over bounding boxes.
+
+    Parameters:
+        bboxes (np.ndarray): (N, 4) array of xmin, ymin, xmax, ymax
+        cell_size (float): grid pitch
+    """
+
+    def __init__(self, bboxes: np.ndarray, cell_size: float):
+        self.bboxes = bboxes
+        self.cell_size = cell_size
+        lo = np.floor(bboxes[:, :2] / cell_size).astype(np.int64)
+        hi = np.floor(bboxes[:, 2:] / cell_size).astype(np.int64)
+        span = hi - lo + 1
+        count = span[:, 0] * span[:, 1]
+        # one entry per (box, grid cell) pair
+        ids = np.repeat(np.arange(len(bboxes)), count)
+        k = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        gx = lo[ids, 0] + k % span[ids, 0]
+        gy = lo[ids, 1] + k // span[ids, 0]
+        keys = self._key(gx, gy)
+        order = np.argsort(keys, kind="stable")
+        self._keys, start = np.unique(keys[order], return_index=True)
+        self._start = np.append(start, len(order))
+        self._ids = ids[order]
+
+    @staticmethod
+    def _key(gx: np.ndarray, gy: np.ndarray) -> np.ndarray:
+        return (gx.astype(np.int64) << 32) + (gy.astype(np.int64) & 0xFFFFFFFF)
+
+    def query(self, bbox: Sequence[float]) -> np.ndarray:
+        """Returns the sorted indices of the boxes intersecting bbox.
+
+        Parameters:
+            bbox (array-like[4]): xmin, ymin, xmax, ymax
+
+        Returns:
+            np.ndarray: box indices
+        """
+        x0, y0 = np.floor(np.asarray(bbox[:2]) / self.cell_size).astype(np.int64)
+        x1, y1 = np.floor(np.asarray(bbox[2:]) / self.cell_size).astype(np.int64)
+        gx, gy = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+        keys = self._key(gx.ravel(), gy.ravel())
+        pos = np.searchsorted(self._keys, keys)
+        valid = pos < len(self._keys)
+        pos = pos[valid][self._keys[pos[valid]] == keys[valid]]
+        if len(pos) == 0:
+            return np.zeros(0, dtype=np.int64)
+        ids = np.unique(
+            np.concatenate(
+                [self._ids[self._start[p] : self._start[p + 1]] for p in pos]
+            )
+        )
+        b = self.bboxes[ids]
+        hit = (
+            (b[:, 0] <= bbox[2])
+            & (b[:, 2] >= bbox[0])
+            & (b[:, 1] <= bbox[3])
+            & (b[:, 3] >= bbox[1])
+        )
+        return ids[hit]
+
+
+def _gather(flat: FlatLayout, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Vertex indices and lengths of polygons ids, concatenated."""
+    lengths = flat.offsets[ids + 1] - flat.offsets[ids]
+    starts = np.repeat(flat.offsets[ids], lengths)
+    k = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return starts + k, lengths
+
+
+def _tile_key(flat: FlatLayout, ids: np.ndarray, origin: np.ndarray) -> str:
+    """Hash of the polygons ids relative to origin, independent of order."""
+    bb = np.round((flat.bboxes[ids] - np.tile(origin, 2)) / TOLERANCE)
+    lengths = flat.offsets[ids + 1] - flat.offsets[ids]
+    order = np.lexsort(
+        (bb[:, 3], bb[:, 2], bb[:, 1], bb[:, 0], lengths, flat.layers[ids])
+    )
+    ids = ids[order]
+    vertices, lengths = _gather(flat, ids)
+    h = hashlib.sha1()
+    h.update(flat.layers[ids].astype(np.int64).tobytes())
+    h.update(flat.datatypes[ids].astype(np.int64).tobytes())
+    h.update(lengths.astype(np.int64).tobytes())
+    rel = np.round((flat.points[vertices] - origin) / TOLERANCE).astype(np.int64)
+    h.update(rel.tobytes())
+    return h.hexdigest()
+
+
+def _merge(polygons: List[np.ndarray]):
+    return manhattan.boolean(polygons, None, "or", precision=TOLERANCE)
+
+
+def _offset(polygons, distance: float):
+    if polygons is None:
+        return None
+    return manhattan.offset(
+        polygons, distance, join="miter", precision=TOLERANCE, join_first=True
+    )
+
+
+def _not(a, b):
+    if a is None:
+        return None
+    return manhattan.boolean(a, b, "not", precision=TOLERANCE)
+
+
+def _regions(polygons) -> List[np.ndarray]:
+    """Bounding boxes of the violation regions, without the slivers left by
+    offset rounding."""
+    return [
+        bbox
+        for bbox, area, perimeter in manhattan.regions(polygons)
+        if 2 * area / perimeter > TOLERANCE
+    ]
+
+
+def check_tile(
+    polygons: Dict[str, List[np.ndarray]],
+    layer_rules: Dict[str, LayerRules],
+    enclosures: Sequence[Enclosure],
+) -> List[Tuple[str, str, np.ndarray]]:
+    """Checks the polygons of one tile.
+
+    Parameters:
+        polygons (dict): polygons per layer name
+        layer_rules (dict): width and spacing rules per layer name
+        enclosures (Sequence[Enclosure]): enclosure rules
+
+    Returns:
+        List[tuple]: (rule, layer, bbox) of each violation region
+    """
+    merged = {name: _merge(p) for name, p in polygons.items() if p}
+    found = []
+    for name, rule in layer_rules.items():
+        shape = merged.get(name)
+        if shape is None:
+            continue
+        if rule.width:
+            d = rule.width / 2 - TOLERANCE
+            opened = _offset(_offset(shape, -d), d)
+            for r in _regions(_not(shape, opened)):
+                found.append(("width", name, r))
+        if rule.spacing:
+            d = rule.spacing / 2 - TOLERANCE
+            closed = _offset(_offset(shape, d), -d)
+            for r in _regions(_not(closed, shape)):
+                found.append(("spacing", name, r))
+    for rule in enclosures:
+        inner = merged.get(rule.inner)
+        if inner is None:
+            continue
+        grown = _offset(inner, rule.distance - TOLERANCE)
+        for r in _regions(_not(grown, merged.get(rule.outer))):
+            found.append(("enclosure", f"{rule.outer}/{rule.inner}", r))
+    return found
+
+
+def _check_tile_job(args) -> List[Tuple[str, str, np.ndarray]]:
+    """Worker: unpacks the arguments of check_tile."""
+    return check_tile(*args)
+
+
+def check(
+    D: Device,
+    layer_set: LayerSet,
+    layer_rules: Dict[str, LayerRules] = None,
+    enclosures: Sequence[Enclosure] = None,
+    tile_size: float = 1000,
+    processes: int = 1,
+    waived: Sequence[str] = WAIVED_CELLS,
+) -> List[Violation]:
+    """Runs the design-rule checks on D.
+
+    Parameters:
+        D (Device): layout to check
+        layer_set (LayerSet): maps the layer names of the rules to GDS
+            layers
+        layer_rules (dict): width/spacing rules per layer name, defaults to
+            default_rules()
+        enclosures (Sequence[Enclosure]): enclosure rules, defaults to
+            default_rules()
+        tile_size (float): tile pitch; choose a divisor of the die pitch so
+            that repeated dies produce identical tiles
+        processes (int or None): worker processes for the tile checks,
+            defaults to the number of CPUs; 1 checks in this process
+        waived (Sequence[str]): polygons drawn in cells whose name starts
+            with one of these prefixes are not checked
+
+    Returns:
+        List[Violation]: violations sorted by rule, layer and position
+    """
+    if layer_rules is None or enclosures is None:
+        defaults = default_rules()
+        layer_rules = defaults[0] if layer_rules is None else layer_rules
+        enclosures = defaults[1] if enclosures is None else enclosures
+    names = set(layer_rules) | {n for e in enclosures for n in (e.outer, e.inner)}
+    gds = {n: layer_set[n].gds_layer for n in names}
+    halo = (
+        2
+        * max(
+            [max(r.width, r.spacing) for r in layer_rules.values()]
+            + [e.distance for e in enclosures]
+            + [0]
+        )
+        + 2 * TOLERANCE
+    )
+
+    flat = flatten(D)
+    keep = np.isin(flat.layers, list(gds.values()))
+    waived_cells = [i for i, n in enumerate(flat.names) if n.startswith(tuple(waived))]
+    keep &= ~np.isin(flat.cells, waived_cells)
+    if not np.any(keep):
+        return []
+    index = GridIndex(flat.bboxes, tile_size / 4)
+    bb = flat.bboxes[keep]
+    lo = np.floor(bb[:, :2].min(axis=0) / tile_size).astype(int)
+    hi = np.floor(bb[:, 2:].max(axis=0) / tile_size).astype(int)
+
+    # group tiles by content
+    tiles = {}
+    for i in range(lo[0], hi[0] + 1):
+        for j in range(lo[1], hi[1] + 1):
+            origin = np.array([i, j], dtype=float) * tile_size
+            window = np.concatenate((origin - halo, origin + tile_size + halo))
+            ids = index.query(window)
+            ids = ids[keep[ids]]
+            if len(ids) == 0:
+                continue
+            key = _tile_key(flat, ids, origin)
+            tiles.setdefault(key, (ids, origin, []))[2].append(origin)
+
+    jobs = []
+    for ids, origin, _ in tiles.values():
+        polygons = {n: [] for n in names}
+        layer_names = {l: n for n, l in gds.items()}
+        for i in ids:
+            polygons[layer_names[flat.layers[i]]].append(flat.polygon(i) - origin)
+        jobs.append((polygons, layer_rules, enclosures))
+    if processes is None:
+        processes = os.cpu_count()
+    if processes > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_check_tile_job, jobs)
+    else:
+        results = [_check_tile_job(job) for job in jobs]
+
+    exempt = {f"{e.outer}/{e.inner}": tuple(e.waived) for e in enclosures if e.waived}
+    violations = []
+    for (_, _, origins), found in zip(tiles.values(), results):
+        for rule, layer, bbox in found:
+            center = (bbox[:2] + bbox[2:]) / 2
+            # report each region from the tile containing its center only
+            if np.any(center < 0) or np.any(center >= tile_size):
+                continue
+            for origin in origins:
+                box = bbox + np.tile(origin, 2)
+                hit = index.query(box)
+                layers = [gds[n] for n in layer.split("/")]
+                hit = hit[keep[hit] & np.isin(flat.layers[hit], layers)]
+                cells = tuple(sorted({flat.names[c] for c in flat.cells[hit]}))
+                if cells and all(c.startswith(exempt.get(layer, ())) for c in cells):
+                    continue
+                violations.append(
+                    Violation(
+                        rule,
+                        layer,
+                        float(center[0] + origin[0]),
+                        float(center[1] + origin[1]),
+                        tuple(float(v) for v in box),
+                        cells,
+                    )
+                )
+    return sorted(violations, key=lambda v: (v.rule, v.layer, v.y, v.x))
+
+
+def report(violations: Sequence[Violation]) -> str:
+    """Formats violations, one per line, with a per-rule summary.
+
+    Parameters:
+        violations (Sequence[Violation]): result of check()
+
+    Returns:
+        str: the report
+    """
+    counts = {}
+    lines = []
+    for v in violations:
+        key = f"{v.rule} {v.layer}"
+        counts[key] = counts.get(key, 0) + 1
+        lines.append(
+            f"{key:24s} ({v.x:10.3f}, {v.y:10.3f})  "
+            f"{v.bbox[2] - v.bbox[0]:.3f} x {v.bbox[3] - v.bbox[1]:.3f}  "
+            f"{', '.join(v.cells)}"
+        )
+    lines.append(f"{len(violations)} violations")
+    lines += [f"  {k}: {n}" for k, n in sorted(counts.items())]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import phidl.geometry as pg
+
+    import make_gds
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("gds", nargs="?", help="layout to check (default: build)")
+    parser.add_argument("-t", "--tile-size", type=float, default=1000)
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument(
+        "--no-cover", action="store_true", help="skip the via cover enclosure rule"
+    )
+    parser.add_argument(
+        "--cover",
+        action="append",
+        default=[],
+        metavar="CELL=BOOL",
+        help="cover_bottom of the dies placed as CELL, for layouts without "
+        "their .npz metadata sidecar",
+    )
+    args = parser.parse_args()
+
+    covers = {}
+    for item in args.cover:
+        name, _, value = item.partition("=")
+        if value.lower() not in ("true", "false", "yes", "no", "1", "0"):
+            parser.error(f"--cover expects CELL=true or CELL=false, not {item!r}")
+        covers[name] = value.lower() in ("true", "yes", "1")
+
+    ls = make_gds.default_layer_set()
+    if args.gds:
+        D = pg.import_gds(args.gds, flatten=False)
+        # the written cells carry no info: take cover_bottom from the
+        # metadata of the build (see make_gds.build)
+        sidecar = os.path.splitext(args.gds)[0] + ".npz"
+        if os.path.exists(sidecar):
+            import metadata as md
+
+            try:
+                found = die_cover_bottom(D, md.DeviceTable.load(sidecar).columns)
+            except ValueError as e:
+                parser.error(f"{sidecar}: {e}")
+            covers = {**found, **covers}
+    else:
+        D = make_gds.wafer_array(ls)
+    # the dies of the array differ in cover_bottom: check each die with its
+    # own rules (reported in die coordinates) and the rest of the array,
+    # i.e. labels and marks, with the default rules
+    rest = Device(D.name)
+    rest.add(D.polygons)
+    jobs = {id(rest): (rest, True)}
+    unknown = set()
+    for ref in D.references:
+        cell = ref.parent
+        cover = cell.info.get("cover_bottom", covers.get(cell.name))
+        if cover is not None:
+            jobs[id(cell)] = (cell, cover)
+            continue
+        if ls["via"].gds_layer in cell.get_layers() and not cell.name.startswith(
+            WAIVED_CELLS
+        ):
+            unknown.add(cell.name)
+        rest.add(ref)
+    if unknown and not args.no_cover:
+        # checking them with the cover rule reports every via of a die built
+        # without it
+        parser.error(
+            f"cover_bottom of {', '.join(sorted(unknown))} not found in the "
+            "metadata sidecar; pass --no-cover or --cover CELL=BOOL for each"
+        )
+    t = time.perf_counter()
+    violations = []
+    for cell, cover in jobs.values():
+        found = check(
+            cell,
+            ls,
+            *default_rules(cover_bottom=cover and not args.no_cover),
+            tile_size=args.tile_size,
+            processes=args.processes,
+        )
+        if cell is not rest:
+            die = f"{cell.name}(cover_bottom={cover})"
+            found = [v._replace(cells=(die,) + v.cells) for v in found]
+        violations += found
+    print(report(violations))
+    print(f"checked in {time.perf_counter() - t:.1f}s")
@@ -0,0 +1,175 @@
+"""Incremental GDSII output.
+
+A GdsStream writes each cell as soon as it is handed over, children first,
+so a layout does not have to be complete (or kept) in memory to be
+written. Cells that were already written are skipped; once the caller
+drops a written cell, the stream forgets it too. Cells are written under
+the deterministic names of cell_names.py: factory cells keep their hashed
+names and other cells are named by their content, so equal cells are
+written once and repeated builds write the same file. A cell whose name
+was written before is only skipped if its content is the same, otherwise
+the write fails rather than referencing the wrong cell. With
+hashed_names=False, duplicate cell names are fixed up as in
+Device.write_gds(auto_rename=True) instead. Either way the names are only
+changed for the duration of each write, the Devices keep their names.
+
+    with GdsStream("wafer.gds", timestamp=build_timestamp()) as stream:
+        for die in dies:
+            stream.write(die)
+        stream.write(array, top=True)
+"""
+
+import datetime
+import os
+import weakref
+from typing import BinaryIO, Dict, List, Union
+
+import gdspy
+from phidl import Device
+
+from cell_names import hierarchy_names
+
+
+def build_timestamp() -> datetime.datetime:
+    """Fixed timestamp for reproducible output: SOURCE_DATE_EPOCH if it is
+    set, the Unix epoch otherwise."""
+    epoch = int(os.environ.get("SOURCE_DATE_EPOCH", 0))
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc)
+
+
+class GdsStream:
+    """Writes cells to a GDSII file as they are finished.
+
+    Parameters:
+        outfile (str or file): file name or binary file object
+        unit (float): user unit in meters
+        precision (float): database unit in meters
+        cellname (str): name of the top-level cell, reserved from the start
+        max_cellname_length (int or None): maximum length of renamed cells
+        timestamp (datetime): timestamp of the library and cells, defaults
+            to the current time; pass a fixed one for byte-reproducible output
+        hashed_names (bool): if True, write cells under their hashed names
+            (see cell_names.py) instead of renaming duplicates
+    """
+
+    def __init__(
+        self,
+        outfile: Union[str, BinaryIO],
+        unit: float = 1e-6,
+        precision: float = 1e-9,
+        cellname: str = "toplevel",
+        max_cellname_length: int = 28,
+        timestamp=None,
+        hashed_names: bool = True,
+    ):
+        self._writer = gdspy.GdsWriter(
+            outfile, unit=unit, precision=precision, timestamp=timestamp
+        )
+        self.timestamp = timestamp
+        self.cellname = cellname
+        self.max_cellname_length = max_cellname_length
+        self.hashed_names = hashed_names
+        self.scale = unit / precision
+        # names of the written cells that are still alive, by id
+        self._names: Dict[int, str] = {}
+        self._used = {cellname}
+        # content digests of the cells written under hashed names, by name
+        self._digests: Dict[str, str] = {}
+        self._n = 1
+        self.cells_written = 0
+
+    def _unique(self, name: str) -> str:
+        if self.max_cellname_length is not None:
+            name = name[: self.max_cellname_length]
+        candidate = name
+        while candidate in self._used:
+            self._n += 1
+            candidate = name + ("%0.3i" % self._n)
+        self._used.add(candidate)
+        return candidate
+
+    def _pending(self, D: Device, names: Dict[int, str] = None) -> List[Device]:
+        """Cells of the hierarchy of D that are not written yet, children
+        first, in order of their hashed names if given (creation order
+        otherwise)."""
+        order = []
+        seen = set()
+        if names is None:
+            key = lambda c: c.uid
+        else:
+            key = lambda c: names.get(id(c), "")
+
+        def visit(cell):
+            if id(cell) in seen or id(cell) in self._names:
+                return
+            seen.add(id(cell))
+            for child in sorted(cell.get_dependencies(), key=key):
+                visit(child)
+            order.append(cell)
+
+        visit(D)
+        return order
+
+    def write(self, D: Device, top: bool = False) -> str:
+        """Writes D and the cells it depends on that were not written yet.
+
+        Parameters:
+            D (Device): cell to write
+            top (bool): if True, D is written under the top-level cell name
+
+        Returns:
+            str: the name D was written under
+        """
+        names = None
+        if self.hashed_names:
+            digests = {}
+            names = hierarchy_names(
+                D, {}, self._names, self.scale, self.max_cellname_length, digests
+            )
+        for cell in self._pending(D, names):
+            if top and cell is D:
+                name = self.cellname
+            elif names is None:
+                name = self._unique(cell.name)
+            elif names[id(cell)] in self._used:
+                name = names[id(cell)]
+                if self._digests.get(name) != digests[id(cell)]:
+                    raise ValueError(
+                        f"cell {cell.name!r} differs from the cell written as "
+                        f"{name!r} before"
+                    )
+                # an equal cell was written already, reference that one
+                self._names[id(cell)] = name
+                weakref.finalize(cell, self._names.pop, id(cell), None)
+                continue
+            else:
+                name = names[id(cell)]
+                self._used.add(name)
+                self._digests[name] = digests[id(cell)]
+            # references are written with the name of their cell
+            renamed = [(cell, cell.name)] + [
+                (child, child.name) for child in cell.get_dependencies()
+            ]
+            try:
+                for child, _ in renamed[1:]:
+                    child.name = self._names[id(child)]
+                cell.name = name
+                self._writer.write_cell(cell, timestamp=self.timestamp)
+            finally:
+                for c, original in renamed:
+                    c.name = original
+            self._names[id(cell)] = name
+            weakref.finalize(cell, self._names.pop, id(cell), None)
+            self.cells_written += 1
+        return self._names[id(D)]
+
+    def close(self) -> None:
+        """Writes the end of the library and closes the file."""
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,107 @@
+"""Cached device annotations.
+
+Each unique (text, size, layer) is rendered with pg.text once and
+shared. Copies of a label on additional layers are made by relayering
+the glyph polygons rather than running a boolean union.
+
+Labels can optionally be written as GDS TEXT elements instead of
+polygons (see set_text_elements()). In that mode the label cell keeps
+the bounding box of the rendered glyphs, so placement is identical in
+both modes.
+"""
+
+from typing import Sequence
+
+import numpy as np
+import phidl.geometry as pg
+from phidl import Device
+
+from cell_cache import CELL_CACHE, CellCache
+
+LABEL_CACHE = CellCache(maxsize=4096)
+
+_text_elements = False
+
+
+class TextLabel(Device):
+    """Device holding GDS TEXT elements whose bounding box is that of the
+    equivalent polygon label.
+
+    Parameters:
+        name (str): cell name
+        bbox (array-like[2][2]): bounding box to report
+    """
+
+    def __init__(self, name: str, bbox):
+        super().__init__(name)
+        self._glyph_bbox = np.array(bbox, dtype=float)
+        self._bb_valid = True
+
+    def get_bounding_box(self):
+        self._bb_valid = True
+        return np.array(self._glyph_bbox)
+
+
+def set_text_elements(enabled: bool = True) -> None:
+    """Selects whether labels are written as GDS TEXT elements (True) or as
+    polygons (False, default).
+
+    Cached factory cells contain labels, so the mode is part of the cell
+    cache key.
+
+    Parameters:
+        enabled (bool): if True, emit TEXT elements
+    """
+    global _text_elements
+    _text_elements = bool(enabled)
+    CELL_CACHE.set_context("text_elements", _text_elements)
+
+
+@LABEL_CACHE
+def glyphs(text: str, size: float = 10, layer: int = 0) -> Device:
+    """Renders text as polygons on a single layer.
+
+    Parameters:
+        text (str): label text
+        size (float): character height
+        layer (int): GDS layer
+
+    Returns:
+        Device: the rendered label
+    """
+    return pg.text(text, size=size, layer=layer)
+
+
+@LABEL_CACHE
+def _label(
+    text: str, size: float, layers: Sequence[int], text_elements: bool
+) -> Device:
+    G = glyphs(text, size, layers[0])
+    if text_elements:
+        L = TextLabel(f"LABEL({text})", G.bbox)
+        for layer in layers:
+            L.add_label(text=text, position=G.center, magnification=size, layer=layer)
+        return L
+    L = Device(f"LABEL({text})")
+    points = G.get_polygons()
+    for layer in layers:
+        for p in points:
+            L.add_polygon(p, layer=layer)
+    return L
+
+
+def label(text: str, size: float = 10, layers: Sequence[int] = (0,)) -> Device:
+    """Returns a shared label cell with the text drawn on every layer in
+    layers.
+
+    Parameters:
+        text (str): label text
+        size (float): character height
+        layers (Sequence[int]): GDS layers to draw the label on (duplicates are
+            ignored)
+
+    Returns:
+        Device: the label, to be placed with a reference
+    """
+    layers = tuple(dict.fromkeys(layers))
+    return _label(text, size, layers, _text_elements)
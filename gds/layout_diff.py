@@ -0,0 +1,396 @@
+"""Geometric diff of two builds of a layout.
+
+The two hierarchies are compared by content hash first, so only cells that
+actually changed are looked at, and each changed cell is looked at once
+however often it is placed:
+    - every polygon and reference of a cell gets a hash (references hash
+      the content of the cell they place, not its name, so renamed but
+      equal cells match); the hash of a cell is that of its sorted items
+    - items that appear in both versions of a cell cancel out
+    - left-over references with the same placement in both versions are
+      paired, and the pair is diffed recursively (e.g. a die whose
+      transistor sweep changed)
+    - the remaining items mark the regions that changed in the cell itself;
+      only those regions are XORed, in tiles, per layer, in a process pool,
+      leaving out the paired references (their changes are found in their
+      own cells)
+Changes found in a cell are reported at every placement of the cell in the
+top-level layout.
+
+Labels and ports are not compared.
+
+    python layout_diff.py old.gds new.gds
+"""
+
+import hashlib
+import multiprocessing
+import os
+import time
+from collections import Counter
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import gdspy
+import numpy as np
+from phidl import Device
+from phidl.device_layout import CellArray
+
+import manhattan
+from drc import TOLERANCE, GridIndex, _transform, flatten
+
+
+class Change(NamedTuple):
+    """One region where the two layouts differ."""
+
+    layer: int
+    datatype: int
+    x: float
+    y: float
+    bbox: Tuple[float, float, float, float]
+    area: float
+    cells: Tuple[str, str]
+
+
+class _Cell(NamedTuple):
+    """Content hash of a cell and of each of its items."""
+
+    digest: str
+    polygons: List[Tuple[str, tuple]]
+    references: List[Tuple[str, tuple, object]]
+
+
+def _grid(values) -> np.ndarray:
+    return np.round(np.asarray(values, dtype=float) / TOLERANCE).astype(np.int64)
+
+
+def _placement(ref) -> tuple:
+    """Hashable transformation of a reference, including its lattice."""
+    array = None
+    if isinstance(ref, CellArray):
+        array = (ref.columns, ref.rows, tuple(_grid(ref.spacing).tolist()))
+    return (
+        tuple(_grid(ref.origin).tolist()),
+        float(ref.rotation or 0) % 360,
+        float(ref.magnification or 1),
+        bool(ref.x_reflection),
+        array,
+    )
+
+
+def cell_hashes(D: Device, memo: Dict[int, _Cell] = None) -> Dict[int, _Cell]:
+    """Hashes D and its dependencies.
+
+    Parameters:
+        D (Device): top-level device
+        memo (dict or None): hashes computed so far, by cell id
+
+    Returns:
+        dict: _Cell of every cell of the hierarchy, by id
+    """
+    if memo is None:
+        memo = {}
+    if id(D) in memo:
+        return memo
+    polygons = []
+    for p in D.polygons:
+        for points, layer, datatype in zip(p.polygons, p.layers, p.datatypes):
+            h = hashlib.sha1(repr((layer, datatype)).encode())
+            h.update(_grid(points).tobytes())
+            polygons.append((h.hexdigest(), (layer, datatype, points)))
+    references = []
+    for ref in D.references:
+        cell_hashes(ref.parent, memo)
+        placement = _placement(ref)
+        h = hashlib.sha1(repr((memo[id(ref.parent)].digest, placement)).encode())
+        references.append((h.hexdigest(), placement, ref))
+    h = hashlib.sha1()
+    for item in sorted(d for d, _ in polygons) + sorted(d for d, _, _ in references):
+        h.update(item.encode())
+    memo[id(D)] = _Cell(h.hexdigest(), polygons, references)
+    return memo
+
+
+def _unmatched(a: List[tuple], b: List[tuple]) -> Tuple[List[tuple], List[tuple]]:
+    """Items of a and b whose hash (first element) is not matched by an item of
+    the other list."""
+    extra_a = Counter(d for d, *_ in a) - Counter(d for d, *_ in b)
+    extra_b = Counter(d for d, *_ in b) - Counter(d for d, *_ in a)
+    left = []
+    for item in a:
+        if extra_a[item[0]] > 0:
+            extra_a[item[0]] -= 1
+            left.append(item)
+    right = []
+    for item in b:
+        if extra_b[item[0]] > 0:
+            extra_b[item[0]] -= 1
+            right.append(item)
+    return left, right
+
+
+def _without(D: Device, references: Sequence) -> Device:
+    """Shallow copy of D without the given references, for flatten()."""
+    skip = {id(r) for r in references}
+    C = Device(D.name)
+    C.polygons = list(D.polygons)
+    C.references = [r for r in D.references if id(r) not in skip]
+    return C
+
+
+def _tiles(boxes: Sequence[np.ndarray], tile_size: float) -> List[Tuple[int, int]]:
+    """Tiles of the grid of pitch tile_size that overlap any of boxes."""
+    tiles = set()
+    for b in boxes:
+        lo = np.floor(b[:2] / tile_size).astype(int)
+        hi = np.floor(b[2:] / tile_size).astype(int)
+        for i in range(lo[0], hi[0] + 1):
+            for j in range(lo[1], hi[1] + 1):
+                tiles.add((i, j))
+    return sorted(tiles)
+
+
+def xor_tile(
+    window: Sequence[float],
+    polygons: Dict[Tuple[int, int], Tuple[List[np.ndarray], List[np.ndarray]]],
+) -> List[Tuple[int, int, np.ndarray, float]]:
+    """XORs the two versions of one tile.
+
+    Parameters:
+        window (array-like[4]): xmin, ymin, xmax, ymax of the tile
+        polygons (dict): polygons of the two versions, per (layer, datatype)
+
+    Returns:
+        List[tuple]: (layer, datatype, bbox, area) of each differing region
+    """
+    x0, y0, x1, y1 = window
+    clip = gdspy.Rectangle((x0, y0), (x1, y1))
+    found = []
+    for (layer, datatype), (a, b) in sorted(polygons.items()):
+        xor = manhattan.boolean(a or None, b or None, "xor", precision=TOLERANCE)
+        xor = manhattan.boolean(xor, clip, "and", precision=TOLERANCE)
+        for bbox, area, _ in manhattan.regions(xor):
+            if area > TOLERANCE**2:
+                found.append((layer, datatype, bbox, area))
+    return found
+
+
+def _xor_tile_job(args) -> List[Tuple[int, int, np.ndarray, float]]:
+    """Worker: unpacks the arguments of xor_tile."""
+    return xor_tile(*args)
+
+
+class _Pair(NamedTuple):
+    """A changed cell: local XOR jobs and the changed cells it places."""
+
+    names: Tuple[str, str]
+    jobs: List[int]
+    children: List[Tuple["_Pair", object]]
+
+
+def diff(
+    A: Device, B: Device, tile_size: float = 500, processes: int = 1
+) -> List[Change]:
+    """Compares two layouts.
+
+    Parameters:
+        A (Device): old layout
+        B (Device): new layout
+        tile_size (float): size of the XOR tiles
+        processes (int or None): worker processes for the XOR, defaults to
+            the number of CPUs; 1 computes in this process
+
+    Returns:
+        List[Change]: differing regions in the coordinates of the top-level
+            cells, sorted by layer and position
+    """
+    hashes = cell_hashes(A)
+    cell_hashes(B, hashes)
+    jobs = []
+    pairs = {}
+
+    def compare(a, b) -> _Pair:
+        key = (id(a), id(b))
+        if key in pairs:
+            return pairs[key]
+        ha, hb = hashes[id(a)], hashes[id(b)]
+        polygons_a, polygons_b = _unmatched(ha.polygons, hb.polygons)
+        refs_a, refs_b = _unmatched(ha.references, hb.references)
+        # pair up references at the same placement and diff their cells
+        children = []
+        by_placement = {}
+        for item in refs_b:
+            by_placement.setdefault(item[1], []).append(item)
+        local_a = []
+        paired_b = []
+        for item in refs_a:
+            match = by_placement.get(item[1])
+            if match:
+                ref_b = match.pop(0)[2]
+                paired_b.append(ref_b)
+                children.append((compare(item[2].parent, ref_b.parent), item[2]))
+            else:
+                local_a.append(item)
+        local_b = [item for items in by_placement.values() for item in items]
+
+        boxes = [
+            np.concatenate((points.min(axis=0), points.max(axis=0)))
+            for _, (_, _, points) in polygons_a + polygons_b
+        ] + [np.ravel(ref.bbox) for _, _, ref in local_a + local_b]
+        pair = _Pair((a.name, b.name), [], children)
+        pairs[key] = pair
+        if not boxes:
+            return pair
+        flat_a = flatten(_without(a, [ref for _, ref in children]))
+        flat_b = flatten(_without(b, paired_b))
+        index_a = GridIndex(flat_a.bboxes, tile_size / 4)
+        index_b = GridIndex(flat_b.bboxes, tile_size / 4)
+        for i, j in _tiles(boxes, tile_size):
+            window = np.array([i, j, i + 1, j + 1], dtype=float) * tile_size
+            polygons = {}
+            for side, (flat, index) in enumerate(
+                ((flat_a, index_a), (flat_b, index_b))
+            ):
+                for n in index.query(window):
+                    spec = (int(flat.layers[n]), int(flat.datatypes[n]))
+                    polygons.setdefault(spec, ([], []))[side].append(flat.polygon(n))
+            if polygons:
+                pair.jobs.append(len(jobs))
+                jobs.append((window, polygons))
+        return pair
+
+    top = compare(A, B)
+
+    if processes is None:
+        processes = os.cpu_count()
+    if processes > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_xor_tile_job, jobs)
+    else:
+        results = [_xor_tile_job(job) for job in jobs]
+
+    memo = {}
+
+    def regions(pair: _Pair) -> List[Tuple[int, int, np.ndarray, float, tuple]]:
+        """Changes of pair and of the cells it places, in its coordinates."""
+        if id(pair) in memo:
+            return memo[id(pair)]
+        found = [
+            (layer, datatype, bbox, area, pair.names)
+            for n in pair.jobs
+            for layer, datatype, bbox, area in results[n]
+        ]
+        for child, ref in pair.children:
+            sub = regions(child)
+            if not sub:
+                continue
+            if isinstance(ref, CellArray):
+                shifts = [
+                    (ref.spacing[0] * c, ref.spacing[1] * r)
+                    for c in range(ref.columns)
+                    for r in range(ref.rows)
+                ]
+            mag = ref.magnification
+            scale = (mag or 1) ** 2
+            for layer, datatype, bbox, area, names in sub:
+                corners = bbox[[0, 1, 2, 1, 2, 3, 0, 3]].reshape(4, 2)
+                if isinstance(ref, CellArray):
+                    # lattice offsets are added before reflection and
+                    # rotation, and are not magnified
+                    moved = [corners * (mag or 1) + shift for shift in shifts]
+                    moved = [
+                        _transform(c, ref.origin, ref.rotation, None, ref.x_reflection)
+                        for c in moved
+                    ]
+                else:
+                    moved = [
+                        _transform(
+                            corners, ref.origin, ref.rotation, mag, ref.x_reflection
+                        )
+                    ]
+                for m in moved:
+                    box = np.concatenate((m.min(axis=0), m.max(axis=0)))
+                    found.append((layer, datatype, box, area * scale, names))
+        memo[id(pair)] = found
+        return found
+
+    changes = [
+        Change(
+            layer,
+            datatype,
+            float((bbox[0] + bbox[2]) / 2),
+            float((bbox[1] + bbox[3]) / 2),
+            tuple(float(v) for v in bbox),
+            float(area),
+            names,
+        )
+        for layer, datatype, bbox, area, names in regions(top)
+    ]
+    return sorted(changes, key=lambda c: (c.layer, c.datatype, c.y, c.x))
+
+
+def changed_cells(A: Device, B: Device) -> Tuple[List[str], List[str]]:
+    """Cells whose content appears in only one of the layouts.
+
+    Parameters:
+        A (Device): old layout
+        B (Device): new layout
+
+    Returns:
+        tuple: sorted names of the cells only in A and only in B
+    """
+    cells_a = {id(c): c for c in [A] + list(A.get_dependencies(recursive=True))}
+    cells_b = {id(c): c for c in [B] + list(B.get_dependencies(recursive=True))}
+    hashes = cell_hashes(A)
+    cell_hashes(B, hashes)
+    digests_a = {hashes[i].digest for i in cells_a}
+    digests_b = {hashes[i].digest for i in cells_b}
+    only_a = {c.name for i, c in cells_a.items() if hashes[i].digest not in digests_b}
+    only_b = {c.name for i, c in cells_b.items() if hashes[i].digest not in digests_a}
+    return sorted(only_a), sorted(only_b)
+
+
+def report(changes: Sequence[Change], cells: Tuple[List[str], List[str]]) -> str:
+    """Formats the changed cells and regions, with a per-layer summary.
+
+    Parameters:
+        changes (Sequence[Change]): result of diff()
+        cells (tuple): result of changed_cells()
+
+    Returns:
+        str: the report
+    """
+    lines = [f"- {name}" for name in cells[0]] + [f"+ {name}" for name in cells[1]]
+    counts = {}
+    for c in changes:
+        key = f"{c.layer}/{c.datatype}"
+        counts[key] = counts.get(key, 0) + 1
+        lines.append(
+            f"{key:8s} ({c.x:10.3f}, {c.y:10.3f})  "
+            f"{c.bbox[2] - c.bbox[0]:.3f} x {c.bbox[3] - c.bbox[1]:.3f}  "
+            f"{c.area:.3f} um2  {c.cells[0]} -> {c.cells[1]}"
+        )
+    lines.append(
+        f"{len(cells[0])} cells removed, {len(cells[1])} added, "
+        f"{len(changes)} changed regions"
+    )
+    lines += [f"  {k}: {n}" for k, n in sorted(counts.items())]
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import phidl.geometry as pg
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old", help="layout before the change")
+    parser.add_argument("new", help="layout after the change")
+    parser.add_argument("-t", "--tile-size", type=float, default=500)
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    A = pg.import_gds(args.old, flatten=False)
+    B = pg.import_gds(args.new, flatten=False)
+    t = time.perf_counter()
+    changes = diff(A, B, tile_size=args.tile_size, processes=args.processes)
+    print(report(changes, changed_cells(A, B)))
+    print(f"compared in {time.perf_counter() - t:.1f}s")
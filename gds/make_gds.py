@@ -1,22 +1,59 @@
 import phidl.geometry as pg
 from phidl import Device, LayerSet
-from phidl import quickplot as qp
-from phidl import set_quickplot_options
 
 from via import test_via
-
-from qnngds.tests import alignment_mark, resolution_test, vdp
-from qnngds.devices.resistor import meander
-
-import phidlfem.analysis as pfa
+from cell_cache import CELL_CACHE, cached_cell
+from cell_store import CellStore
+from gds_stream import GdsStream, build_timestamp
+from parallel import parallel_gridsweep
+from arrays import place_array
+import bbox_cache
+from floorplan import Floorplan
+from labels import label
+from rects import add_rectangles, bbox, boxes, rectangles, translate
+from squares import check_squares, resistor_squares, verify_enabled
 
 import numpy as np
 
+import contextlib
+import gzip
+import os
+from functools import partial
 from typing import Tuple, List
 
-set_quickplot_options(blocking=True)
+# qnngds, phidlfem (squares.py) and the quickplot backend are imported where
+# they are used, so that batch builds only load what they need
+
+
+@cached_cell
+def pad_stack(
+    pad_size: Tuple[float, float] = (100, 100),
+    layers: Tuple[int, ...] = (3,),
+    cover_layer: int = None,
+) -> Device:
+    """Creates a probe pad, shared by all factories that place a pad of the
+    same size and layers.
+
+    Parameters:
+        pad_size (tuple(float,float)): pad length and width
+        layers (tuple(int)): layers drawn with the full pad size (e.g. the
+            gate pad and its via)
+        cover_layer (int): if not None, layer of a cover 1 um larger than
+            the pad on each side
+
+    Returns:
+        Device: the pad, centered on the origin
+    """
+    PAD = Device(f"PAD({pad_size[0]},{pad_size[1]})")
+    sizes = [pad_size] * len(layers)
+    if cover_layer is not None:
+        sizes.append(np.add(pad_size, 2))
+        layers = tuple(layers) + (cover_layer,)
+    add_rectangles(PAD, *boxes([(0, 0)] * len(sizes), sizes).T, layers)
+    return PAD
 
 
+@cached_cell
 def mos_cap(
     L_overlap: float = 100,
     L_contact: float = 10,
@@ -40,53 +77,51 @@ def mos_cap(
         Device: the created MOS capacitor
     """
     MOS = Device(f"MOS_CAP({L_overlap},{L_contact},{pad_size[1]})")
-    bot_pad = pg.rectangle(pad_size, layer=layer_set["gate"].gds_layer)
-    bot_pad.move((-bot_pad.xmin, -bot_pad.ymin))
-    bot = bot_pad << pg.rectangle(
-        (L_overlap + 15, W + 10), layer=layer_set["gate"].gds_layer
-    )
-    bot.move((pad_size[0] - bot.xmin - 5, pad_size[1] / 2 - bot.y))
-    bot_via = bot_pad << pg.rectangle(
-        (pad_size[0], pad_size[1]), layer=layer_set["via"].gds_layer
+    gate, via, sd, mesa = (
+        layer_set[name].gds_layer for name in ("gate", "via", "sourcedrain", "mesa")
     )
-    bot_via.move((pad_size[0] / 2 - bot_via.x, pad_size[1] / 2 - bot_via.y))
+    px, py = pad_size
+    # bottom pad with gate finger, via and optional via cover/connector
+    bot = [
+        (0, 0, px, py, gate),
+        (px - 5, (py - W - 10) / 2, px + L_overlap + 10, (py + W + 10) / 2, gate),
+        (0, 0, px, py, via),
+    ]
     if cover_bottom:
-        bot_via_cover = bot_pad << pg.rectangle(
-            (pad_size[0] + 2, pad_size[1] + 2), layer=layer_set["sourcedrain"].gds_layer
-        )
-        bot_via_cover.move(
-            (pad_size[0] / 2 - bot_via_cover.x, pad_size[1] / 2 - bot_via_cover.y)
-        )
-        bot_via_conn = bot_pad << pg.rectangle(
-            (2, W + 10 + 2), layer=layer_set["sourcedrain"].gds_layer
-        )
-        bot_via_conn.move(
-            (
-                bot_pad.xmax - L_overlap - 10 - bot_via_conn.xmin,
-                pad_size[1] / 2 - bot_via_conn.y,
-            )
-        )
-    mesa = pg.rectangle((L_overlap + L_contact, W), layer=layer_set["mesa"].gds_layer)
-    top_pad = pg.rectangle(
-        (pad_size[0] + L_contact, pad_size[1]), layer=layer_set["sourcedrain"].gds_layer
-    )
-    top = top_pad << pg.rectangle(
-        (10, W + 10), layer=layer_set["sourcedrain"].gds_layer
-    )
-    top.move((-top.xmin, pad_size[1] / 2 - top.y))
-    b = MOS << bot_pad
-    t = MOS << top_pad
-    m = MOS << mesa
-    b.move((-b.xmin, -b.ymin))
-    m.move((b.xmax - m.xmin - L_overlap, b.y - m.y))
-    t.move((m.xmax - t.xmin - 5, b.y - t.y))
-    text = MOS << pg.text(f"W/L\n{W}/{L_overlap}", layer=layer_set["gate"].gds_layer)
-    text.move((t.x - text.x, t.ymax + 10 - text.ymin))
-    MOS << pg.union(text, layer=layer_set["sourcedrain"].gds_layer)
+        bot += [
+            (-1, -1, px + 1, py + 1, sd),
+            (px, (py - W - 12) / 2, px + 2, (py + W + 12) / 2, sd),
+        ]
+    bot = translate(bot, -bbox(bot)[0])
+    b = bbox(bot)
+    # the pad, via and cover are placed as a shared pad stack
+    pad_center = bbox(bot[0]).mean(axis=0)
+    bot = np.delete(bot, [0, 2, 3] if cover_bottom else [0, 2], axis=0)
+    m = translate(
+        [(0, 0, L_overlap + L_contact, W, mesa)],
+        (b[1, 0] - L_overlap, b[:, 1].mean() - W / 2),
+    )
+    top = np.array(
+        [
+            (0, 0, px + L_contact, py, sd),
+            (0, (py - W - 10) / 2, 10, (py + W + 10) / 2, sd),
+        ]
+    )
+    t = bbox(top)
+    top = translate(top, (m[0, 2] - 5 - t[0, 0], b[:, 1].mean() - t[:, 1].mean()))
+    t = bbox(top)
+    add_rectangles(MOS, *np.vstack((bot, top, m)).T)
+    stack = MOS << pad_stack(pad_size, (gate, via), sd if cover_bottom else None)
+    stack.move(pad_center)
+    # the top pad is wider than a pad stack; record it for the metadata
+    MOS.info["pads"] = [tuple(bbox(top[0]).mean(axis=0))]
+    text = MOS << label(f"W/L\n{W}/{L_overlap}", layers=(gate, sd))
+    text.move((t[:, 0].mean() - text.x, t[1, 1] + 10 - text.ymin))
 
     return MOS
 
 
+@cached_cell
 def mim_cap(
     L_overlap: float = 100,
     W: float = 100,
@@ -107,51 +142,49 @@ def mim_cap(
         Device: the created MIM capacitor
     """
     MIM = Device(f"MIM_CAP({L_overlap},{pad_size[1]})")
-    bot_pad = pg.rectangle(pad_size, layer=layer_set["gate"].gds_layer)
-    bot_pad.move((-bot_pad.xmin, -bot_pad.ymin))
-    bot = bot_pad << pg.rectangle(
-        (L_overlap + 10, W + 10), layer=layer_set["gate"].gds_layer
+    gate, via, sd = (
+        layer_set[name].gds_layer for name in ("gate", "via", "sourcedrain")
     )
-    bot.move((pad_size[0] - bot.xmin, pad_size[1] / 2 - bot.y))
-    bot_via = bot_pad << pg.rectangle(
-        (pad_size[0], pad_size[1]), layer=layer_set["via"].gds_layer
-    )
-    bot_via.move((pad_size[0] / 2 - bot_via.x, pad_size[1] / 2 - bot_via.y))
+    px, py = pad_size
+    # bottom pad with gate finger, via and optional via cover/connector
+    bot = [
+        (0, 0, px, py, gate),
+        (px, (py - W - 10) / 2, px + L_overlap + 10, (py + W + 10) / 2, gate),
+        (0, 0, px, py, via),
+    ]
     if cover_bottom:
-        bot_via_cover = bot_pad << pg.rectangle(
-            (pad_size[0] + 2, pad_size[1] + 2), layer=layer_set["sourcedrain"].gds_layer
-        )
-        bot_via_cover.move(
-            (pad_size[0] / 2 - bot_via_cover.x, pad_size[1] / 2 - bot_via_cover.y)
-        )
-        bot_via_conn = bot_pad << pg.rectangle(
-            (2, W + 10 + 2), layer=layer_set["sourcedrain"].gds_layer
-        )
-        bot_via_conn.move(
-            (
-                bot_pad.xmax - L_overlap - 10 - bot_via_conn.xmin,
-                pad_size[1] / 2 - bot_via_conn.y,
-            )
-        )
-    top_pad = pg.rectangle(pad_size, layer=layer_set["sourcedrain"].gds_layer)
-    top_pad.move((-top_pad.xmin, -top_pad.ymin))
-    top = top_pad << pg.rectangle(
-        (L_overlap + 10, W), layer=layer_set["sourcedrain"].gds_layer
-    )
-    top.move((-top.xmax, pad_size[1] / 2 - top.y))
-    b = MIM << bot_pad
-    t = MIM << top_pad
-    b.move((-b.xmin, -b.ymin))
-    t.move((b.xmax - t.xmin - L_overlap, b.y - t.y))
-    text = MIM << pg.text(f"W/L\n{W}/{L_overlap}", layer=layer_set["gate"].gds_layer)
-    text.move(
-        (t.xmax - pad_size[0] / 2 - text.x, t.y + pad_size[1] / 2 + 10 - text.ymin)
-    )
-    MIM << pg.union(text, layer=layer_set["sourcedrain"].gds_layer)
+        bot += [
+            (-1, -1, px + 1, py + 1, sd),
+            (px, (py - W - 12) / 2, px + 2, (py + W + 12) / 2, sd),
+        ]
+    bot = translate(bot, -bbox(bot)[0])
+    b = bbox(bot)
+    # the pad, via and cover are placed as a shared pad stack
+    pad_center = bbox(bot[0]).mean(axis=0)
+    bot = np.delete(bot, [0, 2, 3] if cover_bottom else [0, 2], axis=0)
+    # top pad with sourcedrain finger
+    top = np.array(
+        [
+            (0, 0, px, py, sd),
+            (-L_overlap - 10, (py - W) / 2, 0, (py + W) / 2, sd),
+        ]
+    )
+    t = bbox(top)
+    top = translate(
+        top, (b[1, 0] - t[0, 0] - L_overlap, b[:, 1].mean() - t[:, 1].mean())
+    )
+    t = bbox(top)
+    add_rectangles(MIM, *np.vstack((bot, top[1:])).T)
+    stack = MIM << pad_stack(pad_size, (gate, via), sd if cover_bottom else None)
+    stack.move(pad_center)
+    (MIM << pad_stack(pad_size, (sd,))).move(bbox(top[0]).mean(axis=0))
+    text = MIM << label(f"W/L\n{W}/{L_overlap}", layers=(gate, sd))
+    text.move((t[1, 0] - px / 2 - text.x, t[:, 1].mean() + py / 2 + 10 - text.ymin))
 
     return MIM
 
 
+@cached_cell
 def transistor(
     L_mesa: float = 8,
     L_gate: float = 2,
@@ -182,82 +215,66 @@ def transistor(
         f"TRANSISTOR({L_mesa},{L_gate},{L_overlap},{W_mesa},{W_contact})"
     )
 
-    # create transistor core
-    mesa = pg.rectangle((L_mesa, W_mesa), layer=layer_set["mesa"].gds_layer)
+    gate_layer, via_layer, sd_layer, mesa_layer = (
+        layer_set[name].gds_layer for name in ("gate", "via", "sourcedrain", "mesa")
+    )
+    px, py = pad_size
+
+    # create transistor core, centered on the channel
     if L_gate != 0:
-        gate = pg.rectangle(
-            (L_gate + 2 * L_overlap, W_mesa + 20), layer=layer_set["gate"].gds_layer
-        )
+        gate_l = L_gate + 2 * L_overlap
     else:
-        # dummy device that is used as a reference point/location
-        gate = pg.rectangle((L_mesa, W_mesa + 20), layer=layer_set["gate"].gds_layer)
-    source = pg.rectangle(
-        ((L_mesa - L_gate) / 2 + 5, W_contact), layer=layer_set["sourcedrain"].gds_layer
-    )
-    drain = pg.rectangle(
-        ((L_mesa - L_gate) / 2 + 5, W_contact), layer=layer_set["sourcedrain"].gds_layer
-    )
-    mesa.move(-mesa.center)
-    gate.move(-gate.center)
-    source.move((gate.xmin - source.xmax + L_overlap, gate.y - source.y))
-    drain.move((gate.xmax - drain.xmin - L_overlap, gate.y - drain.y))
+        # dummy gate that is used as a reference point/location
+        gate_l = L_mesa
+    gate_w = W_mesa + 20
+    sd_l = (L_mesa - L_gate) / 2 + 5
+    source_x = -gate_l / 2 + L_overlap - sd_l / 2
+    drain_x = gate_l / 2 - L_overlap + sd_l / 2
+    core = [
+        ((0, 0), (gate_l, gate_w), gate_layer),
+        ((source_x, 0), (sd_l, W_contact), sd_layer),
+        ((drain_x, 0), (sd_l, W_contact), sd_layer),
+        ((0, 0), (L_mesa, W_mesa), mesa_layer),
+    ]
+    if L_gate == 0:
+        core = core[1:]
+
+    # add pads, as references to shared pad stacks
+    gate_pad = (gate_l / 2 - px / 2, gate_w / 2 + py / 2)
+    source_pad = (source_x - sd_l / 2 - px / 2, (W_contact - py) / 2)
+    drain_pad = (drain_x + sd_l / 2 + px / 2, (W_contact - py) / 2)
+    if L_gate != 0 and cover_bottom:
+        # connector from the gate finger to the cover of the gate pad
+        core.append(((0, gate_w / 2 - 1), (L_gate + 2 * L_overlap + 2, 2), sd_layer))
+    centers, sizes, layers = zip(*core)
+    add_rectangles(TRANSISTOR, *boxes(centers, sizes).T, layers)
     if L_gate != 0:
-        TRANSISTOR << gate
-    TRANSISTOR << source
-    TRANSISTOR << drain
-    TRANSISTOR << mesa
-
-    # add pads
-    gate_pad = pg.rectangle(pad_size, layer=layer_set["gate"].gds_layer)
-    gate_via = pg.rectangle(
-        (pad_size[0], pad_size[1]), layer=layer_set["via"].gds_layer
-    )
-    if cover_bottom:
-        gate_via_cover = pg.rectangle(
-            (pad_size[0] + 2, pad_size[1] + 2), layer=layer_set["sourcedrain"].gds_layer
-        )
-        gate_via_conn = pg.rectangle(
-            (L_gate + 2 * L_overlap + 2, 2), layer=layer_set["sourcedrain"].gds_layer
+        gate_stack = TRANSISTOR << pad_stack(
+            pad_size, (gate_layer, via_layer), sd_layer if cover_bottom else None
         )
-    source_pad = pg.rectangle(pad_size, layer=layer_set["sourcedrain"].gds_layer)
-    drain_pad = pg.rectangle(pad_size, layer=layer_set["sourcedrain"].gds_layer)
-    gate_pad.move((gate.xmax - gate_pad.xmax, gate.ymax - gate_pad.ymin))
-    gate_via.move(gate_pad.center - gate_via.center)
-    source_pad.move((source.xmin - source_pad.xmax, source.ymax - source_pad.ymax))
-    drain_pad.move((drain.xmax - drain_pad.xmin, drain.ymax - drain_pad.ymax))
-    if cover_bottom:
-        gate_via_cover.move(gate_pad.center - gate_via_cover.center)
-        gate_via_conn.move((gate.x - gate_via_conn.x, gate.ymax - gate_via_conn.ymax))
-    if L_gate != 0:
-        TRANSISTOR << gate_pad
-        TRANSISTOR << gate_via
-        if cover_bottom:
-            TRANSISTOR << gate_via_cover
-            TRANSISTOR << gate_via_conn
-    TRANSISTOR << source_pad
-    TRANSISTOR << drain_pad
+        gate_stack.move(gate_pad)
+    for center in (source_pad, drain_pad):
+        (TRANSISTOR << pad_stack(pad_size, (sd_layer,))).move(center)
 
     # add text
+    text_layers = (gate_layer, sd_layer)
     if L_gate != 0:
-        text = pg.text(
-            f"W/Lg/Lov\n{W_mesa}/{L_gate}/{L_overlap}",
-            layer=layer_set["gate"].gds_layer,
+        text = TRANSISTOR << label(
+            f"W/Lg/Lov\n{W_mesa}/{L_gate}/{L_overlap}", layers=text_layers
         )
         # align to upper right corner
-        text.move((drain_pad.x - text.x, gate_pad.y - text.y))
-        TRANSISTOR << text
+        text.move((drain_pad[0] - text.x, gate_pad[1] - text.y))
     else:
-        text = pg.text(
-            f"W/L\n{W_mesa}/{L_mesa-2*L_overlap}", layer=layer_set["gate"].gds_layer
+        text = TRANSISTOR << label(
+            f"W/L\n{W_mesa}/{L_mesa-2*L_overlap}", layers=text_layers
         )
         # align to drain / mesa
-        text.move((mesa.x - text.x, drain_pad.ymax - text.ymin + 10))
-        TRANSISTOR << text
-    TRANSISTOR << pg.union(text, layer=layer_set["sourcedrain"].gds_layer)
+        text.move((-text.x, drain_pad[1] + py / 2 - text.ymin + 10))
 
     return TRANSISTOR
 
 
+@cached_cell
 def gated_vdp(
     gated: bool = True,
     rotation: float = 0,
@@ -277,10 +294,13 @@ def gated_vdp(
     Returns:
         Device: VDP structure
     """
+    from qnngds.tests import vdp
+
     VDP = Device(f"VDP({gated})")
     ito = VDP << vdp(l=2 * max(pad_size), w=10, layer=layer_set["mesa"].gds_layer)
-    pad = pg.rectangle(pad_size, layer=layer_set["sourcedrain"].gds_layer)
-    pad.move((-pad.xmin, -pad.y))
+    pad = Device("VDP_PAD")
+    stack = pad << pad_stack(pad_size, (layer_set["sourcedrain"].gds_layer,))
+    stack.move((pad_size[0] / 2, 0))
     contact = pad << pg.rectangle((20, 10), layer=layer_set["sourcedrain"].gds_layer)
     contact.move((-contact.xmax, -contact.y))
     pad.add_port(
@@ -305,32 +325,30 @@ def gated_vdp(
             l=2 * max(pad_size) + 10, w=15, layer=layer_set["gate"].gds_layer
         )
         gate.move(ito.center - gate.center)
-        gate_pad = VDP << pg.rectangle(pad_size, layer=layer_set["gate"].gds_layer)
-        gate_pad.move(
-            (pads["E1"].xmax - gate_pad.xmax, pads["S1"].ymin - gate_pad.ymin)
+        # gate pad with via and optional cover, below the east pad
+        gate_pad = (
+            pads["E1"].xmax - pad_size[0] / 2,
+            pads["S1"].ymin + pad_size[1] / 2,
         )
-        via = VDP << pg.rectangle(
-            (pad_size[0], pad_size[1]), layer=layer_set["via"].gds_layer
+        stack = VDP << pad_stack(
+            pad_size,
+            (layer_set["gate"].gds_layer, layer_set["via"].gds_layer),
+            layer_set["sourcedrain"].gds_layer if cover_bottom else None,
         )
-        via.move(gate_pad.center - via.center)
-        if cover_bottom:
-            via_cover = VDP << pg.rectangle(
-                (pad_size[0] + 2, pad_size[1] + 2),
-                layer=layer_set["sourcedrain"].gds_layer,
-            )
-            via_cover.move(via.center - via_cover.center)
+        stack.move(gate_pad)
         gate_contact = VDP << pg.rectangle(
             ((VDP.xsize - max(pad_size)) / 2**0.5, 10),
             layer=layer_set["gate"].gds_layer,
         )
         gate_contact.rotate(-45)
         gate_contact.move(
-            (gate_pad.x - gate_contact.xmax, gate_pad.y - gate_contact.ymin)
+            (gate_pad[0] - gate_contact.xmax, gate_pad[1] - gate_contact.ymin)
         )
     VDP.rotate(rotation)
     return VDP
 
 
+@cached_cell
 def vdp_metal(
     metal_layer: str = "sourcedrain",
     rotation: float = 0,
@@ -348,6 +366,8 @@ def vdp_metal(
     Returns:
         Device: VDP structure
     """
+    from qnngds.tests import vdp
+
     VDP = Device(f"VDP({metal_layer})")
     gds_layer = layer_set[metal_layer].gds_layer
     mesa = VDP << vdp(l=2 * max(pad_size), w=10, layer=gds_layer)
@@ -364,9 +384,12 @@ def vdp_metal(
         pad_i.connect(pad_i.ports[1], mesa.ports[p])
         pads[p] = pad_i
     VDP.rotate(rotation)
+    # probe pad centers, for the device metadata (see metadata.py)
+    VDP.info["pads"] = [tuple(pads[p].center) for p in sorted(pads)]
     return VDP
 
 
+@cached_cell
 def metal_resistor(
     width: float = 5,
     squares: float = 50,
@@ -388,6 +411,8 @@ def metal_resistor(
     Returns:
         Device: meandered metal resistor
     """
+    from qnngds.devices.resistor import meander
+
     pitch = 2 * width
     max_length = np.ceil(squares / (pad_size[1] / width)) * pitch
     RESISTOR = Device(f"RESISTOR({width, squares})")
@@ -399,58 +424,62 @@ def metal_resistor(
         layer=layer_set[layer_name].gds_layer,
     )
     RESISTOR << m
-    contact = pg.rectangle(pad_size, layer=layer_set[layer_name].gds_layer)
+    contact = Device("contact")
+    contact << pad_stack(pad_size, (layer_set[layer_name].gds_layer,))
     contact.add_port(
         name=1, midpoint=(contact.xmin, contact.y), width=pad_size[1], orientation=180
     )
-    # add vias
+    # add vias, as a shared via/cover stack over each contact
     VIAS = Device("vias")
-    via = pg.rectangle((pad_size[0], pad_size[1]), layer=layer_set["via"].gds_layer)
-    if cover_bottom:
-        via_cover = pg.rectangle(
-            (pad_size[0] + 2, pad_size[1] + 2), layer=layer_set["sourcedrain"].gds_layer
-        )
-        via_conn = pg.rectangle(
-            (width + 2, 2), layer=layer_set["sourcedrain"].gds_layer
-        )
+    conn_rects = []
     for i in range(2):
         contact_i = RESISTOR << contact
         contact_i.connect(contact_i.ports[1], m.ports[i + 1])
         if layer_name == "gate":
-            via_i = VIAS << via
-            via_i.move(contact_i.center - via_i.center)
+            x, y = contact_i.center
+            stack = VIAS << pad_stack(
+                pad_size,
+                (layer_set["via"].gds_layer,),
+                layer_set["sourcedrain"].gds_layer if cover_bottom else None,
+            )
+            stack.move((x, y))
             if cover_bottom:
-                via_cover_i = VIAS << via_cover
-                via_cover_i.move(contact_i.center - via_cover_i.center)
-                via_conn_i = VIAS << via_conn
-                via_conn_i.move(
-                    (
-                        via_i.x - via_conn_i.x,
-                        contact_i.y
-                        + (-1) ** i * (-via_conn_i.ysize / 2 - pad_size[1] / 2)
-                        - via_conn_i.y,
-                    )
+                # connector from the cover to the wire, on the meander side
+                conn_y = y + (-1) ** i * (-1 - pad_size[1] / 2)
+                conn_rects.append(
+                    (x, conn_y, (width + 2, 2), layer_set["sourcedrain"].gds_layer)
                 )
-    dummy = pg.union(RESISTOR, by_layer=True)
-    dummy.add_port(
-        name=1, midpoint=(RESISTOR.x, RESISTOR.ymin), width=pad_size[1], orientation=270
-    )
-    dummy.add_port(
-        name=2, midpoint=(RESISTOR.x, RESISTOR.ymax), width=pad_size[1], orientation=90
-    )
-    sq_actual = 0.5 * (pfa.get_squares(dummy, 2)[1] + pfa.get_squares(m, 2)[1])
+    if conn_rects:
+        x, y, sizes, layers = zip(*conn_rects)
+        add_rectangles(VIAS, *boxes(np.column_stack((x, y)), sizes).T, layers)
+    sq_actual = resistor_squares(width, pitch, squares, max_length, pad_size)
+    if verify_enabled():
+        dummy = pg.union(RESISTOR, by_layer=True)
+        dummy.add_port(
+            name=1,
+            midpoint=(RESISTOR.x, RESISTOR.ymin),
+            width=pad_size[1],
+            orientation=270,
+        )
+        dummy.add_port(
+            name=2,
+            midpoint=(RESISTOR.x, RESISTOR.ymax),
+            width=pad_size[1],
+            orientation=90,
+        )
+        check_squares(sq_actual, [dummy, m], name=RESISTOR.name)
     RESISTOR << VIAS
     RESISTOR.rotate(90)
-    text = pg.text(
-        f"W/sq\n{width}/{round(sq_actual)}", layer=layer_set[layer_name].gds_layer
+    text = RESISTOR << label(
+        f"W/sq\n{width}/{round(sq_actual)}",
+        layers=(layer_set[layer_name].gds_layer, layer_set["sourcedrain"].gds_layer),
     )
     # align to drain / mesa
     text.move((RESISTOR.xmin + pad_size[1] / 2 - text.x, RESISTOR.ymax - text.ymin + 5))
-    RESISTOR << text
-    RESISTOR << pg.union(text, layer=layer_set["sourcedrain"].gds_layer)
     return RESISTOR
 
 
+@cached_cell
 def step_heights(
     layer_set: LayerSet = LayerSet(),
 ) -> Device:
@@ -462,26 +491,18 @@ def step_heights(
     Returns:
         Device: test step heights
     """
-    STEPS = Device(f"STEPS")
-    # gate
-    gs = STEPS << pg.rectangle((50, 50), layer=layer_set["gate"].gds_layer)
-    # via
-    os = STEPS << pg.rectangle((50, 50), layer=layer_set["via"].gds_layer)
-    os.move(gs.center - os.center + (100, 0))
-    # gate + via
-    gs_ox1 = STEPS << pg.rectangle((50, 50), layer=layer_set["gate"].gds_layer)
-    gs_ox2 = STEPS << pg.rectangle((60, 60), layer=layer_set["via"].gds_layer)
-    gs_ox1.move(os.center - gs_ox1.center + (100, 0))
-    gs_ox2.move(os.center - gs_ox2.center + (100, 0))
-    # source/drain
-    sd = STEPS << pg.rectangle((50, 50), layer=layer_set["sourcedrain"].gds_layer)
-    sd.move(gs.center - sd.center + (0, -100))
-    # ITO
-    ms = STEPS << pg.rectangle((50, 50), layer=layer_set["mesa"].gds_layer)
-    ms.move(sd.center - ms.center + (100, 0))
+    gate, via, sd, mesa = (
+        layer_set[name].gds_layer for name in ("gate", "via", "sourcedrain", "mesa")
+    )
+    # gate, via, gate + via in the top row, source/drain and ITO below
+    centers = [(25, 25), (125, 25), (225, 25), (225, 25), (25, -75), (125, -75)]
+    sizes = [(50, 50), (50, 50), (50, 50), (60, 60), (50, 50), (50, 50)]
+    layers = [gate, via, gate, via, sd, mesa]
+    STEPS = rectangles(np.column_stack((boxes(centers, sizes), layers)), name="STEPS")
     return STEPS
 
 
+@cached_cell
 def via_tests(
     num_vias: List[int] = [10, 20, 30],
     wire_width: float = 2,
@@ -524,6 +545,7 @@ def via_tests(
     return VIA_TEST
 
 
+@cached_cell
 def tlm(
     contact_l: float = 10,
     spacings: List[float] = [10, 10, 20, 50, 80, 100, 200],
@@ -558,6 +580,10 @@ def tlm(
         # can't have gated TLM with contacts on the same layer as gate
         return TLM
     xoff = 0
+    # (center, size, layer) of the via and pad rectangles
+    rects = []
+    # probe pad centers, for the device metadata (see metadata.py)
+    pads = []
     for n, space in enumerate(spacings):
         fp_w = space + 2 * contact_l
         w = contact_w * 1.2 + 10
@@ -575,68 +601,127 @@ def tlm(
             else:
                 fp.movey(-fp.ymin - contact_w / 2 - 5)
                 fp.movex(xoff - fp.xmin + 50)
+            # the flag of the flagpole is the pad
+            center = (
+                fp.xmax - fp_w / 2,
+                fp.ymin + pad_size[1] / 2 if i % 2 else fp.ymax - pad_size[1] / 2,
+            )
+            pads.append(center)
             if finger_layer < via_layer:
-                via = TLM << pg.rectangle(
-                    size=(contact_l, contact_w + 10), layer=via_layer
-                )
+                # via over the contact stub
                 if i % 2:
-                    via.move((fp.xmax - contact_l / 2 - via.x, -via.y))
+                    x = fp.xmax - contact_l / 2
                 else:
-                    via.move((fp.xmin + contact_l / 2 - via.x, -via.y))
+                    x = fp.xmin + contact_l / 2
+                rects.append(((x, 0), (contact_l, contact_w + 10), via_layer))
                 if pad_layer != finger_layer:
                     # add vias to lower metal pads
-                    pad_via = TLM << pg.rectangle(
-                        size=(fp_w, pad_size[1]), layer=via_layer
-                    )
-                    pad_via.movex(fp.xmax - pad_via.xmax)
-                    if i % 2:
-                        pad_via.movey(fp.ymin - pad_via.ymin)
-                    else:
-                        pad_via.movey(fp.ymax - pad_via.ymax)
+                    rects.append((center, (fp_w, pad_size[1]), via_layer))
                     if cover_bottom:
-                        top_pad = TLM << pg.rectangle(
-                            size=(fp_w + 2, pad_size[1] + 2), layer=pad_layer
-                        )
-                        top_pad.move(pad_via.center - top_pad.center)
+                        size = (fp_w + 2, pad_size[1] + 2)
+                        rects.append((center, size, pad_layer))
             xoff = fp.xmax
-        text = TLM << pg.text(str(space), layer=finger_layer)
+        text = TLM << label(
+            str(space),
+            layers=(
+                (finger_layer,) if gate_layer is None else (finger_layer, gate_layer)
+            ),
+        )
         text.move((xoff - text.xmin + 5, -w / 2 - pad_size[1] + 10 - text.ymin))
-        if gate_layer is not None:
-            TLM << pg.union(text, layer=gate_layer)
+    if rects:
+        centers, sizes, layers = zip(*rects)
+        add_rectangles(TLM, *boxes(centers, sizes).T, layers)
     # add mesa
-    mesa = pg.rectangle(size=(TLM.xsize + 50, contact_w), layer=mesa_layer)
-    mesa.move((TLM.x - mesa.x, -mesa.y))
-    # add gate
+    (xmin, ymin), (xmax, ymax) = TLM.bbox
+    x = (xmin + xmax) / 2
+    rects = [((x, 0), (xmax - xmin + 50, contact_w), mesa_layer)]
+    # add gate, with a pad above the structure and a wire connecting the two
     if gate_layer is not None:
-        gate = pg.rectangle(size=(mesa.xsize + 10, contact_w + 10), layer=gate_layer)
-        gate.move((mesa.xmin - gate.xmin - 5, -gate.y))
-        gate_pad = pg.rectangle(size=(TLM.xsize, pad_size[1]), layer=gate_layer)
-        gate_pad.move((TLM.x - gate_pad.x, TLM.ymax - gate_pad.ymin + 10))
-        gate_wire = pg.rectangle(size=(40, TLM.ysize / 2), layer=gate_layer)
-        gate_wire.move(
-            (
-                TLM.xmin + 2 * contact_l + spacings[0] + 5 - gate_wire.xmin,
-                gate.ymax - gate_wire.ymin - 10,
-            )
-        )
-        TLM << gate
-        TLM << gate_pad
-        TLM << gate_wire
-        pad_via = TLM << pg.rectangle(
-            size=(gate_pad.xsize, pad_size[1]), layer=via_layer
-        )
-        pad_via.move(gate_pad.center - pad_via.center)
+        gate_pad = (x, ymax + 10 + pad_size[1] / 2)
+        wire_h = (ymax - ymin) / 2
+        wire = (xmin + 2 * contact_l + spacings[0] + 25, contact_w / 2 - 5 + wire_h / 2)
+        rects += [
+            ((x, 0), (xmax - xmin + 60, contact_w + 10), gate_layer),
+            (gate_pad, (xmax - xmin, pad_size[1]), gate_layer),
+            (wire, (40, wire_h), gate_layer),
+            (gate_pad, (xmax - xmin, pad_size[1]), via_layer),
+        ]
         if cover_bottom:
-            top_pad = TLM << pg.rectangle(
-                size=(gate_pad.xsize + 2, pad_size[1] + 2), layer=pad_layer
-            )
-            top_pad.move(gate_pad.center - top_pad.center)
-
-    TLM << mesa
+            rects.append((gate_pad, (xmax - xmin + 2, pad_size[1] + 2), pad_layer))
+        pads.append(gate_pad)
+    centers, sizes, layers = zip(*rects)
+    add_rectangles(TLM, *boxes(centers, sizes).T, layers)
+    TLM.info["pads"] = [tuple(map(float, p)) for p in pads]
     return TLM
 
 
-def test_chip(cover_bottom: bool = True, ls: LayerSet = LayerSet()) -> Device:
+def _transistor_sweep(
+    L_ov: float,
+    W: float,
+    L_g: float,
+    cover_bottom: bool,
+    layer_set: LayerSet,
+    pad_size: Tuple[float, float],
+) -> Device:
+    """Transistor sweep cell for test_chip.
+
+    Module-level (rather than a lambda) so that it can be pickled and
+    sent to parallel_gridsweep workers.
+    """
+    return transistor(
+        L_mesa=L_ov * 2 + L_g - 1,
+        L_gate=L_g,
+        L_overlap=L_ov,
+        W_mesa=W,
+        W_contact=W + 4,
+        cover_bottom=cover_bottom,
+        layer_set=layer_set,
+        pad_size=pad_size,
+    )
+
+
+# text height of the die labels of wafer_array()
+DIE_LABEL_SIZE = 200
+
+
+def die_name(column: int, row: int, rows: int = 8) -> str:
+    """Name of a die of the wafer array: A, B, ... from the top row down,
+    1, 2, ... from the left column."""
+    return chr(0x41 + (rows - 1 - row)) + str(column + 1)
+
+
+def die_label_size(
+    ls: LayerSet, columns: int = 8, rows: int = 8
+) -> Tuple[float, float]:
+    """Size of the largest die label.
+
+    Parameters:
+        ls (LayerSet): layers
+        columns (int): number of die columns of the wafer array
+        rows (int): number of die rows of the wafer array
+
+    Returns:
+        tuple(float,float): width, height reserved for the label on each die
+    """
+    sizes = [
+        label(
+            die_name(i, j, rows), size=DIE_LABEL_SIZE, layers=(ls["gate"].gds_layer,)
+        ).size
+        for i in range(columns)
+        for j in range(rows)
+    ]
+    return tuple(np.max(sizes, axis=0))
+
+
+@bbox_cache.enabled()
+def test_chip(
+    cover_bottom: bool = True,
+    ls: LayerSet = LayerSet(),
+    processes: int = 1,
+    label_size: Tuple[float, float] = None,
+) -> Device:
+    from qnngds.tests import alignment_mark, resolution_test
+
     #### parameters to sweep ###
 
     # transistors
@@ -671,97 +756,58 @@ def test_chip(cover_bottom: bool = True, ls: LayerSet = LayerSet()) -> Device:
     sample_w = 5000
     pad_size = (100, 100)
 
-    # create alignment marks
+    # create alignment marks, keeping out the individual marks rather than
+    # their (mostly empty) bounding box
     align = alignment_mark(layers=[l.gds_layer for _, l in ls._layers.items()])
     alignment_marks = TOP << align
     alignment_marks.move((-alignment_marks.xmin, -alignment_marks.ymin))
+    plan = Floorplan(sample_w, sample_w, spacing=50)
+    for ref in align.references:
+        plan.add_keepout(
+            ref.bbox + alignment_marks.origin, f"alignment mark {ref.parent.name}"
+        )
+    blocks = []
 
-    # create lithography structures
+    # create lithography structures, LITHO stays at the origin so that the
+    # resolution tests are placed in die coordinates
     LITHO = Device("LITHO")
     resolutions = [1, 1.5, 2]
-    align_dummy = alignment_mark(
-        layers=[l.gds_layer for _, l in ls._layers.items()][:2]
-    )
-    n_shift = {"gate": 0, "via": 1, "sourcedrain": 2, "mesa": 3}
     for layer_name, layer in ls._layers.items():
         for i in range(2):
             rt = resolution_test(resolutions, inverted=i, layer=layer.gds_layer)
             rt.flatten()
             rt.move(-rt.center)
-            rt_i = LITHO << rt
-            shift_x = (
-                0
-                - rt_i.xmin
-                + i * (rt.xsize + 50)
-                + n_shift[layer_name] * (align_dummy.xsize - 50)
-                + 150
-            )
-            shift_y = (
-                3 * (align_dummy.ysize + 25)
-                - rt_i.ymin
-                + 100
-                - n_shift[layer_name] * (align_dummy.ysize + 40)
-            )
-            rt_i.move((shift_x, shift_y))
-    litho = TOP << LITHO
+            blocks.append(LITHO << rt)
+    TOP << LITHO
 
     # create VDP structures
-    # gated VDP
-    for i in range(2):
-        vdp = gated_vdp(
-            gated=True,
-            rotation=i * 45,
-            cover_bottom=cover_bottom,
-            pad_size=pad_size,
-            layer_set=ls,
-        )
-        vdp_i = TOP << vdp
-        shift_x = 0 - vdp_i.xmin + 1200 + i * (vdp_i.xsize + 50)
-        shift_y = 3 * (align_dummy.ysize + 25) - vdp_i.ymin
-        vdp_i.move((shift_x, shift_y))
-    # ungated VDP
-    for i in range(2):
-        vdp = gated_vdp(
-            gated=False,
-            rotation=i * 45,
-            cover_bottom=cover_bottom,
-            pad_size=pad_size,
-            layer_set=ls,
-        )
-        vdp_i = TOP << vdp
-        shift_x = 2400 - vdp_i.xmin
-        shift_y = align_dummy.ysize + 25 - vdp_i.ymin + i * (vdp_i.ysize + 50)
-        vdp_i.move((shift_x, shift_y))
+    for gated in (True, False):
+        for i in range(2):
+            vdp = gated_vdp(
+                gated=gated,
+                rotation=i * 45,
+                cover_bottom=cover_bottom,
+                pad_size=pad_size,
+                layer_set=ls,
+            )
+            blocks.append(TOP << vdp)
 
     # create metal VDP structures
-    top_vdp = TOP << vdp_metal(
-        metal_layer="sourcedrain",
-        rotation=45,
-        pad_size=pad_size,
-        layer_set=ls,
-    )
-    top_vdp.move(
-        (
-            2400 - top_vdp.xmin,
-            align_dummy.ysize + 25 - top_vdp.ymin + 2 * (top_vdp.ysize + 50),
+    for metal_layer in ("sourcedrain", "gate"):
+        blocks.append(
+            TOP
+            << vdp_metal(
+                metal_layer=metal_layer,
+                rotation=45,
+                pad_size=pad_size,
+                layer_set=ls,
+            )
         )
-    )
-    bot_vdp = TOP << vdp_metal(
-        metal_layer="gate",
-        rotation=45,
-        pad_size=pad_size,
-        layer_set=ls,
-    )
-    bot_vdp.move(
-        (1800 - bot_vdp.xmin, 2 * (align_dummy.ysize + 25) - bot_vdp.ymin + 180)
-    )
 
     # create step-height test structures
     sh_i = TOP << step_heights(ls)
     sh_i.rotate(90)
-    shift_x = 2200 - sh_i.xmin
-    shift_y = 2 * (align_dummy.ysize + 25) - sh_i.ymin - 50
-    sh_i.move((shift_x, shift_y))
+    blocks.append(sh_i)
 
     # create MOS CAP and MIM CAP test structures
     MOS = pg.gridsweep(
@@ -780,19 +826,12 @@ def test_chip(cover_bottom: bool = True, ls: LayerSet = LayerSet()) -> Device:
         separation=True,
         label_layer=None,
     )
-    mos = TOP << MOS
-    mim = TOP << MIM
-    mos.move((2900 - mos.xmin, -mos.ymin))
-    mim.move((2900 - mim.xmin, mos.ymax - mim.ymin + 50))
+    blocks += [TOP << MOS, TOP << MIM]
 
     # create transistors
-    TRANSISTOR = pg.gridsweep(
-        function=lambda L_ov, W, L_g: transistor(
-            L_mesa=L_ov * 2 + L_g - 1,
-            L_gate=L_g,
-            L_overlap=L_ov,
-            W_mesa=W,
-            W_contact=W + 4,
+    TRANSISTOR = parallel_gridsweep(
+        function=partial(
+            _transistor_sweep,
             cover_bottom=cover_bottom,
             layer_set=ls,
             pad_size=pad_size,
@@ -802,9 +841,9 @@ def test_chip(cover_bottom: bool = True, ls: LayerSet = LayerSet()) -> Device:
         spacing=(50, 50) if cover_bottom else (50, 51),
         separation=True,
         label_layer=None,
+        processes=processes,
     )
-    trans = TOP << TRANSISTOR
-    trans.move((sample_w / 2 - trans.x, litho.ymax + 30 - trans.ymin))
+    blocks.append(TOP << TRANSISTOR)
 
     # create ITO resistors
     RESISTOR = pg.gridsweep(
@@ -824,8 +863,7 @@ def test_chip(cover_bottom: bool = True, ls: LayerSet = LayerSet()) -> Device:
         separation=True,
         label_layer=None,
     )
-    ito_res = TOP << RESISTOR
-    ito_res.move((trans.xmin - ito_res.xmin, trans.ymax + 50 - ito_res.ymin))
+    blocks.append(TOP << RESISTOR)
 
     # create W resistors
     W_RESISTOR = pg.gridsweep(
@@ -843,8 +881,7 @@ def test_chip(cover_bottom: bool = True, ls: LayerSet = LayerSet()) -> Device:
         separation=True,
         label_layer=None,
     )
-    w_res = TOP << W_RESISTOR
-    w_res.move((trans.xmax - w_res.xmax, trans.ymin - w_res.ymax - 50))
+    blocks.append(TOP << W_RESISTOR)
 
     # create TLM
     tlm_fn = lambda gated, bot: tlm(
@@ -859,34 +896,40 @@ def test_chip(cover_bottom: bool = True, ls: LayerSet = LayerSet()) -> Device:
         cover_bottom=cover_bottom,
         pad_size=tlm_pad_size,
     )
-    tlm_1 = TOP << pg.gridsweep(
-        function=lambda bot: tlm_fn(False, bot),
-        param_x={},
-        param_y={"bot": [True, False]},
-        spacing=(50, 50),
-        separation=True,
-        label_layer=None,
-    )
-    tlm_2 = TOP << tlm_fn(True, False)
-    tlm_1.move((ito_res.xmax - tlm_1.xmin + 20, trans.ymax - tlm_1.ymin + 50))
-    tlm_2.move((tlm_1.xmax - tlm_2.xmin + 20, trans.ymax - tlm_2.ymin + 20))
+    for bot in (True, False):
+        blocks.append(TOP << tlm_fn(False, bot))
+    blocks.append(TOP << tlm_fn(True, False))
 
     # create via test structures
-    VIA_TESTS_1 = via_tests(
-        num_vias=via_counts[2:], wire_width=via_test_w, pad_size=pad_size, layer_set=ls
-    )
-    VIA_TESTS_2 = via_tests(
-        num_vias=via_counts[:2], wire_width=via_test_w, pad_size=pad_size, layer_set=ls
-    )
-    vt1 = TOP << VIA_TESTS_1
-    vt2 = TOP << VIA_TESTS_2
-    vt1.move((tlm_1.xmax - vt1.xmin + 20, tlm_2.ymax - vt1.ymin + 20))
-    vt2.move((tlm_1.xmax - vt2.xmin + 20, vt1.ymax - vt2.ymin + 20))
+    for counts in (via_counts[2:], via_counts[:2]):
+        blocks.append(
+            TOP
+            << via_tests(
+                num_vias=counts,
+                wire_width=via_test_w,
+                pad_size=pad_size,
+                layer_set=ls,
+            )
+        )
 
+    plan.pack(blocks)
+    # leave room for the die label added by wafer_array()
+    if label_size is None:
+        label_size = die_label_size(ls)
+    TOP.info["die_label"] = plan.find(label_size)
+    if TOP.info["die_label"] is None:
+        raise ValueError(f"no room for the die label in the {sample_w} um die")
+    # the design rules of the die depend on it (see drc.py)
+    TOP.info["cover_bottom"] = cover_bottom
     return TOP
 
 
-if __name__ == "__main__":
+def default_layer_set() -> LayerSet:
+    """Creates the layer set of the ITO/IGZO transistor process.
+
+    Returns:
+        LayerSet: gate, via, sourcedrain and mesa layers
+    """
     ls = LayerSet()
     ls.add_layer(
         name="gate",
@@ -916,41 +959,230 @@ if __name__ == "__main__":
         description="ito/igzo mesa",
         color=(0.6, 0.2, 0.5),
     )
-    T1 = test_chip(False, ls)
+    return ls
+
+
+@bbox_cache.enabled()
+def wafer_array(
+    ls: LayerSet = None,
+    columns: int = 8,
+    rows: int = 8,
+    stream: GdsStream = None,
+    processes: int = 1,
+) -> Device:
+    """Creates the array of test chips with die labels, alignment crosses and
+    corner squares.
+
+    Parameters:
+        ls (LayerSet): layers, defaults to default_layer_set()
+        columns (int): number of die columns
+        rows (int): number of die rows (at most 26)
+        stream (GdsStream): if given, each test chip is written as soon as
+            it is built and the array is written last, as the top cell
+        processes (int): worker processes for the transistor sweeps of the
+            test chips (see parallel_gridsweep), 1 builds them serially
+
+    Returns:
+        Device: the die array, centered on the origin
+    """
+    if ls is None:
+        ls = default_layer_set()
+    label_size = die_label_size(ls, columns, rows)
+    T1 = test_chip(False, ls, processes=processes, label_size=label_size)
+    if stream is not None:
+        stream.write(T1)
     # T1 = test_chip(True, ls)
-    T2 = test_chip(True, ls)
+    T2 = test_chip(True, ls, processes=processes, label_size=label_size)
+    if stream is not None:
+        stream.write(T2)
     # array
     A = Device("array")
-    for i in range(8):
-        for j in range(8):
-            ij = A << (T1 if j % 2 == 0 else T2)
-            ij.move(-ij.center)
-            ij.movey(0 if j % 2 == 0 else 0.5)
-            ij.move((7000 * i, 7000 * j))
-            label = A << pg.text(
-                text=chr(0x41 + (7 - j)) + str(i + 1),
-                size=200,
-                layer=ls["gate"].gds_layer,
+    for n, T in enumerate((T1, T2)):
+        # T1 on even rows, T2 on odd rows (shifted up by 0.5)
+        place_array(
+            A,
+            T,
+            [
+                (7000 * i - T.x, 7000 * j + 0.5 * n - T.y)
+                for i in range(columns)
+                for j in range(n, rows, 2)
+            ],
+        )
+    for i in range(columns):
+        for j in range(rows):
+            T = T1 if j % 2 == 0 else T2
+            die_label = A << label(
+                die_name(i, j, rows),
+                size=DIE_LABEL_SIZE,
+                layers=(ls["gate"].gds_layer,),
+            )
+            # lower left corner of the die, plus the slot left by test_chip()
+            die_label.move(
+                (
+                    7000 * i - T.xsize / 2 - die_label.xmin,
+                    7000 * j + 0.5 * (j % 2) - T.ysize / 2 - die_label.ymin,
+                )
+            )
+            die_label.move(np.subtract(T.info["die_label"], T.bbox[0]))
+    shift = -A.center
+    A.move(shift)
+    # die outlines, to look up the die of a structure (see metadata.py)
+    A.info["dies"] = {}
+    for i in range(columns):
+        for j in range(rows):
+            T = T1 if j % 2 == 0 else T2
+            center = np.array((7000 * i, 7000 * j + 0.5 * (j % 2))) + shift
+            A.info["dies"][die_name(i, j, rows)] = tuple(
+                (np.ravel(T.bbox) - np.tile(T.center - center, 2)).tolist()
             )
-            label.move((ij.xmin - label.xmin, ij.ymin - label.ymin))
-            label.move((1750, 1050))
-    A.move(-A.center)
     X = pg.cross(length=100, width=2, layer=ls["gate"].gds_layer)
-    for i in range(2):
-        for j in range(2):
-            x = A << X
-            x.move((27200 * (-1) ** i, 27200 * (-1) ** j))
-    for _, l in ls._layers.items():
+    corners = [((-1) ** i, (-1) ** j) for i in range(2) for j in range(2)]
+    # half the die pitch span, plus the margin of the 8x8 array
+    half = 7000 * (np.array([columns, rows]) - 1) / 2
+    place_array(
+        A, X, [((half[0] + 2700) * x, (half[1] + 2700) * y) for x, y in corners]
+    )
+    for name, l in ls._layers.items():
+        # one square per layer, stacked (see connectivity.STACKED_CELLS)
         C = pg.rectangle(size=(10, 10), layer=l.gds_layer)
-        for i in range(2):
-            for j in range(2):
-                c = A << C
-                c.move((27295 * (-1) ** i - c.x, 27295 * (-1) ** j - c.y))
-    A.write_gds(
-        "ito_test.gds",
-        unit=1e-6,
-        precision=1e-9,
-        auto_rename=True,
-        max_cellname_length=28,
-        cellname="top",
+        C.name = f"CORNER({name})"
+        place_array(
+            A,
+            C,
+            [
+                ((half[0] + 2795) * x - C.x, (half[1] + 2795) * y - C.y)
+                for x, y in corners
+            ],
+        )
+    if stream is not None:
+        stream.write(A, top=True)
+    return A
+
+
+def quickplot(D: Device) -> None:
+    """Shows D with phidl's quickplot.
+
+    Parameters:
+        D (Device): device to show
+    """
+    from phidl import quickplot as qp
+    from phidl import set_quickplot_options
+
+    set_quickplot_options(blocking=True)
+    qp(D)
+
+
+# output formats of build(), by file extension
+FORMATS = ("gds", "gds.gz", "oas")
+
+
+@bbox_cache.enabled()
+def build(
+    outfile: str = "ito_test.gds",
+    use_store: bool = True,
+    show: bool = False,
+    preview: str = None,
+    preview_width: int = 2048,
+    metadata: bool = True,
+    format: str = "gds",
+    processes: int = 1,
+) -> Device:
+    """Builds the wafer array and writes it to outfile.
+
+    Parameters:
+        outfile (str): layout file to write
+        use_store (bool): if True, reuse unchanged cells from previous builds
+        show (bool): if True, show the array with quickplot when done
+        preview (str): if given, PNG file to render the array to
+        preview_width (int): width of the preview in pixels
+        metadata (bool): if True, also write the device metadata sidecar
+            (outfile with the extension .npz, see metadata.py)
+        format (str): one of FORMATS: GDSII, gzip-compressed GDSII (both
+            streamed as the test chips are built) or OASIS (written when the
+            array is complete, see oasis.py)
+        processes (int): worker processes for the transistor sweeps
+
+    Returns:
+        Device: the wafer array
+    """
+    if format not in FORMATS:
+        raise ValueError(f"unknown format {format!r}, expected one of {FORMATS}")
+    ls = default_layer_set()
+    if use_store:
+        CELL_CACHE.store = CellStore()
+    timestamp = build_timestamp()
+    if format == "oas":
+        import oasis
+
+        A = wafer_array(ls, processes=processes)
+        oasis.write_oas(A, outfile, cellname="top")
+    else:
+        # the test chips are written as soon as they are built, under hashed
+        # cell names and with a fixed timestamp so that rebuilds are identical
+        with contextlib.ExitStack() as stack:
+            f = outfile
+            if format == "gds.gz":
+                f = stack.enter_context(
+                    gzip.GzipFile(outfile, "wb", mtime=timestamp.timestamp())
+                )
+            stream = stack.enter_context(
+                GdsStream(f, cellname="top", timestamp=timestamp)
+            )
+            A = wafer_array(ls, stream=stream, processes=processes)
+    if use_store:
+        print(CELL_CACHE.store.report())
+    if metadata:
+        import metadata as md
+
+        if outfile.endswith("." + format):
+            base = outfile[: -len(format) - 1]
+        else:
+            base = os.path.splitext(outfile)[0]
+        md.write(base + ".npz", md.collect(A))
+    if preview is not None:
+        import preview as pv
+
+        pv.preview(A, preview, preview_width, ls)
+    if show:
+        quickplot(A)
+    return A
+
+
+def main(argv: List[str] = None) -> None:
+    """Command line entry point of make_gds.py and build.py."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Builds the ITO test wafer.")
+    parser.add_argument("-o", "--output", help="defaults to ito_test.<format>")
+    parser.add_argument("--format", choices=FORMATS, default="gds")
+    parser.add_argument(
+        "-j",
+        "--processes",
+        type=int,
+        default=1,
+        help="worker processes for the transistor sweeps",
+    )
+    parser.add_argument(
+        "--no-store", action="store_true", help="do not reuse cells of earlier builds"
+    )
+    parser.add_argument("--show", action="store_true", help="quickplot the result")
+    parser.add_argument("--preview", help="also render the result to this PNG file")
+    parser.add_argument("--preview-width", type=int, default=2048)
+    parser.add_argument(
+        "--no-metadata", action="store_true", help="do not write the .npz sidecar"
     )
+    args = parser.parse_args(argv)
+    build(
+        args.output or f"ito_test.{args.format}",
+        use_store=not args.no_store,
+        show=args.show,
+        preview=args.preview,
+        preview_width=args.preview_width,
+        metadata=not args.no_metadata,
+        format=args.format,
+        processes=args.processes,
+    )
+
+
+if __name__ == "__main__":
+    main()
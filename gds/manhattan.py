@@ -0,0 +1,439 @@
+"""Boolean operations specialized for Manhattan (axis-parallel) geometry.
+
+Nearly all polygons of the layout are rectangles or rectilinear polygons,
+for which a general polygon clipper does much more work than needed. Here
+both operands are reduced to bands: a rectangle is one band of weight 1, a
+vertical edge of a rectilinear polygon is a band from the edge to the right
+end of its polygon, weighted +1 or -1 by its direction. The x axis is cut
+into slabs at every band end and each band is split into the slabs it
+spans. Sorting the band ends of every slab by y and summing their weights
+(a scanline along each slab) gives the winding number of both operands
+along the slab, the operation is applied to the runs between band ends, and
+the runs that are inside are merged with equal runs of the neighbouring
+slabs into disjoint rectangles. Groups of polygons that are separated from
+the others by straight cuts along gaps (devices, rows of devices) get slabs
+of their own, so that a band only spans the slabs of its neighbours. All of
+this is a handful of vectorized sorts and cumulative sums.
+
+boolean() and offset() take the same arguments as gdspy.boolean() and
+gdspy.offset() and return a Rectangles polygon set. They fall back to gdspy
+when an operand has a non-axis-parallel edge (label glyphs, the VDPs
+rotated by 45 degrees), when an offset uses round or bevel joins, and for
+small inputs (fewer than MIN_VERTICES vertices), which the compiled clipper
+of gdspy handles faster than the fixed overhead of the array operations
+here. Like gdspy, every polygon is filled whatever its orientation.
+
+Results are split into rectangles rather than merged outlines; regions()
+groups them back into connected regions.
+"""
+
+from typing import List, NamedTuple, Optional, Tuple
+
+import gdspy
+import numpy as np
+
+# smaller inputs go to gdspy (see benchmark.py --booleans)
+MIN_VERTICES = 2000
+# largest number of (band, slab) pairs handled without falling back to gdspy
+MAX_PAIRS = 2**24
+
+_OPERATIONS = {
+    "or": np.logical_or,
+    "and": np.logical_and,
+    "xor": np.logical_xor,
+    "not": lambda a, b: a & ~b,
+}
+
+
+class Rectangles(gdspy.PolygonSet):
+    """Polygon set of disjoint rectangles; the polygons are only built when
+    they are first used.
+
+    Parameters:
+        rects (np.ndarray): (N, 4) array of xmin, ymin, xmax, ymax
+    """
+
+    def __init__(self, rects: np.ndarray):
+        self.rects = rects
+        self._polygons = None
+        self.layers = [0] * len(rects)
+        self.datatypes = [0] * len(rects)
+        self.properties = {}
+
+    @property
+    def polygons(self) -> List[np.ndarray]:
+        if self._polygons is None:
+            corners = self.rects[:, [0, 1, 2, 1, 2, 3, 0, 3]]
+            self._polygons = list(corners.reshape(-1, 4, 2))
+        return self._polygons
+
+    @polygons.setter
+    def polygons(self, polygons: List[np.ndarray]) -> None:
+        self._polygons = polygons
+
+
+class _Bands(NamedTuple):
+    """Weighted bands x0 <= x < x1, y0 <= y < y1, in units of the precision,
+    and the bounding box of the polygon each band belongs to."""
+
+    x0: np.ndarray
+    x1: np.ndarray
+    y0: np.ndarray
+    y1: np.ndarray
+    weight: np.ndarray
+    owner: np.ndarray
+    boxes: np.ndarray
+
+
+def _polygons(operand) -> List[np.ndarray]:
+    """Polygons of a gdspy boolean operand."""
+    if operand is None:
+        return []
+    if isinstance(operand, gdspy.PolygonSet):
+        return operand.polygons
+    if isinstance(operand, np.ndarray) and operand.ndim == 2:
+        return [operand]
+    if hasattr(operand, "get_polygons"):
+        return operand.get_polygons()
+    polygons = []
+    for p in operand:
+        polygons += _polygons(p)
+    return polygons
+
+
+def _bands(operand, precision: float) -> Optional[_Bands]:
+    """Bands of operand, or None if an edge is neither vertical nor
+    horizontal."""
+    if isinstance(operand, Rectangles):
+        r = np.round(operand.rects / precision).astype(np.int64)
+        n = len(r)
+        ones = np.ones(n, dtype=int)
+        return _Bands(r[:, 0], r[:, 2], r[:, 1], r[:, 3], ones, np.arange(n), r)
+    polygons = _polygons(operand)
+    if not polygons:
+        empty = np.zeros(0, np.int64)
+        return _Bands(*(empty,) * 6, np.zeros((0, 4), np.int64))
+    p = np.round(np.concatenate(polygons) / precision).astype(np.int64)
+    lengths = np.array([len(q) for q in polygons])
+    starts = np.cumsum(lengths) - lengths
+    # next vertex within each polygon
+    nxt = np.arange(len(p)) + 1
+    nxt[starts + lengths - 1] = starts
+    q = p[nxt]
+    vertical = p[:, 0] == q[:, 0]
+    if not np.all(vertical | (p[:, 1] == q[:, 1])):
+        return None
+    boxes = np.column_stack(
+        (
+            np.minimum.reduceat(p, starts),
+            np.maximum.reduceat(p, starts),
+        )
+    )
+    owner = np.repeat(np.arange(len(polygons)), lengths)
+    # every polygon counts positively whatever its orientation
+    cross = p[:, 0] * q[:, 1] - p[:, 1] * q[:, 0]
+    sign = np.sign(np.add.reduceat(cross, starts))[owner]
+    # the winding of a polygon is zero right of it
+    right = boxes[owner, 2]
+    keep = vertical & (p[:, 1] != q[:, 1]) & (p[:, 0] < right)
+    p, q = p[keep], q[keep]
+    # a downward edge is the left side of a counterclockwise polygon
+    weight = np.where(q[:, 1] < p[:, 1], 1, -1) * sign[keep]
+    y0 = np.minimum(p[:, 1], q[:, 1])
+    y1 = np.maximum(p[:, 1], q[:, 1])
+    return _Bands(p[:, 0], right[keep], y0, y1, weight, owner[keep], boxes)
+
+
+def _clusters(boxes: np.ndarray, rounds: int = 8) -> np.ndarray:
+    """Groups boxes that cannot be separated by cuts along gaps between them,
+    alternately in x and y.
+
+    Returns:
+        np.ndarray: group of every box, numbered in order of position
+    """
+    group = np.zeros(len(boxes), dtype=np.int64)
+    if len(boxes) < 2:
+        return group
+    n = 1
+    for _ in range(rounds):
+        before = n
+        for axis in (0, 1):
+            lo, hi = boxes[:, axis], boxes[:, axis + 2]
+            # offsetting each group keeps the running maximum within it
+            offset = group * (hi.max() - lo.min() + 1) - lo.min()
+            start = lo + offset
+            order = np.argsort(start)
+            start = start[order]
+            reach = np.maximum.accumulate((hi + offset)[order])
+            new = np.ones(len(boxes), dtype=bool)
+            new[1:] = start[1:] >= reach[:-1]
+            group[order] = np.cumsum(new) - 1
+            n = int(new.sum())
+        if n == before:
+            break
+    return group
+
+
+def _runs(new: np.ndarray):
+    """First and last index of each run of a sequence, given where runs
+    start."""
+    start = np.nonzero(new)[0]
+    return start, np.append(start[1:], len(new)) - 1
+
+
+def _boolean(a: _Bands, b: _Bands, operation: str, precision: float):
+    """Manhattan boolean of two band sets, None if the result is empty, or
+    False if it is too large."""
+    na = len(a.x0)
+    if na + len(b.x0) == 0:
+        return None
+    # the slabs of every cluster are separate, so that a band only spans
+    # the slabs of the polygons near it
+    boxes = np.concatenate((a.boxes, b.boxes))
+    cluster = _clusters(boxes)[np.concatenate((a.owner, b.owner + len(a.boxes)))]
+    xmin, ymin = boxes[:, :2].min(axis=0)
+    xmax, ymax = boxes[:, 2:].max(axis=0)
+    stride = xmax - xmin + 1
+    if (cluster.max() + 1) * stride >= 2**62:
+        return False
+    key = cluster * stride - xmin
+    x0 = np.concatenate((a.x0, b.x0)) + key
+    x1 = np.concatenate((a.x1, b.x1)) + key
+    xs = np.sort(np.concatenate((x0, x1)))
+    xs = xs[np.diff(xs, prepend=xs[0] - 1) != 0]
+    # split every band into the slabs it spans
+    first = np.searchsorted(xs, x0)
+    count = np.searchsorted(xs, x1) - first
+    n = int(count.sum())
+    if n == 0:
+        return None
+    if n > MAX_PAIRS or len(xs) * (ymax - ymin + 1) >= 2**62:
+        return False
+    band = np.repeat(np.arange(len(x0)), count)
+    slab = first[band] + np.arange(n) - np.repeat(np.cumsum(count) - count, count)
+    # band ends along each slab, and the winding changes of both operands
+    y = np.concatenate((a.y0, b.y0, a.y1, b.y1))
+    weight = np.concatenate((a.weight, b.weight, -a.weight, -b.weight))
+    ends = np.concatenate((band, band + len(x0)))
+    slab = np.tile(slab, 2)
+    order = np.argsort(slab * (ymax - ymin + 1) + (y[ends] - ymin))
+    ends, slab = ends[order], slab[order]
+    y, w = y[ends], weight[ends]
+    in_a = ends % len(x0) < na
+    # the weights of every slab sum to zero, so one cumulative sum serves
+    # all slabs
+    wa = np.cumsum(np.where(in_a, w, 0))
+    wb = np.cumsum(np.where(in_a, 0, w))
+    # run k extends from end k to end k + 1 of the same slab
+    inside = _OPERATIONS[operation](wa[:-1] != 0, wb[:-1] != 0)
+    inside &= (slab[1:] == slab[:-1]) & (y[1:] > y[:-1])
+    k = np.nonzero(inside)[0]
+    if len(k) == 0:
+        return None
+    slab, y0, y1 = slab[k], y[k], y[k + 1]
+    # join runs that continue each other along a slab
+    new = np.ones(len(k), dtype=bool)
+    new[1:] = (slab[1:] != slab[:-1]) | (y0[1:] != y1[:-1])
+    start, end = _runs(new)
+    slab, y0, y1 = slab[start], y0[start], y1[end]
+    # and equal runs of neighbouring slabs (of the same cluster: between
+    # clusters there is always a slab without bands)
+    order = np.lexsort((slab, y1, y0))
+    slab, y0, y1 = slab[order], y0[order], y1[order]
+    new = np.ones(len(slab), dtype=bool)
+    new[1:] = (y0[1:] != y0[:-1]) | (y1[1:] != y1[:-1]) | (slab[1:] != slab[:-1] + 1)
+    start, end = _runs(new)
+    x = xs % stride + xmin
+    rects = np.column_stack((x[slab[start]], y0[start], x[slab[end] + 1], y1[start]))
+    return Rectangles(rects * precision)
+
+
+def _size(operand) -> int:
+    """Number of vertices of operand."""
+    if isinstance(operand, Rectangles):
+        return 4 * len(operand.rects)
+    return sum(len(p) for p in _polygons(operand))
+
+
+def _fast(operand1, operand2, operation: str, precision: float):
+    """The Manhattan boolean, or False if it does not apply."""
+    a = _bands(operand1, precision)
+    b = _bands(operand2, precision) if a is not None else None
+    if b is None:
+        return False
+    return _boolean(a, b, operation, precision)
+
+
+def is_manhattan(operand, precision: float = 1e-3) -> bool:
+    """True if every edge of operand is vertical or horizontal (on the
+    precision grid)."""
+    return _bands(operand, precision) is not None
+
+
+def boolean(operand1, operand2, operation: str, precision: float = 1e-3, **kwargs):
+    """Drop-in for gdspy.boolean() with a Manhattan fast path.
+
+    Parameters:
+        operand1, operand2: polygons, polygon sets, lists of them, or None
+        operation (str): "or", "and", "xor" or "not"
+        precision (float): coordinates are snapped to this grid
+        kwargs: passed to gdspy.boolean() (layer, datatype, max_points) on
+            the fallback path
+
+    Returns:
+        Rectangles, gdspy.PolygonSet or None: the result, None if empty
+    """
+    if _size(operand1) + _size(operand2) >= MIN_VERTICES:
+        result = _fast(operand1, operand2, operation, precision)
+        if result is not False:
+            return result
+    return gdspy.boolean(operand1, operand2, operation, precision=precision, **kwargs)
+
+
+def _grow(rects: np.ndarray, distance: float) -> Rectangles:
+    return Rectangles(rects + (-distance, -distance, distance, distance))
+
+
+def _offset(rects: np.ndarray, distance: float, precision: float):
+    """Miter offset of a union of rectangles, or False if it is too large."""
+    if distance >= 0:
+        return _fast(_grow(rects, distance), None, "or", precision)
+    # shrinking is growing the complement, within a frame around every
+    # cluster of rectangles
+    group = _clusters(rects)
+    order = np.argsort(group, kind="stable")
+    starts = np.nonzero(np.diff(group[order], prepend=-1))[0]
+    frames = np.column_stack(
+        (
+            np.minimum.reduceat(rects[order, :2], starts),
+            np.maximum.reduceat(rects[order, 2:], starts),
+        )
+    )
+    outside = _fast(_grow(frames, -2 * distance), Rectangles(rects), "not", precision)
+    if not outside:
+        return outside
+    return _fast(Rectangles(rects), _grow(outside.rects, -distance), "not", precision)
+
+
+def offset(
+    polygons,
+    distance: float,
+    join: str = "miter",
+    tolerance: float = 2,
+    precision: float = 1e-3,
+    join_first: bool = False,
+    **kwargs,
+):
+    """Drop-in for gdspy.offset() with a Manhattan fast path.
+
+    With miter joins the offset of a Manhattan region is exact: growing is
+    the union of the grown rectangles, shrinking is growing the complement.
+    The fast path always merges the input first (join_first=True).
+
+    Parameters:
+        polygons: polygons, polygon sets, lists of them, or None
+        distance (float): offset distance, negative to shrink
+        join (str): "miter" uses the fast path; other joins use gdspy
+        tolerance (float): miter limit (at least sqrt(2) for square
+            corners)
+        precision (float): coordinates are snapped to this grid
+        join_first (bool): passed to gdspy on the fallback path
+        kwargs: passed to gdspy.offset() on the fallback path
+
+    Returns:
+        Rectangles, gdspy.PolygonSet or None: the result, None if empty
+    """
+    if join == "miter" and tolerance >= 2**0.5 and _size(polygons) >= MIN_VERTICES:
+        # results of this module are merged already
+        merged = polygons
+        if not isinstance(polygons, Rectangles):
+            merged = _fast(polygons, None, "or", precision)
+        if merged is None:
+            return None
+        if merged is not False:
+            result = _offset(merged.rects, distance, precision)
+            if result is not False:
+                return result
+    return gdspy.offset(
+        polygons,
+        distance,
+        join=join,
+        tolerance=tolerance,
+        precision=precision,
+        join_first=join_first,
+        **kwargs,
+    )
+
+
+def _area(p: np.ndarray) -> float:
+    return 0.5 * abs(
+        np.dot(p[:, 0], np.roll(p[:, 1], 1)) - np.dot(p[:, 1], np.roll(p[:, 0], 1))
+    )
+
+
+def regions(polygons) -> List[Tuple[np.ndarray, float, float]]:
+    """Connected regions of a boolean or offset result.
+
+    The rectangles of a Rectangles set are grouped where they share an edge
+    (not only a corner); the polygons of any other set are taken one by
+    one.
+
+    Parameters:
+        polygons (Rectangles, gdspy.PolygonSet or None): the result
+
+    Returns:
+        List[tuple]: bbox (xmin, ymin, xmax, ymax), area and perimeter of
+        each region
+    """
+    if polygons is None:
+        return []
+    if not isinstance(polygons, Rectangles):
+        return [
+            (
+                np.concatenate((p.min(axis=0), p.max(axis=0))),
+                _area(p),
+                float(np.sum(np.hypot(*(p - np.roll(p, 1, axis=0)).T))),
+            )
+            for p in polygons.polygons
+        ]
+    # drc uses this module
+    from drc import GridIndex
+
+    r = polygons.rects
+    size = r[:, 2:] - r[:, :2]
+    parent = np.arange(len(r))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    shared = np.zeros(len(r))
+    index = GridIndex(r, max(float(np.median(size.max(axis=1))), 1e-9))
+    for i, box in enumerate(r):
+        for j in index.query(box):
+            if j <= i:
+                continue
+            # rectangles are disjoint, so overlapping boxes share an edge
+            # segment (or a corner, of length 0)
+            dx = min(box[2], r[j, 2]) - max(box[0], r[j, 0])
+            dy = min(box[3], r[j, 3]) - max(box[1], r[j, 1])
+            length = max(dx, dy)
+            if length > 0:
+                shared[i] += length
+                shared[j] += length
+                parent[find(j)] = find(i)
+    roots = np.array([find(i) for i in range(len(r))])
+    order = np.argsort(roots, kind="stable")
+    starts = np.nonzero(np.diff(roots[order], prepend=-1))[0]
+    r, size, shared = r[order], size[order], shared[order]
+    lo = np.minimum.reduceat(r[:, :2], starts)
+    hi = np.maximum.reduceat(r[:, 2:], starts)
+    area = np.add.reduceat(size[:, 0] * size[:, 1], starts)
+    # every shared segment is counted once for each of its two sides
+    perimeter = np.add.reduceat(2 * size.sum(axis=1) - shared, starts)
+    return [
+        (np.concatenate(box), float(a), float(p))
+        for *box, a, p in zip(lo, hi, area, perimeter)
+    ]
@@ -0,0 +1,252 @@
+"""Device metadata sidecar.
+
+Every placed test structure (a placement of a factory cell, see
+cached_cell, which records the factory and its arguments in Device.info)
+becomes one row with its die, factory, parameters and the centers of its
+probe pads, in the coordinates of the layout. Pads are the pad stacks a
+structure places and the pads its factory lists in Device.info["pads"].
+
+The columns are written to an .npz file next to the GDS file; the pads of
+row i are pad_x[pad_offsets[i]:pad_offsets[i + 1]] (and pad_y), ordered
+top to bottom, left to right. Scalar parameters (W_mesa, L_gate, squares,
+...) also get a column of their own, NaN for factories without them; all
+parameters, including lists such as the TLM spacings, are in the
+parameters column as JSON.
+
+    table = DeviceTable.load("ito_test.npz")
+    for i in table.select(die="A1", factory="transistor"):
+        row = table.row(i)
+        row["parameters"]["L_gate"], row["pads"]
+
+    python metadata.py ito_test.npz --die A1 --factory tlm
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+from phidl import Device
+
+from connectivity import PAD_CELLS, _box, _placements
+
+# factories whose cells are parts of test structures rather than structures
+PARTS = ("pad_stack", "glyphs", "_label")
+
+# columns that are not parameters
+FIXED = (
+    "die",
+    "factory",
+    "cell",
+    "x",
+    "y",
+    "orientation",
+    "x_reflection",
+    "parameters",
+    "pad_offsets",
+    "pad_x",
+    "pad_y",
+)
+
+
+def _find(
+    D: Device, match: Callable[[Device], bool], memo: Dict[int, list]
+) -> List[Tuple[Device, np.ndarray, np.ndarray]]:
+    """Placements (cell, linear part, translation) of the cells below D for
+    which match is True, without looking inside them; each cell is visited
+    once."""
+    if id(D) in memo:
+        return memo[id(D)]
+    found = []
+    for ref in D.references:
+        child = ref.parent
+        if match(child):
+            found += [(child, M, t) for M, t in _placements(ref)]
+            continue
+        sub = _find(child, match, memo)
+        for M, t in _placements(ref):
+            found += [(c, M @ M2, M @ t2 + t) for c, M2, t2 in sub]
+    memo[id(D)] = found
+    return found
+
+
+def _plain(value: Any) -> Any:
+    """JSON fallback for numpy values and other objects."""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return str(value)
+
+
+def collect(D: Device, parts: Tuple[str, ...] = PARTS) -> Dict[str, np.ndarray]:
+    """Collects one row per test structure placed in D.
+
+    Parameters:
+        D (Device): layout, e.g. the wafer array; the die of a structure is
+            looked up in D.info["dies"] (name: xmin, ymin, xmax, ymax) when
+            present
+        parts (Tuple[str]): factories whose cells are not structures
+
+    Returns:
+        dict: column name to array
+    """
+
+    def is_device(cell):
+        factory = cell.info.get("factory")
+        return factory is not None and factory not in parts
+
+    if is_device(D):
+        devices = [(D, np.eye(2), np.zeros(2))]
+    else:
+        devices = _find(D, is_device, {})
+    memo = {}
+
+    def pads(cell) -> np.ndarray:
+        """Pad centers of cell, in its coordinates: the pad stacks it places
+        and the pads recorded in Device.info["pads"] by factories that draw
+        their pads themselves."""
+        if id(cell) in memo:
+            return memo[id(cell)]
+        if cell.name.startswith(PAD_CELLS):
+            centers = [np.ravel(cell.bbox).reshape(2, 2).mean(axis=0)]
+        else:
+            centers = [np.reshape(cell.info.get("pads", []), (-1, 2))]
+            for ref in cell.references:
+                sub = pads(ref.parent)
+                centers += [sub @ M.T + t for M, t in _placements(ref) if len(sub)]
+        centers = np.unique(np.round(np.vstack(centers), 3), axis=0)
+        memo[id(cell)] = centers[np.lexsort((centers[:, 0], -centers[:, 1]))]
+        return memo[id(cell)]
+
+    n = len(devices)
+    centers = np.zeros((n, 2))
+    orientation = np.zeros(n)
+    x_reflection = np.zeros(n, dtype=bool)
+    pad_points = []
+    for k, (cell, M, t) in enumerate(devices):
+        centers[k] = _box(np.ravel(cell.bbox), M, t).reshape(2, 2).mean(axis=0)
+        orientation[k] = np.degrees(np.arctan2(M[1, 0], M[0, 0])) % 360
+        x_reflection[k] = np.linalg.det(M) < 0
+        pad_points.append(pads(cell) @ M.T + t)
+    lengths = [len(p) for p in pad_points]
+    points = np.concatenate(pad_points) if n else np.zeros((0, 2))
+
+    die = np.full(n, "", dtype=object)
+    dies = D.info.get("dies", {})
+    if dies and n:
+        names = list(dies)
+        boxes = np.array([dies[name] for name in names])
+        inside = (
+            (centers[:, None, 0] >= boxes[None, :, 0])
+            & (centers[:, None, 0] <= boxes[None, :, 2])
+            & (centers[:, None, 1] >= boxes[None, :, 1])
+            & (centers[:, None, 1] <= boxes[None, :, 3])
+        )
+        found = inside.any(axis=1)
+        die[found] = np.array(names)[inside.argmax(axis=1)[found]]
+
+    parameters = [cell.info["parameters"] for cell, _, _ in devices]
+    columns = {
+        "die": die.astype(str),
+        "factory": np.array([c.info["factory"] for c, _, _ in devices], dtype=str),
+        "cell": np.array([c.name for c, _, _ in devices], dtype=str),
+        "x": centers[:, 0],
+        "y": centers[:, 1],
+        "orientation": np.round(orientation, 9),
+        "x_reflection": x_reflection,
+        "parameters": np.array(
+            [json.dumps(p, sort_keys=True, default=_plain) for p in parameters],
+            dtype=str,
+        ),
+        "pad_offsets": np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+        "pad_x": points[:, 0],
+        "pad_y": points[:, 1],
+    }
+    scalars = {}
+    for k, p in enumerate(parameters):
+        for name, value in p.items():
+            if name in FIXED or not isinstance(value, (int, float, np.number)):
+                continue
+            scalars.setdefault(name, np.full(n, np.nan))[k] = value
+    columns.update(sorted(scalars.items()))
+    return columns
+
+
+def write(filename: str, columns: Dict[str, np.ndarray]) -> None:
+    """Writes the columns from collect() to a compressed .npz file.
+
+    Parameters:
+        filename (str): file to write
+        columns (dict): column name to array
+    """
+    np.savez_compressed(filename, **columns)
+
+
+class DeviceTable:
+    """Device metadata indexed by die and factory.
+
+    Parameters:
+        columns (dict): column name to array, as returned by collect()
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+        index = {}
+        for i, (die, factory) in enumerate(zip(columns["die"], columns["factory"])):
+            for key in ((die, factory), (die, None), (None, factory)):
+                index.setdefault(key, []).append(i)
+        self._index = {key: np.array(rows) for key, rows in index.items()}
+
+    @classmethod
+    def load(cls, filename: str) -> "DeviceTable":
+        """Reads a sidecar written by write()."""
+        with np.load(filename) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def __len__(self) -> int:
+        return len(self.columns["die"])
+
+    def select(self, die: str = None, factory: str = None) -> np.ndarray:
+        """Rows of the structures on die made by factory.
+
+        Parameters:
+            die (str or None): die name, e.g. "A1"; None for all dies
+            factory (str or None): factory name, e.g. "transistor"; None for
+                all factories
+
+        Returns:
+            np.ndarray: row indices, in placement order
+        """
+        if die is None and factory is None:
+            return np.arange(len(self))
+        return self._index.get((die, factory), np.zeros(0, dtype=int))
+
+    def row(self, i: int) -> Dict[str, Any]:
+        """Values of row i, with the parameters decoded and the pads as an
+        array of shape (N, 2)."""
+        c = self.columns
+        start, end = c["pad_offsets"][i], c["pad_offsets"][i + 1]
+        ragged = ("parameters", "pad_offsets", "pad_x", "pad_y")
+        row = {name: c[name][i] for name in c if name not in ragged}
+        row["parameters"] = json.loads(str(c["parameters"][i]))
+        row["pads"] = np.column_stack((c["pad_x"][start:end], c["pad_y"][start:end]))
+        return row
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sidecar", help=".npz file written by the build")
+    parser.add_argument("--die", help="only structures on this die, e.g. A1")
+    parser.add_argument("--factory", help="only structures made by this factory")
+    args = parser.parse_args()
+
+    table = DeviceTable.load(args.sidecar)
+    rows = table.select(args.die, args.factory)
+    for i in rows:
+        row = table.row(i)
+        pads = "  ".join(f"({x:.1f}, {y:.1f})" for x, y in row["pads"])
+        print(
+            f"{row['die']:4s} {row['factory']:16s} ({row['x']:10.1f}, "
+            f"{row['y']:10.1f})  {json.dumps(row['parameters'])}  {pads}"
+        )
+    print(f"{len(rows)} of {len(table)} structures")
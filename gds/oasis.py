@@ -0,0 +1,700 @@
+"""Compressed layout output: OASIS and gzip-streamed GDSII.
+
+write_oas() writes the hierarchy of a Device as OASIS (SEMI P39) with the
+compression the format is designed around:
+    - coordinates are written relative to the previous element of the cell
+      (XYRELATIVE mode) as variable-length integers
+    - fields equal to the modal variable of the previous record (layer,
+      datatype, size, point list, cell, repetition) are omitted
+    - rectangles are written as RECTANGLE records, other polygons as point
+      lists of deltas
+    - identical elements (same shape, layer and datatype, or same cell and
+      orientation) are merged into one record with a repetition: a matrix
+      for regular grids, an explicit displacement list otherwise
+    - CellArrays are written as a single placement with a lattice
+      repetition
+    - the records of each cell are deflate-compressed (CBLOCK)
+
+Cells are written under the deterministic names of cell_names.py, as
+GdsStream writes them, so the cells of the two formats can be compared by
+name and equal cells are written once.
+
+    python oasis.py    # write the wafer array as .gds, .gds.gz and .oas
+"""
+
+import gzip
+import os
+import struct
+import time
+import zlib
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+import gdspy
+import numpy as np
+from phidl import Device
+
+from cell_names import hierarchy_names
+from gds_stream import GdsStream, build_timestamp
+
+MAGIC = b"%SEMI-OASIS\r\n"
+
+# record ids
+START = 1
+END = 2
+CELLNAME = 3
+CELL_REF = 13
+XYRELATIVE = 16
+PLACEMENT = 17
+PLACEMENT_TRANSFORM = 18
+TEXT = 19
+RECTANGLE = 20
+POLYGON = 21
+CBLOCK = 34
+
+# octangular directions of 1-form g-deltas and 2-deltas
+_DIRECTIONS = {
+    (1, 0): 0,
+    (0, 1): 1,
+    (-1, 0): 2,
+    (0, -1): 3,
+    (1, 1): 4,
+    (-1, 1): 5,
+    (-1, -1): 6,
+    (1, -1): 7,
+}
+
+
+class _Buffer:
+    """Encoder of the OASIS primitive types."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def byte(self, value: int) -> None:
+        self.data.append(value)
+
+    def uint(self, value: int) -> None:
+        value = int(value)
+        while value > 0x7F:
+            self.data.append((value & 0x7F) | 0x80)
+            value >>= 7
+        self.data.append(value)
+
+    def sint(self, value: int) -> None:
+        value = int(value)
+        self.uint((-value << 1) | 1 if value < 0 else value << 1)
+
+    def real(self, value: float) -> None:
+        if value == int(value) and abs(value) < 2**62:
+            self.uint(0 if value >= 0 else 1)
+            self.uint(abs(int(value)))
+        else:
+            self.uint(7)
+            self.data += struct.pack("<d", value)
+
+    def string(self, value: Union[str, bytes]) -> None:
+        if isinstance(value, str):
+            value = value.encode()
+        self.uint(len(value))
+        self.data += value
+
+    def gdelta(self, dx: int, dy: int) -> None:
+        dx, dy = int(dx), int(dy)
+        direction = None
+        if dx == 0 or dy == 0 or abs(dx) == abs(dy):
+            direction = _DIRECTIONS.get(((dx > 0) - (dx < 0), (dy > 0) - (dy < 0)))
+        if direction is not None:
+            self.uint((max(abs(dx), abs(dy)) << 4) | (direction << 1))
+        else:
+            self.uint((abs(dx) << 2) | ((dx < 0) << 1) | 1)
+            self.sint(dy)
+
+
+def _point_list(buf: _Buffer, deltas: np.ndarray) -> None:
+    """Writes the vertex deltas of a polygon (without the closing edge)."""
+    edges = np.vstack((deltas, -deltas.sum(axis=0)))
+    if np.all((edges[:, 0] == 0) | (edges[:, 1] == 0)):
+        # type 2: Manhattan 2-deltas
+        buf.uint(2)
+        buf.uint(len(deltas))
+        for dx, dy in deltas.tolist():
+            if dx:
+                buf.uint((abs(dx) << 2) | (0 if dx > 0 else 2))
+            else:
+                buf.uint((abs(dy) << 2) | (1 if dy > 0 else 3))
+    else:
+        # type 4: general g-deltas
+        buf.uint(4)
+        buf.uint(len(deltas))
+        for dx, dy in deltas.tolist():
+            buf.gdelta(dx, dy)
+
+
+def _grid(positions: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+    """(columns, rows, x-space, y-space) if positions fill a regular grid."""
+    xs = np.unique(positions[:, 0])
+    ys = np.unique(positions[:, 1])
+    if len(xs) * len(ys) != len(positions):
+        return None
+    dx = np.diff(xs)
+    dy = np.diff(ys)
+    if np.any(dx != dx[:1]) or np.any(dy != dy[:1]):
+        return None
+    return len(xs), len(ys), int(dx[0]) if len(dx) else 0, int(dy[0]) if len(dy) else 0
+
+
+def _repetition(positions: np.ndarray) -> Tuple[Tuple[int, int], bytes]:
+    """Encodes the repetition of an element at unique positions.
+
+    Returns:
+        tuple: position of the first element, encoded repetition
+    """
+    buf = _Buffer()
+    grid = _grid(positions)
+    if grid is not None:
+        columns, rows, sx, sy = grid
+        first = positions.min(axis=0)
+        if columns > 1 and rows > 1:
+            buf.uint(1)
+            buf.uint(columns - 2)
+            buf.uint(rows - 2)
+            buf.uint(sx)
+            buf.uint(sy)
+        elif columns > 1:
+            buf.uint(2)
+            buf.uint(columns - 2)
+            buf.uint(sx)
+        else:
+            buf.uint(3)
+            buf.uint(rows - 2)
+            buf.uint(sy)
+        return tuple(first), bytes(buf.data)
+    # type 10: one displacement per element, from the previous one
+    order = np.lexsort((positions[:, 0], positions[:, 1]))
+    positions = positions[order]
+    buf.uint(10)
+    buf.uint(len(positions) - 2)
+    for dx, dy in np.diff(positions, axis=0):
+        buf.gdelta(dx, dy)
+    return tuple(positions[0]), bytes(buf.data)
+
+
+def _lattice(
+    columns: int, rows: int, v1: Tuple[int, int], v2: Tuple[int, int]
+) -> bytes:
+    """Encodes the repetition of a CellArray with lattice vectors v1, v2."""
+    buf = _Buffer()
+    if v1[1] == 0 and v2[0] == 0 and v1[0] >= 0 and v2[1] >= 0:
+        return _repetition(
+            np.array(
+                [(c * v1[0], r * v2[1]) for c in range(columns) for r in range(rows)]
+            )
+        )[1]
+    if rows == 1 or columns == 1:
+        # type 9: one lattice vector
+        n, v = (columns, v1) if rows == 1 else (rows, v2)
+        buf.uint(9)
+        buf.uint(n - 2)
+        buf.gdelta(*v)
+    else:
+        # type 8: two lattice vectors
+        buf.uint(8)
+        buf.uint(columns - 2)
+        buf.uint(rows - 2)
+        buf.gdelta(*v1)
+        buf.gdelta(*v2)
+    return bytes(buf.data)
+
+
+def cell_names(
+    D: Device,
+    cellname: str = "toplevel",
+    max_cellname_length: int = 28,
+    scale: float = 1e3,
+    hashed_names: bool = True,
+) -> Dict[Device, str]:
+    """Names of D and its dependencies, as GdsStream writes them.
+
+    Parameters:
+        D (Device): top-level device
+        cellname (str): name of D
+        max_cellname_length (int or None): maximum length of the names
+        scale (float): user units per database unit
+        hashed_names (bool): if True, name the cells as in cell_names.py
+            (equal cells get equal names); if False, make the names unique
+            as Device.write_gds(auto_rename=True) does
+
+    Returns:
+        dict: name of each cell
+    """
+    cells = sorted([D] + list(D.get_dependencies(recursive=True)), key=lambda c: c.uid)
+    names = {}
+    if hashed_names:
+        hashed = hierarchy_names(D, {}, scale=scale, max_length=max_cellname_length)
+        for c in cells:
+            names[c] = hashed[id(c)]
+    else:
+        used = {cellname}
+        n = 1
+        for c in cells:
+            name = c.name
+            if max_cellname_length is not None:
+                name = name[:max_cellname_length]
+            candidate = name
+            while candidate in used:
+                n += 1
+                candidate = name + ("%0.3i" % n)
+            used.add(candidate)
+            names[c] = candidate
+    names[D] = cellname
+    return names
+
+
+class _CellWriter:
+    """Writes the records of one cell, tracking the modal variables."""
+
+    def __init__(self, buf: _Buffer, scale: float, refnums: Dict[Device, int]):
+        self.buf = buf
+        self.scale = scale
+        self.refnums = refnums
+        self.modal = {}
+
+    def _xy(self, flags: Dict[str, int], key: str, x: int, y: int) -> int:
+        """Returns the X/Y info bits and queues relative coordinates."""
+        px, py = self.modal.get(key, (0, 0))
+        info = 0
+        fields = []
+        if x != px:
+            info |= flags["x"]
+            fields.append(x - px)
+        if y != py:
+            info |= flags["y"]
+            fields.append(y - py)
+        self.modal[key] = (x, y)
+        self._pending = fields
+        return info
+
+    def _repetition(self, info_bit: int, repetition: Optional[bytes]) -> int:
+        if repetition is None:
+            self._pending_rep = None
+            return 0
+        if self.modal.get("repetition") == repetition:
+            self._pending_rep = b"\x00"
+        else:
+            self._pending_rep = repetition
+            self.modal["repetition"] = repetition
+        return info_bit
+
+    def _flush_xy_rep(self) -> None:
+        for v in self._pending:
+            self.buf.sint(v)
+        if self._pending_rep is not None:
+            self.buf.data += self._pending_rep
+
+    def _layer(self, info: int, layer: int, datatype: int) -> Tuple[int, list]:
+        fields = []
+        if self.modal.get("layer") != layer:
+            info |= 0x01
+            fields.append(layer)
+            self.modal["layer"] = layer
+        if self.modal.get("datatype") != datatype:
+            info |= 0x02
+            fields.append(datatype)
+            self.modal["datatype"] = datatype
+        return info, fields
+
+    def rectangle(
+        self,
+        layer: int,
+        datatype: int,
+        x: int,
+        y: int,
+        w: int,
+        h: int,
+        repetition: bytes = None,
+    ) -> None:
+        info, layer_fields = self._layer(0, layer, datatype)
+        size = []
+        if w == h:
+            info |= 0x80
+            if self.modal.get("width") != w:
+                info |= 0x40
+                size.append(w)
+        else:
+            if self.modal.get("width") != w:
+                info |= 0x40
+                size.append(w)
+            if self.modal.get("height") != h:
+                info |= 0x20
+                size.append(h)
+        self.modal["width"] = w
+        self.modal["height"] = h
+        info |= self._xy({"x": 0x10, "y": 0x08}, "geometry", x, y)
+        info |= self._repetition(0x04, repetition)
+        self.buf.uint(RECTANGLE)
+        self.buf.byte(info)
+        for v in layer_fields + size:
+            self.buf.uint(v)
+        self._flush_xy_rep()
+
+    def polygon(
+        self,
+        layer: int,
+        datatype: int,
+        x: int,
+        y: int,
+        deltas: np.ndarray,
+        repetition: bytes = None,
+    ) -> None:
+        info, layer_fields = self._layer(0, layer, datatype)
+        points = _Buffer()
+        _point_list(points, deltas)
+        if self.modal.get("points") != points.data:
+            info |= 0x20
+            self.modal["points"] = points.data
+        else:
+            points = None
+        info |= self._xy({"x": 0x10, "y": 0x08}, "geometry", x, y)
+        info |= self._repetition(0x04, repetition)
+        self.buf.uint(POLYGON)
+        self.buf.byte(info)
+        for v in layer_fields:
+            self.buf.uint(v)
+        if points is not None:
+            self.buf.data += points.data
+        self._flush_xy_rep()
+
+    def placement(
+        self,
+        cell: Device,
+        x: int,
+        y: int,
+        rotation: float,
+        magnification: float,
+        x_reflection: bool,
+        repetition: bytes = None,
+    ) -> None:
+        refnum = self.refnums[cell]
+        info = 0
+        if self.modal.get("cell") != refnum:
+            info |= 0xC0
+            self.modal["cell"] = refnum
+        rotation = (rotation or 0) % 360
+        magnification = 1 if magnification is None else magnification
+        info |= 0x01 if x_reflection else 0
+        info |= self._xy({"x": 0x20, "y": 0x10}, "placement", x, y)
+        info |= self._repetition(0x08, repetition)
+        transform = []
+        if rotation % 90 == 0 and magnification == 1:
+            record = PLACEMENT
+            info |= int(rotation // 90) << 1
+        else:
+            record = PLACEMENT_TRANSFORM
+            if magnification != 1:
+                info |= 0x04
+                transform.append(magnification)
+            if rotation:
+                info |= 0x02
+                transform.append(rotation)
+        self.buf.uint(record)
+        self.buf.byte(info)
+        if info & 0x80:
+            self.buf.uint(refnum)
+        for v in transform:
+            self.buf.real(v)
+        self._flush_xy_rep()
+
+    def text(self, text: str, layer: int, texttype: int, x: int, y: int) -> None:
+        info = 0
+        if self.modal.get("text") != text:
+            info |= 0x40
+            self.modal["text"] = text
+        if self.modal.get("textlayer") != layer:
+            info |= 0x01
+            self.modal["textlayer"] = layer
+        if self.modal.get("texttype") != texttype:
+            info |= 0x02
+            self.modal["texttype"] = texttype
+        info |= self._xy({"x": 0x10, "y": 0x08}, "text", x, y)
+        self._pending_rep = None
+        self.buf.uint(TEXT)
+        self.buf.byte(info)
+        if info & 0x40:
+            self.buf.string(text)
+        if info & 0x01:
+            self.buf.uint(layer)
+        if info & 0x02:
+            self.buf.uint(texttype)
+        self._flush_xy_rep()
+
+
+def _shapes(cell: Device, scale: float) -> Dict[tuple, List[Tuple[int, int]]]:
+    """Groups the polygons of a cell by shape, layer and datatype.
+
+    Returns:
+        dict: positions (lower left corner for rectangles, first vertex
+            otherwise) per ("rect", layer, datatype, w, h) or ("poly",
+            layer, datatype, deltas) key
+    """
+    groups = {}
+    polygons = [
+        (points, layer, datatype)
+        for p in cell.polygons
+        for points, layer, datatype in zip(p.polygons, p.layers, p.datatypes)
+    ]
+    for path in cell.paths:
+        ps = path.to_polygonset()
+        polygons += list(zip(ps.polygons, ps.layers, ps.datatypes))
+    by_length = {}
+    for points, layer, datatype in polygons:
+        by_length.setdefault(len(points), []).append((points, layer, datatype))
+    for n, batch in by_length.items():
+        points, layers, datatypes = zip(*batch)
+        q = np.round(np.array(points, dtype=float) * scale).astype(np.int64)
+        d = np.roll(q, -1, axis=1) - q
+        zero = np.all(d == 0, axis=2)
+        # axis-parallel 4-gons with alternating edges and no repeated vertex
+        rect = np.zeros(len(q), dtype=bool)
+        if n == 4:
+            horizontal = d[:, :, 1] == 0
+            rect = np.all(horizontal != (d[:, :, 0] == 0), axis=1) & np.all(
+                horizontal == horizontal[:, :1] ^ [False, True, False, True], axis=1
+            )
+        lo = q.min(axis=1)
+        size = q.max(axis=1) - lo
+        for i in np.flatnonzero(rect):
+            key = ("rect", layers[i], datatypes[i], int(size[i, 0]), int(size[i, 1]))
+            groups.setdefault(key, set()).add((int(lo[i, 0]), int(lo[i, 1])))
+        for i in np.flatnonzero(~rect):
+            p = q[i][~zero[i]] if zero[i].any() else q[i]
+            if len(p) < 3:
+                continue
+            key = ("poly", layers[i], datatypes[i], np.diff(p, axis=0).tobytes())
+            groups.setdefault(key, set()).add((int(p[0, 0]), int(p[0, 1])))
+    return groups
+
+
+def _write_cell(writer: _CellWriter, cell: Device, scale: float) -> None:
+    def grid(v):
+        return int(round(v * scale))
+
+    for key, positions in sorted(
+        _shapes(cell, scale).items(), key=lambda kv: kv[0][:3]
+    ):
+        positions = np.array(sorted(positions))
+        if len(positions) > 1:
+            (x, y), rep = _repetition(positions)
+        else:
+            (x, y), rep = positions[0], None
+        if key[0] == "rect":
+            _, layer, datatype, w, h = key
+            writer.rectangle(layer, datatype, x, y, w, h, rep)
+        else:
+            _, layer, datatype, deltas = key
+            deltas = np.frombuffer(deltas, dtype=np.int64).reshape(-1, 2)
+            writer.polygon(layer, datatype, x, y, deltas, rep)
+
+    placements = {}
+    for ref in cell.references:
+        if isinstance(ref, gdspy.CellArray):
+            rotation = ref.rotation or 0
+            c, s = np.cos(np.radians(rotation)), np.sin(np.radians(rotation))
+            flip = -1 if ref.x_reflection else 1
+            v1 = (grid(ref.spacing[0] * c), grid(ref.spacing[0] * s))
+            v2 = (grid(-ref.spacing[1] * s * flip), grid(ref.spacing[1] * c * flip))
+            writer.placement(
+                ref.ref_cell,
+                grid(ref.origin[0]),
+                grid(ref.origin[1]),
+                ref.rotation,
+                ref.magnification,
+                ref.x_reflection,
+                (
+                    _lattice(ref.columns, ref.rows, v1, v2)
+                    if ref.columns * ref.rows > 1
+                    else None
+                ),
+            )
+            continue
+        key = (
+            writer.refnums[ref.ref_cell],
+            (ref.rotation or 0) % 360,
+            ref.magnification,
+            bool(ref.x_reflection),
+        )
+        placements.setdefault(key, (ref.ref_cell, set()))[1].add(
+            (grid(ref.origin[0]), grid(ref.origin[1]))
+        )
+    for (_, rotation, magnification, x_reflection), (child, positions) in sorted(
+        placements.items(), key=lambda kv: kv[0][:2]
+    ):
+        positions = np.array(sorted(positions))
+        if len(positions) > 1:
+            (x, y), rep = _repetition(positions)
+        else:
+            (x, y), rep = positions[0], None
+        writer.placement(child, x, y, rotation, magnification, x_reflection, rep)
+
+    for label in cell.labels:
+        writer.text(
+            label.text,
+            label.layer,
+            label.texttype,
+            grid(label.position[0]),
+            grid(label.position[1]),
+        )
+
+
+def write_oas(
+    D: Device,
+    outfile: Union[str, BinaryIO],
+    unit: float = 1e-6,
+    precision: float = 1e-9,
+    cellname: str = "toplevel",
+    max_cellname_length: int = 28,
+    compress: bool = True,
+    compresslevel: int = 6,
+    hashed_names: bool = True,
+) -> None:
+    """Writes D and its hierarchy as an OASIS file.
+
+    Parameters:
+        D (Device): top-level device
+        outfile (str or file): file name or binary file object
+        unit (float): user unit in meters (of the coordinates in D)
+        precision (float): database unit in meters
+        cellname (str): name of the top-level cell
+        max_cellname_length (int or None): maximum length of renamed cells
+        compress (bool): if True, deflate the records of each cell (CBLOCK)
+        compresslevel (int): deflate level, 1 (fastest) to 9 (smallest)
+        hashed_names (bool): if True, write the cells under their hashed
+            names, cells with equal names once (see cell_names())
+    """
+    scale = unit / precision
+    names = cell_names(D, cellname, max_cellname_length, scale, hashed_names)
+    # children before parents, in order of their names (creation order if
+    # the names are not hashed); equal cells are written once
+    if hashed_names:
+        key = lambda c: names[c]
+    else:
+        key = lambda c: c.uid
+    order = []
+    seen = set()
+    numbers = {}
+
+    def visit(cell):
+        if cell in seen:
+            return
+        seen.add(cell)
+        for child in sorted(cell.get_dependencies(), key=key):
+            visit(child)
+        if names[cell] not in numbers:
+            numbers[names[cell]] = len(order)
+            order.append(cell)
+
+    visit(D)
+    # references to equal cells point to the one that is written
+    refnums = {cell: numbers[name] for cell, name in names.items()}
+
+    buf = _Buffer()
+    buf.data += MAGIC
+    buf.uint(START)
+    buf.string("1.0")
+    buf.real(round(1e-6 / precision, 9))
+    # table offsets in the START record, no tables
+    buf.uint(0)
+    for _ in range(6):
+        buf.uint(0)
+        buf.uint(0)
+    for cell in order:
+        buf.uint(CELLNAME)
+        buf.string(names[cell])
+    for cell in order:
+        buf.uint(CELL_REF)
+        buf.uint(refnums[cell])
+        body = _Buffer()
+        body.uint(XYRELATIVE)
+        _write_cell(_CellWriter(body, scale, refnums), cell, scale)
+        if compress:
+            # the records of the cell in a deflate-compressed CBLOCK
+            deflate = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+            data = deflate.compress(bytes(body.data)) + deflate.flush()
+            buf.uint(CBLOCK)
+            buf.uint(0)
+            buf.uint(len(body.data))
+            buf.uint(len(data))
+            buf.data += data
+        else:
+            buf.data += body.data
+    # END: padded to 256 bytes, no validation
+    buf.uint(END)
+    buf.string(b"\x00" * 252)
+    buf.uint(0)
+
+    if isinstance(outfile, str):
+        with open(outfile, "wb") as f:
+            f.write(buf.data)
+    else:
+        outfile.write(buf.data)
+
+
+def write_gds_gz(D: Device, filename: str, compresslevel: int = 6, **kwargs) -> None:
+    """Writes D as gzip-compressed GDSII, streaming through the compressor.
+
+    Parameters:
+        D (Device): top-level device
+        filename (str): output file, conventionally ending in .gds.gz
+        compresslevel (int): gzip level, 1 (fastest) to 9 (smallest)
+        **kwargs: passed to GdsStream; the gzip header gets the timestamp
+            (if given), so the file is as reproducible as the GDSII
+    """
+    timestamp = kwargs.get("timestamp")
+    mtime = None if timestamp is None else timestamp.timestamp()
+    with gzip.GzipFile(filename, "wb", compresslevel, mtime=mtime) as f:
+        with GdsStream(f, **kwargs) as stream:
+            stream.write(D, top=True)
+
+
+def compare_formats(D: Device, basename: str) -> List[Tuple[str, int, float]]:
+    """Writes D as GDSII, gzip-compressed GDSII and OASIS.
+
+    Parameters:
+        D (Device): top-level device
+        basename (str): output file name without extension
+
+    Returns:
+        List[tuple]: (file name, size in bytes, write time in seconds)
+    """
+    options = dict(unit=1e-6, precision=1e-9, max_cellname_length=28, cellname="top")
+
+    def write_gds(filename):
+        with GdsStream(filename, timestamp=build_timestamp(), **options) as stream:
+            stream.write(D, top=True)
+
+    writers = [
+        (basename + ".gds", write_gds),
+        (
+            basename + ".gds.gz",
+            lambda f: write_gds_gz(D, f, timestamp=build_timestamp(), **options),
+        ),
+        (basename + ".oas", lambda f: write_oas(D, f, **options)),
+    ]
+    results = []
+    for filename, write in writers:
+        t = time.perf_counter()
+        write(filename)
+        results.append((filename, os.path.getsize(filename), time.perf_counter() - t))
+    return results
+
+
+if __name__ == "__main__":
+    import make_gds
+
+    A = make_gds.wafer_array(make_gds.default_layer_set())
+    results = compare_formats(A, "ito_test")
+    gds_size = results[0][1]
+    for filename, size, seconds in results:
+        print(
+            f"{filename:16s} {size / 2**20:8.3f} MiB  {size / gds_size:6.1%}  "
+            f"{seconds:6.2f} s"
+        )
@@ -0,0 +1,303 @@
+"""Process-pool version of pg.gridsweep.
+
+Each cell of the sweep is generated in a worker process, shipped back as
+plain polygon/label/port/reference data and rebuilt into Devices in the
+parent. Cells the parent has cached already are reused, and cells that
+several workers built (such as the pad stacks of every swept device) are
+rebuilt once, so the hierarchy has the same cells as that of
+pg.gridsweep.
+"""
+
+import hashlib
+import multiprocessing
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import phidl.geometry as pg
+from phidl import Device
+from phidl.device_layout import CellArray, DeviceReference, make_device
+
+from cell_cache import CELL_CACHE, freeze
+from labels import TextLabel
+
+
+def _hierarchy(D: Device) -> List[Device]:
+    return sorted([D] + list(D.get_dependencies(recursive=True)), key=lambda c: c.uid)
+
+
+def serialize_device(D: Device) -> Dict:
+    """Converts a Device hierarchy to picklable plain data.
+
+    Parameters:
+        D (Device): top-level device
+
+    Returns:
+        dict: cells (ordered by creation uid) and the index of the top cell
+    """
+    cells = _hierarchy(D)
+    index = {id(c): n for n, c in enumerate(cells)}
+    data = []
+    for c in cells:
+        polygons = []
+        for p in c.polygons:
+            for points, layer, datatype in zip(p.polygons, p.layers, p.datatypes):
+                polygons.append((layer, datatype, points))
+        labels = [
+            (
+                l.text,
+                tuple(l.position),
+                l.anchor,
+                l.rotation,
+                l.magnification,
+                l.x_reflection,
+                l.layer,
+                l.texttype,
+            )
+            for l in c.labels
+        ]
+        ports = [
+            (p.name, tuple(p.midpoint), p.width, p.orientation)
+            for p in c.ports.values()
+        ]
+        refs = []
+        for r in c.references:
+            transform = (
+                tuple(r.origin),
+                r.rotation,
+                r.magnification,
+                r.x_reflection,
+            )
+            if isinstance(r, CellArray):
+                array = (r.columns, r.rows, tuple(r.spacing))
+            else:
+                array = None
+            refs.append((index[id(r.parent)], transform, array))
+        data.append(
+            {
+                "name": c.name,
+                "polygons": polygons,
+                "labels": labels,
+                "ports": ports,
+                "references": refs,
+                # TEXT-element labels report the bbox of their glyphs
+                "bbox": c._glyph_bbox if isinstance(c, TextLabel) else None,
+                "info": dict(c.info),
+            }
+        )
+    return {"cells": data, "top": index[id(D)]}
+
+
+def cell_digests(data: Dict) -> List[str]:
+    """Content hash of every cell in serialize_device() output, including the
+    content of the cells it references.
+
+    Parameters:
+        data (dict): serialized hierarchy
+
+    Returns:
+        List[str]: hex digest per cell
+    """
+    cells = data["cells"]
+    digests = [None] * len(cells)
+
+    def digest(n):
+        if digests[n] is None:
+            c = cells[n]
+            h = hashlib.sha1()
+            h.update(repr((c["name"], c["labels"], c["ports"])).encode())
+            for layer, datatype, points in c["polygons"]:
+                h.update(repr((layer, datatype)).encode())
+                h.update(np.asarray(points, dtype=float).tobytes())
+            if c["bbox"] is not None:
+                h.update(np.asarray(c["bbox"], dtype=float).tobytes())
+            for child, transform, array in c["references"]:
+                h.update(repr((digest(child), transform, array)).encode())
+            digests[n] = h.hexdigest()
+        return digests[n]
+
+    return [digest(n) for n in range(len(cells))]
+
+
+def shared_cells(devices: List[Device]) -> Dict[str, Device]:
+    """Cells of the hierarchies of devices by content hash, to be reused by
+    deserialize_device().
+
+    Parameters:
+        devices (List[Device]): top-level devices
+
+    Returns:
+        dict: maps cell_digests() hashes to Devices
+    """
+    shared = {}
+    for D in devices:
+        for d, c in zip(cell_digests(serialize_device(D)), _hierarchy(D)):
+            shared.setdefault(d, c)
+    return shared
+
+
+def deserialize_device(data: Dict, shared: Optional[Dict] = None) -> Device:
+    """Rebuilds a Device hierarchy from serialize_device() output.
+
+    Parameters:
+        data (dict): serialized hierarchy
+        shared (dict or None): if given, maps cell content hashes to Devices;
+            cells already in it are reused instead of rebuilt, and rebuilt
+            cells are added to it
+
+    Returns:
+        Device: the rebuilt top-level device
+    """
+    if shared is not None:
+        digests = cell_digests(data)
+        reused = [d in shared for d in digests]
+    else:
+        reused = [False] * len(data["cells"])
+    # create every cell first so uids follow the original creation order
+    cells = [
+        (
+            shared[digests[n]]
+            if reused[n]
+            else (
+                Device(c["name"])
+                if c["bbox"] is None
+                else TextLabel(c["name"], c["bbox"])
+            )
+        )
+        for n, c in enumerate(data["cells"])
+    ]
+    for D, c, skip in zip(cells, data["cells"], reused):
+        if skip:
+            continue
+        for layer, datatype, points in c["polygons"]:
+            D.add_polygon(points, layer=(layer, datatype))
+        for text, position, anchor, rotation, mag, x_refl, layer, texttype in c[
+            "labels"
+        ]:
+            l = D.add_label(
+                text=text,
+                position=position,
+                rotation=rotation,
+                magnification=mag,
+                layer=(layer, texttype),
+            )
+            # gdspy stores the anchor as its numeric code
+            l.anchor = anchor
+            l.x_reflection = x_refl
+        # cells stored before the info was serialized have none
+        D.info.update(c.get("info", {}))
+        for name, midpoint, width, orientation in c["ports"]:
+            D.add_port(
+                name=name, midpoint=midpoint, width=width, orientation=orientation
+            )
+        for child, (origin, rotation, mag, x_refl), array in c["references"]:
+            if array is None:
+                r = DeviceReference(
+                    cells[child],
+                    origin=origin,
+                    rotation=rotation,
+                    magnification=mag,
+                    x_reflection=x_refl,
+                )
+            else:
+                columns, rows, spacing = array
+                r = CellArray(
+                    cells[child],
+                    columns,
+                    rows,
+                    spacing,
+                    origin=origin,
+                    rotation=rotation,
+                    magnification=mag,
+                    x_reflection=x_refl,
+                )
+            r.owner = D
+            D.add(r)
+    if shared is not None:
+        for d, D in zip(digests, cells):
+            shared.setdefault(d, D)
+    return cells[data["top"]]
+
+
+def _build_cell(args: Tuple[Callable, Dict, Dict]) -> Dict:
+    """Worker: builds one sweep cell and returns it serialized."""
+    function, config, params = args
+    return serialize_device(make_device(function, config=config, **params))
+
+
+def parallel_gridsweep(
+    function: Callable,
+    param_x: Dict = {"width": [1, 5, 6, 7]},
+    param_y: Dict = {"length": [1.1, 2, 70]},
+    param_defaults: Dict = {},
+    param_override: Dict = {},
+    spacing: Tuple[float, float] = (50, 100),
+    separation: bool = True,
+    align_x: str = "x",
+    align_y: str = "y",
+    edge_x: str = "x",
+    edge_y: str = "ymax",
+    label_layer: Optional[int] = 255,
+    processes: Optional[int] = None,
+) -> Device:
+    """Drop-in replacement for pg.gridsweep that generates the cells in a
+    process pool.
+
+    Parameters:
+        function (Callable): picklable device factory (module-level function
+            or functools.partial, not a lambda)
+        processes (int or None): number of worker processes, defaults to the
+            number of CPUs; 1 falls back to the serial pg.gridsweep
+        (all other parameters are passed through to pg.gridsweep)
+
+    Returns:
+        Device: the swept devices placed on a grid
+    """
+    kwargs = dict(
+        param_x=param_x,
+        param_y=param_y,
+        param_defaults=param_defaults,
+        param_override=param_override,
+        spacing=spacing,
+        separation=separation,
+        align_x=align_x,
+        align_y=align_y,
+        edge_x=edge_x,
+        edge_y=edge_y,
+        label_layer=label_layer,
+    )
+    if processes is None:
+        processes = os.cpu_count()
+    if processes <= 1:
+        return pg.gridsweep(function=function, **kwargs)
+
+    # reproduce the parameter order used by pg.gridsweep
+    variations = {}
+    for axis, param in (("y", param_y), ("x", param_x)):
+        if param is None:
+            param = {(None, axis): [None]}
+        elif isinstance(param, int):
+            param = {(None, axis): [None] * param}
+        variations.update(param)
+    param_list = []
+    for params in pg._parameter_combinations(variations):
+        params.pop((None, "x"), None)
+        params.pop((None, "y"), None)
+        params.update(param_override)
+        param_list.append(params)
+
+    # identical parameter sets share one Device, as with the serial cell cache
+    keys = [freeze(params) for params in param_list]
+    unique = list(dict.fromkeys(keys))
+    jobs = [(function, param_defaults, param_list[keys.index(k)]) for k in unique]
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_build_cell, jobs)
+    # the workers start from a copy of the parent's cell cache, so rebuilt
+    # cells are matched against the cached ones and against each other
+    shared = shared_cells(CELL_CACHE.devices())
+    built = {}
+    for k, data in zip(unique, results):
+        built[k] = deserialize_device(data, shared)
+
+    devices = iter(built[k] for k in keys)
+    return pg.gridsweep(function=lambda **_: next(devices), **kwargs)
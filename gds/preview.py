@@ -0,0 +1,335 @@
+"""Headless raster preview of a layout.
+
+quickplot draws every polygon of the flattened layout through matplotlib,
+which is unusable for the wafer array. Here the hierarchy is rasterized
+instead:
+    - each unique cell is rasterized once per orientation (and scale) into
+      a tile of per-layer coverage masks, which is cached
+    - a cell is composited from its own polygons and the cached tiles of
+      the cells it references, shifted to the nearest pixel
+    - level of detail: polygons and referenced cells smaller than a pixel
+      in both directions are skipped, polygons thinner than a pixel in one
+      direction (wires, fingers) are drawn one pixel wide
+Layers are blended in the colors of the LayerSet and the result is written
+as PNG, without plotting dependencies.
+
+    python preview.py ito_test.gds -o ito_test.png -w 4096
+"""
+
+import struct
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from phidl import Device, LayerSet
+from phidl.device_layout import CellArray
+
+# colors of layers that are not in the LayerSet
+PALETTE = [
+    (0.6, 0.7, 0.9),
+    (0.8, 0.7, 0.2),
+    (0.5, 0.4, 0.4),
+    (0.6, 0.2, 0.5),
+    (0.2, 0.6, 0.3),
+    (0.9, 0.4, 0.2),
+]
+
+
+class Tile(NamedTuple):
+    """Rasterized cell: masks[layer][row, column] covers the pixel whose
+    lower left corner is (x0 + column, y0 + row)."""
+
+    x0: int
+    y0: int
+    width: int
+    height: int
+    masks: Dict[int, np.ndarray]
+
+
+def _linear(ref) -> np.ndarray:
+    """Linear part of a reference transformation, in gdspy order: reflection,
+    then magnification, then rotation."""
+    theta = np.radians(ref.rotation or 0)
+    c, s = np.cos(theta), np.sin(theta)
+    M = np.array([[c, -s], [s, c]]) * (ref.magnification or 1)
+    if ref.x_reflection:
+        M = M @ np.diag([1.0, -1.0])
+    return M
+
+
+def _extent(bbox: np.ndarray, M: np.ndarray) -> np.ndarray:
+    """Size in pixels of bbox ([[xmin, ymin], [xmax, ymax]]) mapped by M."""
+    corners = np.array([[bbox[i, 0], bbox[j, 1]] for i in range(2) for j in range(2)])
+    p = corners @ M.T
+    return p.max(axis=0) - p.min(axis=0)
+
+
+def _spans(points: np.ndarray, y0: int) -> Tuple[np.ndarray, ...]:
+    """Pixel spans covered by a polygon (even-odd rule, pixel centers).
+
+    Returns:
+        tuple: row, first column and end column of each span
+    """
+    rows = np.arange(
+        np.ceil(points[:, 1].min() - 0.5), np.floor(points[:, 1].max() - 0.5) + 1
+    )
+    if len(rows) == 0:
+        return (np.zeros(0, int),) * 3
+    yc = rows[:, None] + 0.5
+    p, q = points, np.roll(points, -1, axis=0)
+    cross = (p[:, 1] <= yc) != (q[:, 1] <= yc)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = p[:, 0] + (yc - p[:, 1]) * (q[:, 0] - p[:, 0]) / (q[:, 1] - p[:, 1])
+    xs = np.sort(np.where(cross, x, np.inf), axis=1)
+    if xs.shape[1] % 2:
+        xs = np.hstack((xs, np.full((len(xs), 1), np.inf)))
+    start, end = xs[:, 0::2], xs[:, 1::2]
+    valid = np.isfinite(end)
+    r = np.broadcast_to(rows[:, None], start.shape)[valid]
+    c0 = np.ceil(start[valid] - 0.5)
+    c1 = np.ceil(end[valid] - 0.5)
+    return (r - y0).astype(int), c0.astype(int), c1.astype(int)
+
+
+def _rasterize(
+    polygons: List[np.ndarray], x0: int, y0: int, width: int, height: int
+) -> np.ndarray:
+    """Coverage mask of polygons (in pixel coordinates) on one layer."""
+    mask = np.zeros((height, width), dtype=bool)
+    diff = np.zeros((height, width + 1), dtype=np.int32)
+    for p in polygons:
+        lo, hi = p.min(axis=0), p.max(axis=0)
+        if np.all(hi - lo < 1):
+            continue
+        if np.any(hi - lo < 1):
+            # hairline: at least one pixel wide
+            c0, r0 = np.floor(lo).astype(int) - (x0, y0)
+            c1, r1 = np.ceil(hi).astype(int) - (x0, y0)
+            c1, r1 = max(c1, c0 + 1), max(r1, r0 + 1)
+            mask[max(r0, 0) : r1, max(c0, 0) : c1] = True
+            continue
+        r, c0, c1 = _spans(p, y0)
+        c0 = np.clip(c0 - x0, 0, width)
+        c1 = np.clip(c1 - x0, 0, width)
+        keep = (c1 > c0) & (r >= 0) & (r < height)
+        np.add.at(diff, (r[keep], c0[keep]), 1)
+        np.add.at(diff, (r[keep], c1[keep]), -1)
+    return mask | (np.cumsum(diff, axis=1)[:, :width] > 0)
+
+
+class Rasterizer:
+    """Rasterizes Devices with a cache of cell tiles.
+
+    Parameters:
+        scale (float): pixels per user unit
+    """
+
+    def __init__(self, scale: float):
+        self.scale = scale
+        self.tiles: Dict[Tuple, Tile] = {}
+        self.rendered = 0
+
+    def tile(self, D: Device, M: np.ndarray = None) -> Tile:
+        """Returns the tile of D transformed by the linear map M (identity by
+        default; the scale is applied on top), rendering it on a cache miss.
+
+        Parameters:
+            D (Device): cell
+            M (np.ndarray): 2x2 orientation/magnification of D
+
+        Returns:
+            Tile: the rasterized cell, in pixels relative to the origin of D
+        """
+        M = np.eye(2) * self.scale if M is None else M * self.scale
+        return self._tile(D, M)
+
+    def _tile(self, D: Device, M: np.ndarray) -> Tile:
+        key = (id(D), tuple(np.round(M, 9).ravel()))
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.tiles[key] = self._render(D, M)
+            self.rendered += 1
+        return tile
+
+    def _render(self, D: Device, M: np.ndarray) -> Tile:
+        polygons = {}
+        for p in D.polygons:
+            for points, layer in zip(p.polygons, p.layers):
+                polygons.setdefault(layer, []).append(np.asarray(points) @ M.T)
+        # (tile, pixel offset) of the referenced cells
+        placed = []
+        for ref in D.references:
+            if np.all(_extent(ref.parent.bbox, M) < 1):
+                continue
+            L = _linear(ref)
+            child = self._tile(ref.parent, M @ L)
+            offsets = [np.zeros(2)]
+            if isinstance(ref, CellArray):
+                # lattice offsets are added before reflection and rotation,
+                # and are not magnified
+                frame = L / (ref.magnification or 1)
+                offsets = [
+                    frame @ (ref.spacing[0] * c, ref.spacing[1] * r)
+                    for c in range(ref.columns)
+                    for r in range(ref.rows)
+                ]
+            for offset in offsets:
+                shift = np.round(M @ (np.asarray(ref.origin) + offset)).astype(int)
+                placed.append((child, shift))
+
+        bounds = [
+            np.concatenate((np.floor(p.min(axis=0)), np.ceil(p.max(axis=0))))
+            for ps in polygons.values()
+            for p in ps
+        ] + [
+            (
+                child.x0 + sx,
+                child.y0 + sy,
+                child.x0 + sx + child.width,
+                child.y0 + sy + child.height,
+            )
+            for child, (sx, sy) in placed
+            if child.masks
+        ]
+        if not bounds:
+            return Tile(0, 0, 0, 0, {})
+        bounds = np.array(bounds)
+        x0, y0 = bounds[:, :2].min(axis=0).astype(int)
+        x1, y1 = bounds[:, 2:].max(axis=0).astype(int)
+        width, height = max(x1 - x0, 1), max(y1 - y0, 1)
+        masks = {
+            layer: _rasterize(ps, x0, y0, width, height)
+            for layer, ps in polygons.items()
+        }
+        for child, (sx, sy) in placed:
+            cx, cy = child.x0 + sx - x0, child.y0 + sy - y0
+            for layer, m in child.masks.items():
+                if layer not in masks:
+                    masks[layer] = np.zeros((height, width), dtype=bool)
+                masks[layer][cy : cy + child.height, cx : cx + child.width] |= m
+        return Tile(int(x0), int(y0), int(width), int(height), masks)
+
+
+def _color(color) -> Optional[Tuple[float, float, float]]:
+    """RGB in [0, 1] from a tuple or a #rrggbb string."""
+    if color is None:
+        return None
+    if isinstance(color, str):
+        color = color.lstrip("#")
+        if len(color) != 6:
+            return None
+        return tuple(int(color[i : i + 2], 16) / 255 for i in (0, 2, 4))
+    rgb = np.asarray(color, dtype=float)[:3]
+    return tuple(rgb / 255 if rgb.max() > 1 else rgb)
+
+
+def render(
+    D: Device,
+    width: int = 2048,
+    layer_set: LayerSet = None,
+    alpha: float = 0.6,
+    rasterizer: Rasterizer = None,
+) -> np.ndarray:
+    """Renders D to an RGB image.
+
+    Parameters:
+        D (Device): layout
+        width (int): image width in pixels; the height follows from the
+            aspect ratio of D
+        layer_set (LayerSet): colors and stacking order of the layers
+        alpha (float): opacity of each layer
+        rasterizer (Rasterizer or None): rasterizer (and tile cache) to use,
+            e.g. to render several layouts that share cells at one scale
+
+    Returns:
+        np.ndarray: (height, width, 3) uint8 image, top row first
+    """
+    if rasterizer is None:
+        rasterizer = Rasterizer(width / max(D.xsize, 1e-9))
+    tile = rasterizer.tile(D)
+    image = np.ones((tile.height, tile.width, 3))
+    colors = {}
+    if layer_set is not None:
+        for _, l in layer_set._layers.items():
+            colors.setdefault(l.gds_layer, _color(l.color))
+    order = [l for l in colors if l in tile.masks] + sorted(
+        l for l in tile.masks if l not in colors
+    )
+    for n, layer in enumerate(order):
+        color = colors.get(layer) or PALETTE[n % len(PALETTE)]
+        m = tile.masks[layer]
+        image[m] = (1 - alpha) * image[m] + alpha * np.asarray(color)
+    return np.round(image[::-1] * 255).astype(np.uint8)
+
+
+def write_png(filename: str, image: np.ndarray, compresslevel: int = 6) -> None:
+    """Writes an RGB image as PNG.
+
+    Parameters:
+        filename (str): output file
+        image (np.ndarray): (height, width, 3) uint8 image, top row first
+        compresslevel (int): zlib level
+    """
+    height, width, _ = image.shape
+    # filter type 0 (none) at the start of every row
+    raw = np.hstack((np.zeros((height, 1), np.uint8), image.reshape(height, -1)))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(data))
+            + tag
+            + data
+            + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+        )
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), compresslevel)))
+        f.write(chunk(b"IEND", b""))
+
+
+def preview(
+    D: Device, filename: str, width: int = 2048, layer_set: LayerSet = None
+) -> Rasterizer:
+    """Renders D and writes it as PNG.
+
+    Parameters:
+        D (Device): layout
+        filename (str): output PNG file
+        width (int): image width in pixels
+        layer_set (LayerSet): colors and stacking order of the layers
+
+    Returns:
+        Rasterizer: the rasterizer used, with its tile statistics
+    """
+    rasterizer = Rasterizer(width / max(D.xsize, 1e-9))
+    write_png(filename, render(D, width, layer_set, rasterizer=rasterizer))
+    return rasterizer
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("gds", nargs="?", help="layout to render (default: build)")
+    parser.add_argument("-o", "--output", default="preview.png")
+    parser.add_argument("-w", "--width", type=int, default=2048)
+    args = parser.parse_args()
+
+    import make_gds
+
+    ls = make_gds.default_layer_set()
+    if args.gds:
+        import phidl.geometry as pg
+
+        D = pg.import_gds(args.gds, flatten=False)
+    else:
+        D = make_gds.wafer_array(ls)
+    t = time.perf_counter()
+    r = preview(D, args.output, args.width, ls)
+    print(
+        f"{args.output}: {args.width} px wide, {r.rendered} tiles rendered "
+        f"in {time.perf_counter() - t:.1f}s"
+    )
@@ -0,0 +1,288 @@
+"""Probe-station step lists from the device metadata sidecar.
+
+A probing session visits every structure of one factory (optionally
+filtered by parameters, e.g. the ITO resistors are transistors with
+L_gate = 0) on every die. Each step is one structure: the stage moves to
+its first pad (pads are ordered top to bottom, left to right) and the step
+lists the coordinates of all its pads.
+
+The visiting order is planned hierarchically, so that every tour stays
+small:
+    by="die": the dies are visited once each, in a tour over the die
+        centers; within a die the structures are visited in a tour of
+        their own
+    by="pattern": structures with the same pad arrangement (relative to
+        the first pad) are probed in one pass over all dies, so the
+        manipulators are set up once per arrangement rather than once per
+        structure; each pass is a tour over its structures
+Tours are open paths built by nearest neighbour and improved by 2-opt.
+The direction in which each die or pass is traversed is then chosen by
+dynamic programming to minimize the moves between them.
+
+    python prober.py ito_test.npz tlm -o tlm.csv
+    python prober.py ito_test.npz transistor --where L_gate=0 -o itores.csv
+    python prober.py ito_test.npz transistor --by pattern -o transistors.csv
+"""
+
+import csv
+import json
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from metadata import DeviceTable
+
+
+class Step(NamedTuple):
+    """One stage position: the structure in row of the device table, its
+    first pad at x, y and the centers of all its pads."""
+
+    die: str
+    row: int
+    cell: str
+    x: float
+    y: float
+    pads: Tuple[Tuple[float, float], ...]
+
+
+def _distances(a: np.ndarray, b: np.ndarray, metric: str) -> np.ndarray:
+    """Matrix of stage move lengths from the points a to the points b."""
+    d = np.abs(a[:, None, :] - b[None, :, :])
+    if metric == "euclidean":
+        return np.hypot(d[..., 0], d[..., 1])
+    if metric == "chebyshev":
+        # both axes move at once
+        return d.max(axis=2)
+    if metric == "manhattan":
+        return d.sum(axis=2)
+    raise ValueError(f"unknown metric {metric!r}")
+
+
+def route(
+    points: np.ndarray, metric: str = "euclidean", start: Sequence[float] = None
+) -> np.ndarray:
+    """Short open path through points: nearest neighbour, then 2-opt.
+
+    Parameters:
+        points (np.ndarray): (N, 2) positions
+        metric (str): "euclidean", "chebyshev" (axes move simultaneously)
+            or "manhattan"
+        start (array-like[2] or None): if given, the path starts close to
+            this position; otherwise both ends are free
+
+    Returns:
+        np.ndarray: visiting order, as indices into points
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    n = len(points)
+    if n == 0:
+        return np.zeros(0, dtype=int)
+    # two end nodes: the first is at start (or anywhere), the last anywhere
+    E = np.zeros((n + 2, n + 2))
+    E[:n, :n] = _distances(points, points, metric)
+    if start is not None:
+        d = _distances(np.reshape(start, (1, 2)), points, metric)[0]
+        E[n, :n] = E[:n, n] = d
+
+    # nearest neighbour from the first node
+    order = np.zeros(n, dtype=int)
+    visited = np.zeros(n, dtype=bool)
+    current = int(np.argmin(E[n, :n])) if start is not None else 0
+    for k in range(n):
+        order[k] = current
+        visited[current] = True
+        if k < n - 1:
+            d = np.where(visited, np.inf, E[current, :n])
+            current = int(np.argmin(d))
+
+    # 2-opt: reversing path[k + 1 : l + 1] replaces the edges k and l
+    path = np.concatenate(([n], order, [n + 1]))
+    while True:
+        a, b = path[:-1], path[1:]
+        length = E[a, b]
+        delta = (
+            E[a[:, None], a[None, :]]
+            + E[b[:, None], b[None, :]]
+            - length[:, None]
+            - length[None, :]
+        )
+        delta = np.triu(delta, 2)
+        k, l = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[k, l] > -1e-9:
+            break
+        path[k + 1 : l + 1] = path[k + 1 : l + 1][::-1].copy()
+    return path[1:-1]
+
+
+def _chain(
+    tours: List[np.ndarray],
+    points: np.ndarray,
+    metric: str,
+    start: Sequence[float] = None,
+) -> np.ndarray:
+    """Concatenates tours in the given order, each forwards or backwards,
+    minimizing the moves between consecutive tours."""
+    if not tours:
+        return np.zeros(0, dtype=int)
+    # ends[i, f]: (first, last) point of tour i traversed in direction f
+    ends = [((t[0], t[-1]), (t[-1], t[0])) for t in tours]
+    cost = np.zeros(2)
+    if start is not None:
+        first = np.array([ends[0][f][0] for f in range(2)])
+        cost = _distances(np.reshape(start, (1, 2)), points[first], metric)[0]
+    back = []
+    for i in range(1, len(tours)):
+        last = points[[ends[i - 1][f][1] for f in range(2)]]
+        first = points[[ends[i][f][0] for f in range(2)]]
+        # total[f_prev, f]
+        total = cost[:, None] + _distances(last, first, metric)
+        back.append(np.argmin(total, axis=0))
+        cost = total.min(axis=0)
+    flips = [int(np.argmin(cost))]
+    for b in reversed(back):
+        flips.append(int(b[flips[-1]]))
+    flips.reverse()
+    return np.concatenate([t[::-1] if f else t for t, f in zip(tours, flips)])
+
+
+def plan(
+    table: DeviceTable,
+    factory: str,
+    where: Dict[str, object] = None,
+    by: str = "die",
+    metric: str = "euclidean",
+    start: Sequence[float] = None,
+) -> List[Step]:
+    """Plans the probing order of the structures of one factory.
+
+    Parameters:
+        table (DeviceTable): device metadata of the layout
+        factory (str): factory of the structures to probe, e.g. "tlm"
+        where (dict or None): only structures whose parameters have these
+            values, e.g. {"L_gate": 0}
+        by (str): "die" to probe die by die, "pattern" to probe structures
+            with the same pad arrangement in one pass over all dies
+        metric (str): stage move length, see route()
+        start (array-like[2] or None): stage position before the first step
+
+    Returns:
+        List[Step]: the steps, in probing order
+    """
+    rows = table.select(factory=factory)
+    if where:
+        rows = np.array(
+            [
+                i
+                for i in rows
+                if all(table.row(i)["parameters"].get(k) == v for k, v in where.items())
+            ],
+            dtype=int,
+        )
+    steps = []
+    for i in rows:
+        row = table.row(i)
+        pads = row["pads"]
+        x, y = map(float, pads[0] if len(pads) else (row["x"], row["y"]))
+        pads = tuple((float(px), float(py)) for px, py in pads)
+        steps.append(Step(str(row["die"]), int(i), str(row["cell"]), x, y, pads))
+    if not steps:
+        return []
+    points = np.array([(s.x, s.y) for s in steps])
+
+    groups = {}
+    if by == "die":
+        keys = [s.die for s in steps]
+    elif by == "pattern":
+        keys = [
+            tuple(np.round(np.subtract(s.pads, s.pads[0]), 3).ravel().tolist())
+            for s in steps
+        ]
+    else:
+        raise ValueError(f"unknown grouping {by!r}")
+    for k, key in enumerate(keys):
+        groups.setdefault(key, []).append(k)
+    groups = [np.array(g) for g in groups.values()]
+    tours = [g[route(points[g], metric)] for g in groups]
+    if by == "die":
+        centers = np.array([points[g].mean(axis=0) for g in groups])
+        tours = [tours[k] for k in route(centers, metric, start)]
+    order = _chain(tours, points, metric, start)
+    return [steps[k] for k in order]
+
+
+def travel(steps: Sequence[Step], metric: str = "euclidean") -> float:
+    """Total stage travel between the steps.
+
+    Parameters:
+        steps (Sequence[Step]): steps in probing order
+        metric (str): stage move length, see route()
+
+    Returns:
+        float: sum of the moves
+    """
+    if len(steps) < 2:
+        return 0.0
+    p = np.array([(s.x, s.y) for s in steps])
+    d = _distances(p[:-1], p[1:], metric)
+    return float(np.trace(d))
+
+
+def write_steps(filename: str, steps: Sequence[Step]) -> None:
+    """Writes the steps as CSV: one line per step with the die, the stage
+    position (first pad), the move from the previous step and the centers
+    of all pads.
+
+    Parameters:
+        filename (str): file to write
+        steps (Sequence[Step]): steps in probing order
+    """
+    n_pads = max((len(s.pads) for s in steps), default=0)
+    header = ["step", "die", "cell", "x", "y", "dx", "dy"]
+    for k in range(n_pads):
+        header += [f"pad{k + 1}_x", f"pad{k + 1}_y"]
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        previous = None
+        for n, s in enumerate(steps):
+            dx, dy = (0, 0) if previous is None else np.subtract((s.x, s.y), previous)
+            line = [n + 1, s.die, s.cell] + [f"{v:.3f}" for v in (s.x, s.y, dx, dy)]
+            line += [f"{v:.3f}" for p in s.pads for v in p]
+            writer.writerow(line)
+            previous = (s.x, s.y)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sidecar", help=".npz file written by the build")
+    parser.add_argument("factory", help="factory of the structures, e.g. tlm")
+    parser.add_argument(
+        "--where",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="only structures with this parameter value (JSON), repeatable",
+    )
+    parser.add_argument("--by", choices=("die", "pattern"), default="die")
+    parser.add_argument(
+        "--metric", choices=("euclidean", "chebyshev", "manhattan"), default="euclidean"
+    )
+    parser.add_argument("-o", "--output", help="CSV file to write")
+    args = parser.parse_args()
+
+    where = {}
+    for item in args.where:
+        name, value = item.split("=", 1)
+        where[name] = json.loads(value)
+    table = DeviceTable.load(args.sidecar)
+    steps = plan(table, args.factory, where, by=args.by, metric=args.metric)
+    if args.output:
+        write_steps(args.output, steps)
+    # the layout order, for comparison
+    unordered = sorted(steps, key=lambda s: s.row)
+    print(
+        f"{len(steps)} steps, travel {travel(steps, args.metric) / 1e3:.1f} mm "
+        f"(layout order {travel(unordered, args.metric) / 1e3:.1f} mm)"
+    )
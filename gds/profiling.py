@@ -0,0 +1,243 @@
+"""Opt-in profiling of layout construction.
+
+While a Profiler is active, the make_gds.py factories (and the label,
+square-count and array-placement helpers) are wrapped to record call
+counts, cumulative and self time, polygons created and boolean operations
+invoked. Nothing is patched outside of the `with` block.
+
+    with Profiler() as prof:
+        test_chip(True, ls)
+    print(prof.summary())
+    prof.write_collapsed("test_chip.folded")
+
+Calls made in gridsweep worker processes (processes > 1) are not recorded;
+profile with processes=1.
+
+The .folded file uses the collapsed-stack format understood by
+flamegraph.pl and speedscope (one "a;b;c <microseconds>" line per stack).
+"""
+
+import functools
+import time
+from typing import Dict, List, Sequence, Tuple
+
+import gdspy
+import phidl.device_layout as dl
+import phidl.geometry as pg
+
+import arrays
+import labels
+import make_gds
+import squares
+
+# (module, attribute) pairs wrapped by default
+FACTORIES = [
+    (make_gds, name)
+    for name in (
+        "mos_cap",
+        "mim_cap",
+        "transistor",
+        "gated_vdp",
+        "vdp_metal",
+        "metal_resistor",
+        "step_heights",
+        "via_tests",
+        "tlm",
+        "test_via",
+        "test_chip",
+        "wafer_array",
+    )
+]
+HELPERS = [
+    (make_gds, "label"),
+    (make_gds, "place_array"),
+    (make_gds, "resistor_squares"),
+    (make_gds, "check_squares"),
+    (squares, "fem_squares"),
+    (arrays, "arrayize"),
+    (labels, "glyphs"),
+    (pg, "union"),
+    (pg, "boolean"),
+]
+# calls counted as boolean operations
+BOOLEANS = [
+    (gdspy, "boolean"),
+    (gdspy, "offset"),
+    (pg.clipper, "clip"),
+    (pg.clipper, "offset"),
+]
+
+
+class _Stats:
+    __slots__ = ("calls", "cumulative", "self", "polygons", "booleans")
+
+    def __init__(self):
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self = 0.0
+        self.polygons = 0
+        self.booleans = 0
+
+
+class _Frame:
+    __slots__ = ("name", "start", "child_time", "polygons", "booleans")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.child_time = 0.0
+        self.polygons = 0
+        self.booleans = 0
+
+
+class Profiler:
+    """Records per-function statistics of layout construction.
+
+    Parameters:
+        targets (Sequence[tuple]): (module, attribute) pairs of functions to
+            wrap, defaults to the factories plus label/squares/placement
+            helpers
+    """
+
+    def __init__(self, targets: Sequence[Tuple] = None):
+        self.targets = list(FACTORIES + HELPERS if targets is None else targets)
+        self.stats = {}
+        self.stacks = {}
+        self._stack = [_Frame("<root>")]
+        self._patched = []
+
+    def _wrap(self, name: str, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            frame = _Frame(name)
+            self._stack.append(frame)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._stack.pop()
+                elapsed = time.perf_counter() - frame.start
+                s = self.stats.setdefault(name, _Stats())
+                s.calls += 1
+                # recursive calls are only counted once in cumulative time
+                if all(f.name != name for f in self._stack):
+                    s.cumulative += elapsed
+                s.self += elapsed - frame.child_time
+                s.polygons += frame.polygons
+                s.booleans += frame.booleans
+                parent = self._stack[-1]
+                parent.child_time += elapsed
+                parent.polygons += frame.polygons
+                parent.booleans += frame.booleans
+                stack = ";".join(f.name for f in self._stack[1:] + [frame])
+                self.stacks[stack] = self.stacks.get(stack, 0) + (
+                    elapsed - frame.child_time
+                )
+
+        return wrapper
+
+    def _count(self, attribute: str, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            setattr(self._stack[-1], attribute, getattr(self._stack[-1], attribute) + 1)
+            return function(*args, **kwargs)
+
+        return wrapper
+
+    def _patch(self, owner, attribute: str, replacement) -> None:
+        self._patched.append((owner, attribute, getattr(owner, attribute)))
+        setattr(owner, attribute, replacement)
+
+    def __enter__(self):
+        for module, attribute in self.targets:
+            self._patch(
+                module, attribute, self._wrap(attribute, getattr(module, attribute))
+            )
+        for module, attribute in BOOLEANS:
+            self._patch(
+                module, attribute, self._count("booleans", getattr(module, attribute))
+            )
+        self._patch(
+            dl.Polygon, "__init__", self._count("polygons", dl.Polygon.__init__)
+        )
+        return self
+
+    def __exit__(self, *exc):
+        for owner, attribute, original in reversed(self._patched):
+            setattr(owner, attribute, original)
+        self._patched = []
+        return False
+
+    def summary(self, sort: str = "cumulative") -> str:
+        """Formats the collected statistics as a table.
+
+        Parameters:
+            sort (str): column to sort by (calls, cumulative, self, polygons,
+                booleans)
+
+        Returns:
+            str: the table
+        """
+        rows = sorted(
+            self.stats.items(), key=lambda kv: getattr(kv[1], sort), reverse=True
+        )
+        lines = [
+            f"{'function':20s} {'calls':>7s} {'cum [s]':>9s} {'self [s]':>9s} "
+            f"{'polygons':>9s} {'booleans':>9s}"
+        ]
+        for name, s in rows:
+            lines.append(
+                f"{name:20s} {s.calls:7d} {s.cumulative:9.3f} {s.self:9.3f} "
+                f"{s.polygons:9d} {s.booleans:9d}"
+            )
+        root = self._stack[0]
+        lines.append(
+            f"{'(total)':20s} {'':7s} {'':9s} {'':9s} "
+            f"{root.polygons:9d} {root.booleans:9d}"
+        )
+        return "\n".join(lines)
+
+    def collapsed(self) -> List[str]:
+        """Returns the trace in collapsed-stack format, self time in
+        microseconds."""
+        return [
+            f"{stack} {round(t * 1e6)}"
+            for stack, t in sorted(self.stacks.items())
+            if round(t * 1e6) > 0
+        ]
+
+    def write_collapsed(self, filename: str) -> None:
+        """Writes the collapsed-stack trace for flame graph tools.
+
+        Parameters:
+            filename (str): output file
+        """
+        with open(filename, "w") as f:
+            f.write("\n".join(self.collapsed()) + "\n")
+
+    def as_dict(self) -> Dict[str, Dict]:
+        """Returns the statistics as plain data."""
+        return {
+            name: {k: getattr(s, k) for k in _Stats.__slots__}
+            for name, s in self.stats.items()
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "target", nargs="?", default="test_chip", choices=["test_chip", "wafer_array"]
+    )
+    parser.add_argument("-o", "--output", default="profile.folded")
+    parser.add_argument("-s", "--sort", default="cumulative")
+    args = parser.parse_args()
+
+    ls = make_gds.default_layer_set()
+    with Profiler() as prof:
+        if args.target == "test_chip":
+            make_gds.test_chip(True, ls)
+        else:
+            make_gds.wafer_array(ls)
+    print(prof.summary(args.sort))
+    prof.write_collapsed(args.output)
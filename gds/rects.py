@@ -0,0 +1,153 @@
+"""Batch construction of axis-aligned rectangles.
+
+pg.rectangle() allocates a Device (and, once referenced, a GDS cell) per
+rectangle, which then has to be positioned through
+.move()/.xmin/.center. The functions here take arrays of corner
+coordinates and layers instead and add all rectangles of a layer to the
+target Device as a single polygon set.
+"""
+
+from typing import List, Sequence, Union
+
+import numpy as np
+from phidl import Device
+from phidl.device_layout import Polygon
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+
+def boxes(center: ArrayLike, size: ArrayLike) -> np.ndarray:
+    """Converts centers and sizes to corner coordinates.
+
+    Parameters:
+        center (array-like[N][2]): rectangle centers
+        size (array-like[N][2]): rectangle widths and heights
+
+    Returns:
+        np.ndarray: (N, 4) array of x0, y0, x1, y1
+    """
+    center = np.atleast_2d(np.asarray(center, dtype=float))
+    half = np.atleast_2d(np.asarray(size, dtype=float)) / 2
+    return np.hstack((center - half, center + half))
+
+
+def bbox(rects: np.ndarray) -> np.ndarray:
+    """Bounding box of (N, 4) corner coordinates, in Device.bbox form.
+
+    Parameters:
+        rects (np.ndarray): x0, y0, x1, y1 per row
+
+    Returns:
+        np.ndarray: [[xmin, ymin], [xmax, ymax]]
+    """
+    rects = np.atleast_2d(rects)
+    return np.array(
+        [
+            [rects[:, [0, 2]].min(), rects[:, [1, 3]].min()],
+            [rects[:, [0, 2]].max(), rects[:, [1, 3]].max()],
+        ]
+    )
+
+
+def translate(rects: np.ndarray, offset: ArrayLike) -> np.ndarray:
+    """Moves rows of (x0, y0, x1, y1, ...) by offset.
+
+    Parameters:
+        rects (array-like[N][4+]): corner coordinates, extra columns (e.g.
+            the layer) are kept
+        offset (array-like[2]): x and y displacement
+
+    Returns:
+        np.ndarray: moved copy of rects
+    """
+    rects = np.array(np.atleast_2d(rects), dtype=float)
+    rects[:, [0, 2]] += offset[0]
+    rects[:, [1, 3]] += offset[1]
+    return rects
+
+
+def rectangle_points(
+    x0: ArrayLike, y0: ArrayLike, x1: ArrayLike, y1: ArrayLike
+) -> np.ndarray:
+    """Vertices of a batch of rectangles, in the order used by pg.rectangle().
+
+    Parameters:
+        x0, y0, x1, y1 (array-like[N]): opposite corners of each rectangle
+
+    Returns:
+        np.ndarray: (N, 4, 2) array of vertices
+    """
+    x0, y0, x1, y1 = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(v, dtype=float)) for v in (x0, y0, x1, y1))
+    )
+    xl, xh = np.minimum(x0, x1), np.maximum(x0, x1)
+    yl, yh = np.minimum(y0, y1), np.maximum(y0, y1)
+    return np.stack(
+        (
+            np.stack((xh, yh), axis=-1),
+            np.stack((xh, yl), axis=-1),
+            np.stack((xl, yl), axis=-1),
+            np.stack((xl, yh), axis=-1),
+        ),
+        axis=1,
+    )
+
+
+def add_rectangles(
+    D: Device,
+    x0: ArrayLike,
+    y0: ArrayLike,
+    x1: ArrayLike,
+    y1: ArrayLike,
+    layer: ArrayLike,
+    datatype: ArrayLike = 0,
+) -> List[Polygon]:
+    """Adds a batch of rectangles to D, one polygon set per layer.
+
+    Parameters:
+        D (Device): device to add the rectangles to
+        x0, y0, x1, y1 (array-like[N]): opposite corners of each rectangle
+        layer (int or array-like[N]): GDS layer of each rectangle
+        datatype (int or array-like[N]): GDS datatype of each rectangle
+
+    Returns:
+        List[Polygon]: the created polygon sets
+    """
+    points = rectangle_points(x0, y0, x1, y1)
+    layer, datatype = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(layer, dtype=int)),
+        np.atleast_1d(np.asarray(datatype, dtype=int)),
+    )
+    layer = np.broadcast_to(layer, len(points))
+    datatype = np.broadcast_to(datatype, len(points))
+    specs = np.stack((layer, datatype), axis=-1)
+    created = []
+    for spec in np.unique(specs, axis=0):
+        idx = np.flatnonzero(np.all(specs == spec, axis=1))
+        polygon = Polygon(points[idx[0]], int(spec[0]), int(spec[1]), parent=D)
+        polygon.polygons = list(points[idx])
+        polygon.layers = [int(spec[0])] * len(idx)
+        polygon.datatypes = [int(spec[1])] * len(idx)
+        D.add(polygon)
+        created.append(polygon)
+    return created
+
+
+def rectangles(
+    rects: np.ndarray, name: str = "rectangles", datatype: ArrayLike = 0
+) -> Device:
+    """Creates a Device from rows of (x0, y0, x1, y1, layer).
+
+    Parameters:
+        rects (array-like[N][5]): corners and GDS layer of each rectangle
+        name (str): name of the Device
+        datatype (int or array-like[N]): GDS datatype of each rectangle
+
+    Returns:
+        Device: the rectangles
+    """
+    rects = np.asarray(rects, dtype=float).reshape(-1, 5)
+    D = Device(name)
+    if len(rects):
+        add_rectangles(D, *rects[:, :4].T, rects[:, 4], datatype)
+    return D
@@ -0,0 +1,209 @@
+"""Square counts for meandered resistors.
+
+The analytic model follows the construction of qnngds' meander():
+straight hairpin arms, a connector per hairpin and two end stubs. qnngds
+sizes the hairpins assuming 0.545 squares per 90 degree bend and 1.545
+squares per end; the model replaces that with the conformal-mapping
+value for a square corner and the squares the end stubs actually add,
+and adds the spreading resistance where the wire enters a contact pad.
+test_squares.py checks the model against a finite-difference solution.
+
+FEM (phidlfem) is only used in verify mode, to check the analytic value.
+FEM results are stored in a persistent cache keyed on a hash of the
+geometry, so each unique resistor is solved once.
+"""
+
+import hashlib
+import json
+import os
+import warnings
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from phidl import Device
+
+from cell_cache import CELL_CACHE
+
+# squares contributed by a 90 degree bend of a uniform-width wire
+CORNER_SQUARES = 0.559
+# bend and end values assumed by qnngds.devices.resistor.meander
+QNNGDS_CORNER_SQUARES = 1.09 / 2
+QNNGDS_END_SQUARES = 3.09 / 2
+
+CACHE_PATH = os.path.join(".layout_cache", "squares.json")
+
+_verify = False
+
+
+def set_verify(enabled: bool = True) -> None:
+    """Enables checking analytic square counts against FEM.
+
+    Parameters:
+        enabled (bool): if True, run (cached) FEM for every new resistor
+    """
+    global _verify
+    _verify = bool(enabled)
+    # part of the cell cache key, so that resistors built without the check
+    # are not reused
+    CELL_CACHE.set_context("verify_squares", _verify)
+
+
+def verify_enabled() -> bool:
+    """Returns True if verify mode is on."""
+    return _verify
+
+
+def meander_turns(width: float, pitch: float, max_length: Optional[float]) -> int:
+    """Number of hairpins qnngds' meander() builds (0 for a straight wire)."""
+    if max_length is None:
+        return 0
+    return int(np.ceil((max_length - 3 * width) / pitch))
+
+
+def meander_squares(
+    width: float, pitch: float, squares: float, max_length: Optional[float]
+) -> float:
+    """Analytic square count of a qnngds meander between its two ports.
+
+    Parameters:
+        width (float): wire width
+        pitch (float): meander pitch
+        squares (float): requested number of squares
+        max_length (float or None): maximum meander length
+
+    Returns:
+        float: corrected number of squares
+    """
+    if max_length is None or width * squares < max_length:
+        # straight wire
+        return squares
+    # two bends per hairpin
+    corners = 2 * meander_turns(width, pitch, max_length)
+    # each end stub bends the wire and extends one square beyond the arm,
+    # but covers the last half square of the arm
+    ends = 2 * (0.5 + CORNER_SQUARES - QNNGDS_END_SQUARES)
+    return squares + corners * (CORNER_SQUARES - QNNGDS_CORNER_SQUARES) + ends
+
+
+def step_squares(narrow: float, wide: float) -> float:
+    """Excess squares of a symmetric step from a wire of width narrow into a
+    conductor of width wide, referred to the sheet resistance.
+
+    Parameters:
+        narrow (float): width of the narrow wire
+        wide (float): width of the wide conductor
+
+    Returns:
+        float: squares to add to the sum of the two straight sections
+    """
+    r = narrow / wide
+    if r >= 1:
+        return 0
+    return (
+        (1 + r**2) / r * np.log((1 + r) / (1 - r)) - 2 * np.log(4 * r / (1 - r**2))
+    ) / (2 * np.pi)
+
+
+def resistor_squares(
+    width: float,
+    pitch: float,
+    squares: float,
+    max_length: Optional[float],
+    pad_size: Tuple[float, float],
+) -> float:
+    """Square count reported on metal_resistor() labels: the mean of the
+    meander alone and the meander including both contact pads (measured to the
+    far edge of each pad).
+
+    Parameters:
+        width (float): wire width
+        pitch (float): meander pitch
+        squares (float): requested number of squares
+        max_length (float or None): maximum meander length
+        pad_size (tuple(float,float)): pad length and width
+
+    Returns:
+        float: number of squares
+    """
+    m = meander_squares(width, pitch, squares, max_length)
+    pads = 2 * (pad_size[0] / pad_size[1] + step_squares(width, pad_size[1]))
+    return m + pads / 2
+
+
+def geometry_hash(D: Device, mesh_size: float) -> str:
+    """Hash of the polygons and ports of D (rounded to 1 nm) and the mesh size,
+    used as the FEM cache key."""
+    h = hashlib.sha1()
+    polygons = D.get_polygons(by_spec=True)
+    for spec in sorted(polygons):
+        h.update(repr(spec).encode())
+        for p in sorted(
+            np.round(np.asarray(p) * 1000).astype(np.int64).tobytes()
+            for p in polygons[spec]
+        ):
+            h.update(p)
+    for name in sorted(D.ports, key=str):
+        port = D.ports[name]
+        h.update(repr((name, np.round(port.midpoint, 3).tolist(), port.width)).encode())
+        h.update(repr(round(port.orientation, 3)).encode())
+    h.update(repr(mesh_size).encode())
+    return h.hexdigest()
+
+
+def fem_squares(D: Device, mesh_size: float = 2, cache_path: str = None) -> float:
+    """Number of squares between ports 1 and 2 of D, from phidlfem.
+
+    Parameters:
+        D (Device): conductor geometry with ports 1 and 2
+        mesh_size (float): FEM mesh size
+        cache_path (str): JSON cache file, defaults to CACHE_PATH
+
+    Returns:
+        float: number of squares
+    """
+    if cache_path is None:
+        cache_path = CACHE_PATH
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    key = geometry_hash(D, mesh_size)
+    if key not in cache:
+        import phidlfem.analysis as pfa
+
+        cache[key] = float(pfa.get_squares(D, mesh_size)[1])
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        with open(cache_path + ".tmp", "w") as f:
+            json.dump(cache, f, indent=1, sort_keys=True)
+        os.replace(cache_path + ".tmp", cache_path)
+    return cache[key]
+
+
+def check_squares(
+    expected: float,
+    devices: Sequence[Device],
+    mesh_size: float = 2,
+    rtol: float = 0.02,
+    name: str = "",
+) -> float:
+    """Compares an analytic square count against the mean FEM result over
+    devices and warns if they disagree by more than rtol.
+
+    Parameters:
+        expected (float): analytic number of squares
+        devices (Sequence[Device]): geometries whose FEM results are averaged
+        mesh_size (float): FEM mesh size
+        rtol (float): relative tolerance
+        name (str): structure name used in the warning
+
+    Returns:
+        float: the FEM number of squares
+    """
+    fem = np.mean([fem_squares(D, mesh_size) for D in devices])
+    if abs(fem - expected) > rtol * abs(fem):
+        warnings.warn(
+            f"{name}: analytic square count {expected:.2f} differs from FEM "
+            f"{fem:.2f}"
+        )
+    return fem
@@ -0,0 +1,26 @@
+import phidl.geometry as pg
+from phidl import Device
+
+import bbox_cache
+
+
+def test_import_does_not_patch():
+    import make_gds  # noqa: F401
+
+    assert "get_bounding_box" not in Device.__dict__
+
+
+def test_enabled():
+    with bbox_cache.enabled():
+        assert "get_bounding_box" in Device.__dict__
+        with bbox_cache.enabled():
+            pass
+        # the inner block leaves the outer one enabled
+        assert "get_bounding_box" in Device.__dict__
+        D = Device("top")
+        R = D << pg.rectangle(size=(2, 1))
+        R.rotate(30)
+        cached = D.bbox
+    assert "get_bounding_box" not in Device.__dict__
+    D._bb_valid = False
+    assert abs(D.bbox - cached).max() < 1e-9
@@ -0,0 +1,153 @@
+"""Checks that the cell store invalidates cells when a helper changes, and that
+stores sharing a directory do not trip over each other's evictions."""
+
+import importlib
+import multiprocessing
+import textwrap
+
+import phidl.geometry as pg
+from phidl import Device
+
+import cell_store
+from cell_cache import CellCache
+from cell_store import CellStore, source_files
+
+HELPER = """
+def width():
+    return {width}
+"""
+
+FACTORY = """
+import phidl.geometry as pg
+from phidl import Device
+
+from store_helper import width
+
+
+def pad():
+    D = Device("pad")
+    D << pg.rectangle(size=(width(), 1))
+    return D
+"""
+
+
+def _write(path, source):
+    path.write_text(textwrap.dedent(source))
+
+
+def _build(store_path):
+    import store_factory
+
+    cache = CellCache(store=CellStore(str(store_path)))
+    return cache(store_factory.pad)(), cache.store
+
+
+def test_helper_edit_invalidates(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    _write(tmp_path / "store_helper.py", HELPER.format(width=2))
+    _write(tmp_path / "store_factory.py", FACTORY)
+    _write(tmp_path / "unrelated.py", "X = 1\n")
+    store_path = tmp_path / "cells"
+
+    import store_factory
+    import store_helper
+
+    assert sorted(p.rsplit("/", 1)[-1] for p in source_files(store_factory.pad)) == [
+        "store_factory.py",
+        "store_helper.py",
+    ]
+
+    D, store = _build(store_path)
+    assert (store.hits, store.writes, D.xsize) == (0, 1, 2)
+    D, store = _build(store_path)
+    assert (store.hits, store.writes, D.xsize) == (1, 0, 2)
+
+    # an unrelated module does not invalidate the cell
+    _write(tmp_path / "unrelated.py", "X = 2\n")
+    D, store = _build(store_path)
+    assert store.hits == 1
+
+    _write(tmp_path / "store_helper.py", HELPER.format(width=6))
+    importlib.reload(store_helper)
+    importlib.reload(store_factory)
+    D, store = _build(store_path)
+    assert (store.hits, store.writes, D.xsize) == (0, 1, 6)
+
+
+def _cell(width):
+    D = Device("cell")
+    D << pg.rectangle(size=(width, 1))
+    return D
+
+
+def _key(width):
+    return (__name__, "_cell", (("width", width),), ())
+
+
+def _fill(store, widths):
+    for w in widths:
+        store.put(_key(w), _cell, _cell(w))
+
+
+def test_shared_directory(tmp_path, monkeypatch):
+    # two stores on one directory, as in forked parallel_gridsweep workers;
+    # the other store evicts a file between the steps of get/evict/stats
+    a = CellStore(str(tmp_path))
+    b = CellStore(str(tmp_path))
+    _fill(a, range(1, 6))
+
+    load = cell_store.pickle.load
+
+    def load_then_clear(f):
+        data = load(f)
+        b.clear()
+        return data
+
+    monkeypatch.setattr(cell_store.pickle, "load", load_then_clear)
+    assert a.get(_key(1), _cell).xsize == 1
+    assert a.get(_key(2), _cell) is None
+    monkeypatch.undo()
+
+    _fill(a, range(1, 6))
+    walk = cell_store.os.walk
+    cleared = []
+
+    def walk_then_clear(path):
+        listing = list(walk(path))
+        if not cleared:
+            cleared.append(path)
+            b.clear()
+        return listing
+
+    monkeypatch.setattr(cell_store.os, "walk", walk_then_clear)
+    assert a.stats()["cells"] == 0
+    monkeypatch.undo()
+
+    _fill(a, range(1, 6))
+    entries = a._entries()
+    b.clear()
+    monkeypatch.setattr(a, "_entries", lambda: entries)
+    a.max_bytes = 0
+    a.evict()
+    assert a.evictions == 0
+
+
+def _worker(path, offset):
+    store = CellStore(path, max_bytes=2000)
+    for n in range(40):
+        w = 1 + (n + offset) % 7
+        if store.get(_key(w), _cell) is None:
+            store.put(_key(w), _cell, _cell(w))
+
+
+def test_concurrent_stores(tmp_path):
+    # small enough that every put evicts cells the other process uses
+    ctx = multiprocessing.get_context("fork")
+    workers = [
+        ctx.Process(target=_worker, args=(str(tmp_path), offset)) for offset in (0, 3)
+    ]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert [p.exitcode for p in workers] == [0, 0]
@@ -0,0 +1,54 @@
+"""Connectivity extraction of rotated (non-Manhattan) structures."""
+
+import phidl.geometry as pg
+import pytest
+from phidl import Device
+
+import make_gds
+from connectivity import check, default_stack, extract
+
+LS = make_gds.default_layer_set()
+LEVELS = {LS[name].gds_layer: k for k, name in enumerate(default_stack())}
+
+
+def _pads(rotation):
+    """Three gate pad stacks, 10 um apart, each with a source/drain lead that
+    only shares an edge with the pad cover."""
+    D = Device("VDP(test)")
+    layers = (LS["gate"].gds_layer, LS["via"].gds_layer)
+    for k in range(3):
+        pad = D << make_gds.pad_stack((100, 100), layers, LS["sourcedrain"].gds_layer)
+        pad.move((110 * k, 0))
+        lead = D << pg.rectangle((10, 50), layer=LS["sourcedrain"].gds_layer)
+        lead.move((pad.x - 5, pad.ymax))
+    D.rotate(rotation)
+    return D
+
+
+@pytest.mark.parametrize("rotation", [0, 30, 45])
+def test_rotated_pads(rotation):
+    nets = extract(_pads(rotation), LEVELS)
+    assert len(nets.pads) == 3
+    assert nets.open == ()
+    assert nets.shorted == ()
+
+
+def test_rotated_gated_vdp():
+    pytest.importorskip("qnngds.tests")
+    for rotation in (0, 45):
+        nets = extract(make_gds.gated_vdp(rotation=rotation, layer_set=LS), LEVELS)
+        assert len(nets.pads) == 5
+        assert nets.open == ()
+
+
+def test_stacked_marks():
+    D = Device("array")
+    for name, l in LS._layers.items():
+        square = pg.rectangle(size=(10, 10), layer=l.gds_layer)
+        square.name = f"CORNER({name})"
+        D << square
+    assert check(D, LS) == []
+    # another cell touching the marks is still reported, at the gate and via
+    # squares
+    D << pg.rectangle(size=(10, 10), layer=LS["gate"].gds_layer)
+    assert [f.kind for f in check(D, LS)] == ["contact"] * 2
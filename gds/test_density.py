@@ -0,0 +1,47 @@
+"""Checks the tile densities against gdspy booleans."""
+
+import gdspy
+import numpy as np
+import phidl.geometry as pg
+from phidl import Device
+
+import density
+
+
+def _layout(seed):
+    rng = np.random.default_rng(seed)
+    D = Device("density")
+    for x, y, w, h in zip(*rng.uniform((0, 0, 1, 1), (400, 400, 80, 80), (60, 4)).T):
+        (D << pg.rectangle((w, h), layer=1)).move((x, y))
+    for x, y, r in zip(*rng.uniform((0, 0, 5), (400, 400, 30), (10, 3)).T):
+        (D << pg.circle(r, layer=1)).move((x, y))
+    return D
+
+
+def test_overlaps_counted_once():
+    D = _layout(0)
+    dmap = density.density(D, tile_size=100)
+    union = gdspy.boolean(D.get_polygons(), None, "or", precision=1e-6)
+    ny, nx = dmap.maps[1].shape
+    for j in range(ny):
+        for i in range(nx):
+            x, y = np.add(dmap.origin, (i * 100, j * 100))
+            tile = gdspy.Rectangle((x, y), (x + 100, y + 100))
+            covered = gdspy.boolean(union, tile, "and", precision=1e-6)
+            area = covered.area() if covered is not None else 0
+            assert abs(dmap.maps[1][j, i] - area / 100**2) < 1e-6
+
+
+def test_overlapping_pairs():
+    rng = np.random.default_rng(1)
+    lo = rng.uniform(0, 1000, (300, 2))
+    # sizes over three orders of magnitude, to use several grid levels
+    size = 10 ** rng.uniform(-1, 2.5, (300, 1)) * rng.uniform(0.5, 1, (300, 2))
+    boxes = np.hstack((lo, lo + size))
+    i, j = density._overlapping(boxes)
+    a, b = boxes[:, None], boxes[None]
+    overlap = (np.minimum(a[..., 2], b[..., 2]) > np.maximum(a[..., 0], b[..., 0])) & (
+        np.minimum(a[..., 3], b[..., 3]) > np.maximum(a[..., 1], b[..., 1])
+    )
+    expected = np.argwhere(np.triu(overlap, 1))
+    assert sorted(zip(i.tolist(), j.tolist())) == sorted(map(tuple, expected.tolist()))
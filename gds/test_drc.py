@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+
+import phidl.geometry as pg
+import pytest
+from phidl import Device
+
+import drc
+import make_gds
+import metadata as md
+from arrays import place_array
+from gds_stream import GdsStream
+
+DRC = os.path.join(os.path.dirname(os.path.abspath(drc.__file__)), "drc.py")
+
+
+def _array(ls):
+    # dies with and without cover_bottom on alternate rows, as in
+    # make_gds.wafer_array()
+    A = Device("array")
+    for n, cover in enumerate((False, True)):
+        T = Device("DIE")
+        T << make_gds.transistor(cover_bottom=cover, layer_set=ls)
+        T.info["cover_bottom"] = cover
+        place_array(
+            A, T, [(500 * i, 500 * (2 * j + n)) for i in range(2) for j in range(2)]
+        )
+    A << pg.cross(length=100, width=2, layer=ls["gate"].gds_layer).move((-300, 0))
+    return A
+
+
+@pytest.fixture
+def layout(tmp_path):
+    ls = make_gds.default_layer_set()
+    A = _array(ls)
+    gds = str(tmp_path / "array.gds")
+    # written as by make_gds.build(): hashed cell names and the sidecar
+    with GdsStream(gds, cellname="top") as stream:
+        stream.write(A, top=True)
+    md.write(str(tmp_path / "array.npz"), md.collect(A))
+    # the dies without cover_bottom break the cover rule
+    assert drc.check(A, ls, *drc.default_rules(cover_bottom=True))
+    return gds
+
+
+def _run(*args):
+    return subprocess.run(
+        [sys.executable, DRC, *args],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(DRC),
+    )
+
+
+def _dies(gds):
+    D = pg.import_gds(gds, flatten=False)
+    covers = drc.die_cover_bottom(D, md.DeviceTable.load(gds[:-4] + ".npz").columns)
+    return {ref.parent.name for ref in D.references}, covers
+
+
+def test_sidecar(layout):
+    names, covers = _dies(layout)
+    assert sorted(covers.values()) == [False, True]
+    assert set(covers) < names
+    result = _run(layout)
+    assert result.returncode == 0, result.stderr
+    assert "\n0 violations\n" in "\n" + result.stdout
+
+
+def test_without_sidecar(layout):
+    _, covers = _dies(layout)
+    os.remove(layout[:-4] + ".npz")
+    result = _run(layout)
+    assert result.returncode == 2
+    assert "--no-cover" in result.stderr
+    assert all(name in result.stderr for name in covers)
+    assert _run("--no-cover", layout).returncode == 0
+    # per die overrides
+    args = [f"--cover={name}={cover}" for name, cover in covers.items()]
+    result = _run(*args, layout)
+    assert result.returncode == 0, result.stderr
+    assert "\n0 violations\n" in "\n" + result.stdout
+    swapped = [f"--cover={name}={not cover}" for name, cover in covers.items()]
+    assert "\n0 violations\n" not in "\n" + _run(*swapped, layout).stdout
+
+
+def test_disagreeing_structures():
+    ls = make_gds.default_layer_set()
+    T = Device("DIE")
+    T << make_gds.transistor(cover_bottom=False, layer_set=ls)
+    (T << make_gds.transistor(cover_bottom=True, layer_set=ls)).move((200, 0))
+    A = Device("array")
+    A << T
+    with pytest.raises(ValueError, match="disagree"):
+        drc.die_cover_bottom(A, md.collect(A))
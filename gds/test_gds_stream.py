@@ -0,0 +1,40 @@
+import gdspy
+import phidl.geometry as pg
+import pytest
+from phidl import Device
+
+from cell_names import HASH_LENGTH
+from gds_stream import GdsStream
+
+
+def _factory_cell(size):
+    # a cell named as CellCache names factory cells
+    D = pg.rectangle(size=(size, 5), layer=1)
+    D.name = "RECT_" + "0" * HASH_LENGTH
+    return D
+
+
+def test_equal_names_written_once(tmp_path):
+    filename = str(tmp_path / "a.gds")
+    with GdsStream(filename) as stream:
+        a = stream.write(_factory_cell(10))
+        b = stream.write(_factory_cell(10))
+        assert a == b
+        assert stream.cells_written == 1
+    assert list(gdspy.GdsLibrary(infile=filename).cells) == [a]
+
+
+def test_name_collision(tmp_path):
+    with GdsStream(str(tmp_path / "a.gds")) as stream:
+        stream.write(_factory_cell(10))
+        with pytest.raises(ValueError):
+            stream.write(_factory_cell(12))
+
+
+def test_collision_below_top(tmp_path):
+    with GdsStream(str(tmp_path / "a.gds")) as stream:
+        stream.write(_factory_cell(10))
+        top = Device("top")
+        top << _factory_cell(12)
+        with pytest.raises(ValueError):
+            stream.write(top, top=True)
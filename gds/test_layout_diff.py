@@ -0,0 +1,56 @@
+import gdspy
+import numpy as np
+import phidl.geometry as pg
+import pytest
+from phidl import Device
+
+import layout_diff
+
+
+def _layout(changed: bool):
+    # a shared cell, and a cell that differs between the versions placed
+    # rotated, reflected and as an array
+    shared = Device("SHARED")
+    shared << pg.rectangle(size=(40, 10), layer=1)
+    shared.add_polygon([(0, 20), (30, 20), (10, 50)], layer=2)
+    child = Device("CHILD")
+    child << pg.rectangle(size=(20, 20), layer=1)
+    child << pg.rectangle(size=(5, 30) if changed else (5, 25), layer=2).move((30, 0))
+    if changed:
+        child.add_polygon([(50, 0), (60, 0), (55, 7)], layer=1)
+    top = Device("TOP")
+    top << shared
+    (top << child).move((100, 0))
+    (top << child).rotate(90).move((300, 100))
+    (top << child).mirror().move((500, 0))
+    top.add_array(child, columns=3, rows=2, spacing=(100, 100)).move((0, 600))
+    if changed:
+        top << pg.rectangle(size=(10, 10), layer=3).move((900, 900))
+    return top
+
+
+def _flat_xor(A, B):
+    a = A.get_polygons(by_spec=True)
+    b = B.get_polygons(by_spec=True)
+    areas = {}
+    for spec in set(a) | set(b):
+        xor = gdspy.boolean(a.get(spec, []), b.get(spec, []), "xor", precision=1e-3)
+        if xor is not None:
+            areas[spec] = xor.area()
+    return areas
+
+
+@pytest.mark.parametrize("tile_size", [50, 500])
+def test_area_matches_flat_xor(tile_size):
+    A, B = _layout(False), _layout(True)
+    areas = {}
+    for c in layout_diff.diff(A, B, tile_size=tile_size):
+        areas[c.layer, c.datatype] = areas.get((c.layer, c.datatype), 0) + c.area
+    expected = _flat_xor(A, B)
+    assert set(areas) == set(expected)
+    for spec, area in expected.items():
+        assert np.isclose(areas[spec], area, rtol=1e-6), spec
+
+
+def test_equal_layouts():
+    assert layout_diff.diff(_layout(True), _layout(True)) == []
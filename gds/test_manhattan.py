@@ -0,0 +1,84 @@
+import gdspy
+import numpy as np
+import pytest
+
+import manhattan
+
+
+def _rects(rng, n):
+    lo = rng.integers(0, 50, (n, 2))
+    size = rng.integers(1, 15, (n, 2))
+    return [
+        np.array([l, l + [s[0], 0], l + s, l + [0, s[1]]], dtype=float)
+        for l, s in zip(lo, size)
+    ]
+
+
+def _operands(seed):
+    rng = np.random.default_rng(seed)
+    a, b = _rects(rng, 20), _rects(rng, 20)
+    # an L and a U shaped polygon, the U clockwise
+    L = [[0, 0], [30, 0], [30, 5], [5, 5], [5, 30], [0, 30]]
+    U = [[0, 0], [20, 0], [20, 20], [15, 20], [15, 5], [5, 5], [5, 20], [0, 20]]
+    a.append(np.array(L, dtype=float) + rng.integers(0, 30, 2))
+    b.append(np.array(U, dtype=float)[::-1] + rng.integers(0, 30, 2))
+    a = [p[::-1] if rng.random() < 0.5 else p for p in a]
+    return a, b
+
+
+def _mismatch(a, b):
+    xor = gdspy.boolean(a, b, "xor", precision=1e-3)
+    return 0.0 if xor is None else xor.area()
+
+
+@pytest.fixture(autouse=True)
+def _always_fast(monkeypatch):
+    # take the fast path for the small operands of these tests too
+    monkeypatch.setattr(manhattan, "MIN_VERTICES", 0)
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("operation", ["or", "and", "not", "xor"])
+def test_boolean(seed, operation):
+    a, b = _operands(seed)
+    expected = gdspy.boolean(a, b, operation, precision=1e-3)
+    result = manhattan.boolean(a, b, operation, precision=1e-3)
+    assert isinstance(result, manhattan.Rectangles)
+    assert _mismatch(expected, result) < 1e-6
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("distance", [1.3, 3])
+def test_grow(seed, distance):
+    a, _ = _operands(seed)
+    expected = gdspy.offset(a, distance, precision=1e-3, join_first=True)
+    result = manhattan.offset(a, distance, precision=1e-3)
+    assert isinstance(result, manhattan.Rectangles)
+    assert _mismatch(expected, result) < 1e-6
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_shrink(seed):
+    # gdspy leaves artifacts in the holes of eroded regions, so the erosion
+    # is checked point by point: a point is inside the result if the square
+    # of half size distance around it is covered by the operand
+    a, _ = _operands(seed)
+    distance = 1.5
+    result = manhattan.offset(a, -distance)
+    assert isinstance(result, manhattan.Rectangles)
+    union = gdspy.boolean(a, None, "or")
+    rng = np.random.default_rng(seed)
+    for c in rng.uniform(0, 80, (30, 2)):
+        inside = gdspy.inside([c], result)[0]
+        d = distance - 1e-6
+        covered = gdspy.boolean(gdspy.Rectangle(c - d, c + d), union, "not") is None
+        if covered != inside:
+            # points on the boundary of the result may go either way
+            d = distance + 1e-3
+            covered = gdspy.boolean(gdspy.Rectangle(c - d, c + d), union, "not") is None
+        assert covered == inside
+
+
+def test_empty():
+    assert manhattan.boolean([], None, "or") is None
+    assert manhattan.offset(None, 1) is None
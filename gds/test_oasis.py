@@ -0,0 +1,47 @@
+import gdspy
+import phidl.geometry as pg
+from phidl import Device
+
+import oasis
+from gds_stream import GdsStream, build_timestamp
+
+
+def _layout():
+    # two equal cells built separately, and a cell that differs
+    top = Device("array")
+    for n, size in enumerate((10, 10, 12)):
+        D = Device("die")
+        D << pg.rectangle(size=(size, 5), layer=1)
+        D.add_polygon([(0, 0), (3, 4), (0, 4)], layer=2)
+        top.add_ref(D).move((100 * n, 0))
+    return top
+
+
+def test_names_match_stream(tmp_path):
+    top = _layout()
+    with GdsStream(str(tmp_path / "a.gds"), cellname="top") as stream:
+        stream.write(top, top=True)
+    lib = gdspy.GdsLibrary(infile=str(tmp_path / "a.gds"))
+    names = oasis.cell_names(top, cellname="top")
+    assert set(names.values()) == set(lib.cells)
+    # top, two distinct dies and their rectangles
+    assert len(set(names.values())) == 5
+
+
+def test_equal_cells_written_once(tmp_path):
+    top = _layout()
+    names = oasis.cell_names(top, cellname="top")
+    oasis.write_oas(top, str(tmp_path / "a.oas"), cellname="top", compress=False)
+    data = (tmp_path / "a.oas").read_bytes()
+    for name in set(names.values()):
+        assert data.count(name.encode()) == 1
+
+
+def test_gds_gz_reproducible(tmp_path):
+    files = []
+    for n in range(2):
+        (tmp_path / str(n)).mkdir()
+        filename = tmp_path / str(n) / "a.gds.gz"
+        oasis.write_gds_gz(_layout(), str(filename), timestamp=build_timestamp())
+        files.append(filename.read_bytes())
+    assert files[0] == files[1]
@@ -0,0 +1,34 @@
+import phidl.geometry as pg
+from phidl import Device
+
+from cell_cache import cached_cell
+from parallel import parallel_gridsweep
+
+
+@cached_cell
+def _pad(size: float = 10) -> Device:
+    D = Device("PAD")
+    D << pg.rectangle(size=(size, size), layer=1)
+    return D
+
+
+def _device(width: float, length: float) -> Device:
+    D = Device("DEVICE")
+    D << pg.rectangle(size=(width, length), layer=2)
+    (D << _pad()).move((-20, 0))
+    (D << _pad()).move((width + 10, 0))
+    return D
+
+
+def _cells(D):
+    return {id(c) for c in D.get_dependencies(recursive=True)}
+
+
+def test_pads_shared():
+    kwargs = dict(param_x={"width": [1, 2, 3]}, param_y={"length": [4, 5]})
+    # the pad cell is cached before the workers start
+    pad = _pad()
+    serial = parallel_gridsweep(_device, processes=1, **kwargs)
+    parallel = parallel_gridsweep(_device, processes=2, **kwargs)
+    assert len(_cells(parallel)) == len(_cells(serial))
+    assert id(pad) in _cells(parallel)
@@ -0,0 +1,168 @@
+"""Checks the analytic square counts of squares.py against a finite-difference
+solution of the Laplace equation (and against phidlfem, where it is
+installed)."""
+
+import gdspy
+import numpy as np
+import phidl.geometry as pg
+import pytest
+from phidl import Device
+
+import squares
+
+sparse = pytest.importorskip("scipy.sparse")
+linalg = pytest.importorskip("scipy.sparse.linalg")
+
+
+def _fd_squares(D: Device, h: float) -> float:
+    """Squares between ports 1 and 2 of D, on a grid of pitch h (cell-centered
+    finite differences, sheet resistance 1, all edges on the grid)."""
+    polygons = [p for ps in D.get_polygons(by_spec=True).values() for p in ps]
+    (x0, y0), (x1, y1) = D.bbox
+    nx, ny = int(round((x1 - x0) / h)), int(round((y1 - y0) / h))
+    X, Y = np.meshgrid(
+        x0 + (np.arange(nx) + 0.5) * h, y0 + (np.arange(ny) + 0.5) * h, indexing="ij"
+    )
+    centers = np.column_stack((X.ravel(), Y.ravel()))
+    inside = np.array(gdspy.inside(centers, polygons)).reshape(nx, ny)
+    index = np.full((nx, ny), -1)
+    index[inside] = np.arange(inside.sum())
+    n = int(inside.sum())
+    rows, cols = [], []
+    diagonal = np.zeros(n)
+    rhs = np.zeros(n)
+    for dx, dy in ((1, 0), (0, 1)):
+        both = inside[: nx - dx, : ny - dy] & inside[dx:, dy:]
+        i, j = index[: nx - dx, : ny - dy][both], index[dx:, dy:][both]
+        rows += [i, j]
+        cols += [j, i]
+        np.add.at(diagonal, i, 1)
+        np.add.at(diagonal, j, 1)
+    # the cells along each port, at potentials 1 and 0 half a cell away
+    contacts = []
+    for name, potential in ((1, 1.0), (2, 0.0)):
+        port = D.ports[name]
+        normal = np.round(port.normal[1] - port.normal[0])
+        tangent = np.array([-normal[1], normal[0]])
+        offset = centers - (np.asarray(port.midpoint) - normal * h / 2)
+        cells = index.ravel()[
+            (np.abs(offset @ normal) < h / 4)
+            & (np.abs(offset @ tangent) < port.width / 2)
+            & inside.ravel()
+        ]
+        assert len(cells) == round(port.width / h)
+        diagonal[cells] += 2
+        rhs[cells] += 2 * potential
+        contacts.append(cells)
+    rows = np.concatenate(rows + [np.arange(n)])
+    cols = np.concatenate(cols + [np.arange(n)])
+    values = np.concatenate([-np.ones(len(rows) - n), diagonal])
+    A = sparse.csr_matrix((values, (rows, cols)), shape=(n, n))
+    V = linalg.spsolve(A, rhs)
+    return 1 / np.sum(2 * (1 - V[contacts[0]]))
+
+
+def _corner(arm: float = 5) -> Device:
+    D = Device("corner")
+    D.add_polygon([(0, 0), (arm, 0), (arm, 1), (1, 1), (1, arm), (0, arm)])
+    D.add_port(name=1, midpoint=(arm, 0.5), width=1, orientation=0)
+    D.add_port(name=2, midpoint=(0.5, arm), width=1, orientation=90)
+    return D
+
+
+def _step(narrow: float, wide: float) -> Device:
+    # 3 squares on either side of the step
+    a, b = 3 * narrow, 3 * wide
+    D = Device("step")
+    D.add_polygon(
+        [
+            (-a, -narrow / 2),
+            (0, -narrow / 2),
+            (0, -wide / 2),
+            (b, -wide / 2),
+            (b, wide / 2),
+            (0, wide / 2),
+            (0, narrow / 2),
+            (-a, narrow / 2),
+        ]
+    )
+    D.add_port(name=1, midpoint=(-a, 0), width=narrow, orientation=180)
+    D.add_port(name=2, midpoint=(b, 0), width=wide, orientation=0)
+    return D
+
+
+# (width, pitch, squares, max_length), with the hairpin lengths on the grid
+MEANDERS = [(1, 2, 83.45, 10), (1, 2, 47.27, 6), (1, 3, 49.27, 7)]
+
+
+def _meander(width, pitch, squares, max_length):
+    resistor = pytest.importorskip("qnngds.devices.resistor")
+    return resistor.meander(
+        width=width, pitch=pitch, squares=squares, max_length=max_length
+    )
+
+
+def _resistor(pad_size):
+    # a meander between two pads, connected as in make_gds.metal_resistor()
+    m = _meander(*MEANDERS[0])
+    D = Device("resistor")
+    D << m
+    pad = Device("pad")
+    pad << pg.rectangle(size=pad_size)
+    pad.add_port(
+        name=1, midpoint=(0, pad_size[1] / 2), width=pad_size[1], orientation=180
+    )
+    pad.add_port(
+        name=2,
+        midpoint=(pad_size[0], pad_size[1] / 2),
+        width=pad_size[1],
+        orientation=0,
+    )
+    for i in (1, 2):
+        p = D << pad
+        p.connect(p.ports[1], m.ports[i])
+        D.add_port(name=i, port=p.ports[2])
+    return D
+
+
+def test_corner():
+    # two arms of 4 squares and the corner square
+    assert _fd_squares(_corner(), 0.05) - 8 == pytest.approx(
+        squares.CORNER_SQUARES, abs=0.02
+    )
+
+
+@pytest.mark.parametrize("narrow,wide", [(1, 2), (1, 4), (1, 10), (2, 5)])
+def test_step(narrow, wide):
+    assert _fd_squares(_step(narrow, wide), 0.05) - 6 == pytest.approx(
+        squares.step_squares(narrow, wide), abs=0.02
+    )
+
+
+@pytest.mark.parametrize("width,pitch,count,max_length", MEANDERS)
+def test_meander(width, pitch, count, max_length):
+    expected = squares.meander_squares(width, pitch, count, max_length)
+    m = _meander(width, pitch, count, max_length)
+    assert _fd_squares(m, 0.05) == pytest.approx(expected, rel=0.002)
+
+
+def test_resistor_with_pads():
+    pad_size = (10, 20)
+    width, pitch, count, max_length = MEANDERS[0]
+    meander = squares.meander_squares(width, pitch, count, max_length)
+    pads = 2 * (pad_size[0] / pad_size[1] + squares.step_squares(width, pad_size[1]))
+    assert _fd_squares(_resistor(pad_size), 0.1) == pytest.approx(
+        meander + pads, rel=0.005
+    )
+    # the label value is the mean of the meander with and without the pads
+    assert squares.resistor_squares(
+        width, pitch, count, max_length, pad_size
+    ) == pytest.approx(meander + pads / 2)
+
+
+def test_fem(tmp_path):
+    pytest.importorskip("phidlfem")
+    m = _meander(*MEANDERS[0])
+    fem = squares.fem_squares(m, mesh_size=0.25, cache_path=str(tmp_path / "fem.json"))
+    # the tolerance of check_squares()
+    assert fem == pytest.approx(squares.meander_squares(*MEANDERS[0]), rel=0.02)
@@ -0,0 +1,55 @@
+"""Checks that the direct placement of the via chain matches connect()."""
+
+import itertools
+
+import numpy as np
+import pytest
+
+import via
+
+GRID = list(
+    itertools.product(
+        (5, 10),  # wire_width
+        (20, 40, 50),  # via_spacing
+        ((100, 100), (150, 90), (300, 300)),  # pad_size
+        (2, 10, 101, 200),  # num_vias
+        (0, 400),  # min_pad_spacing
+    )
+)
+
+
+def _shapes(D):
+    """Sorted (layer, vertices) of the flattened polygons of D, each polygon
+    starting at its lowest vertex."""
+    shapes = []
+    for (layer, _), polygons in D.get_polygons(by_spec=True).items():
+        for p in polygons:
+            p = np.round(np.asarray(p), 3) + 0.0
+            start = np.lexsort((p[:, 1], p[:, 0]))[0]
+            shapes.append((layer, tuple(map(tuple, np.roll(p, -start, axis=0)))))
+    return sorted(shapes)
+
+
+@pytest.mark.parametrize("wire_width,via_spacing,pad_size,num_vias,spacing", GRID)
+def test_closed_form_matches_iterative(
+    wire_width, via_spacing, pad_size, num_vias, spacing
+):
+    kwargs = dict(
+        num_vias=num_vias,
+        wire_width=wire_width,
+        via_spacing=via_spacing,
+        pad_size=pad_size,
+        min_pad_spacing=spacing,
+    )
+    iterative = via.test_via(iterative=True, **kwargs)
+    closed = via.test_via(iterative=False, **kwargs)
+    assert _shapes(closed) == _shapes(iterative)
+    assert np.allclose(iterative.info["pads"], closed.info["pads"])
+
+
+@pytest.mark.parametrize("pad_size", [(300, 300), (150, 90), (100, 60)])
+def test_long_chain(pad_size):
+    kwargs = dict(num_vias=3000, wire_width=5, via_spacing=50, pad_size=pad_size)
+    iterative = via.test_via(iterative=True, **kwargs)
+    closed = via.test_via(**kwargs)
+    assert _shapes(closed) == _shapes(iterative)
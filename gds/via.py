@@ -1,6 +1,11 @@
+import numpy as np
 import phidl.geometry as pg
 from phidl import Device
 from phidl import quickplot as qp
+from phidl.device_layout import DeviceReference
+
+from arrays import TOLERANCE, arrayize, place_array
+from labels import label as text_label
 
 
 # Via Route ----------------------------------------
@@ -62,6 +67,189 @@ def _via_iterable(
     return VI
 
 
+def _rotate(theta, points):
+    """Rotates points by a multiple of 90 degrees (exactly)."""
+    c, s = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}[theta % 360]
+    points = np.asarray(points, dtype=float)
+    return np.stack(
+        (
+            c * points[..., 0] - s * points[..., 1],
+            s * points[..., 0] + c * points[..., 1],
+        ),
+        axis=-1,
+    )
+
+
+def _direction(theta):
+    return _rotate(theta, (1, 0))
+
+
+def _first_beyond(start, step, limit):
+    """Smallest k >= 0 with start + k * step > limit, or None."""
+    if start > limit:
+        return 0
+    if step <= 0:
+        return None
+    k = int(np.floor((limit - start) / step)) + 1
+    # correct the rounding of the division
+    while start + k * step <= limit:
+        k += 1
+    while k > 1 and start + (k - 1) * step > limit:
+        k -= 1
+    return k
+
+
+def _chain_runs(via_iterable, head, n, overlap, ymin, ymax):
+    """Placement of the via chain of test_via without connect().
+
+    Each element connects its W port to the E port of the previous one; if
+    it then extends above ymax it is instead connected to the previous
+    element's S port, if it extends below ymin to its N port, folding the
+    chain into the next column. The elements of a straight run are placed
+    at once (np.arange), the length of the run follows from the first
+    element that leaves the pad; only the folds are placed one by one, with
+    the arithmetic of connect() and exact rotations by multiples of 90
+    degrees. Once the chain is back in the state of an earlier fold (the
+    same ports at the same heights) it repeats with a fixed horizontal
+    shift, and the rest is tiled.
+
+    Parameters
+    ----------
+    via_iterable : Device
+        Chain element from _via_iterable().
+    head : DeviceReference
+        Reference the chain starts from (at its S port).
+    n : int
+        Number of elements.
+    overlap : int or float
+        Overlap of connected ports.
+    ymin, ymax : int or float
+        Vertical extent the chain must stay within.
+
+    Returns
+    -------
+    runs : dict
+        Element origins (k x 2 array) by rotation.
+    state : dict
+        Last element (origin, rotation, or None if n is 0), number of folds,
+        whether the last element is a fold (edge) and the direction of the
+        last fold (up).
+    """
+    ports = {
+        name: (
+            np.asarray(via_iterable.ports[name].midpoint, dtype=float),
+            via_iterable.ports[name].orientation,
+        )
+        for name in ("W", "E", "N", "S")
+    }
+    (x0, y0), (x1, y1) = np.asarray(via_iterable.bbox, dtype=float)
+    corners = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+    # vertical extent of the element by rotation
+    extent = {r: _rotate(r, corners)[:, 1] for r in (0, 90, 180, 270)}
+    extent = {r: (y.min(), y.max()) for r, y in extent.items()}
+
+    def port(origin, rotation, name):
+        p, o = ports[name]
+        return origin + _rotate(rotation, p), round(rotation + o) % 360
+
+    def place(destination):
+        # connect W to the port destination: the rotation follows the port
+        p, orientation = destination
+        rotation = round(orientation + 180 - ports["W"][1]) % 360
+        origin = (
+            p - overlap * _direction(orientation) - _rotate(rotation, ports["W"][0])
+        )
+        return origin, rotation
+
+    def key(destination, prev_ports):
+        # the state of the chain up to a horizontal shift
+        x = destination[0][0]
+        values = [destination[0][1], destination[1]]
+        for p, o in prev_ports.values():
+            values += [p[0] - x, p[1], o]
+        return tuple(np.round(values, 6))
+
+    prev_ports = {
+        name: (
+            np.asarray(head.ports[name].midpoint, dtype=float),
+            round(head.ports[name].orientation) % 360,
+        )
+        for name in ("N", "S")
+    }
+    destination = prev_ports["S"]
+    origins, rotations, folds, ups = [], [], [], []
+    count = 0
+    seen = {}
+    while count < n:
+        state = key(destination, prev_ports)
+        if state in seen:
+            # periodic from here on: tile the elements placed since
+            segment, start, x = seen[state]
+            period = slice(segment, len(origins))
+            shift = np.array([destination[0][0] - x, 0])
+            reps = -(-(n - count) // (count - start))
+            steps = np.arange(1, reps + 1)[:, None, None]
+            for values in (origins, rotations, folds, ups):
+                tiled = np.concatenate(values[period])
+                if values is origins:
+                    tiled = (tiled[None] + steps * shift).reshape(-1, 2)
+                else:
+                    tiled = np.tile(tiled, reps)
+                values.append(tiled[: n - count])
+            count = n
+            break
+        seen[state] = (len(origins), count, destination[0][0])
+        origin, rotation = place(destination)
+        step = place(port(origin, rotation, "E"))[0] - origin
+        low, high = extent[rotation]
+        # first element of the straight run that leaves the pad, S first
+        leaves = [
+            (k, name)
+            for k, name in (
+                (_first_beyond(origin[1] + high, step[1], ymax + TOLERANCE), "S"),
+                (_first_beyond(-origin[1] - low, -step[1], TOLERANCE - ymin), "N"),
+            )
+            if k is not None and k < n - count
+        ]
+        k, name = (
+            min(leaves, key=lambda leave: leave[0]) if leaves else (n - count, None)
+        )
+        run = origin + np.arange(k)[:, None] * step
+        origins.append(run)
+        rotations.append(np.full(k, rotation))
+        folds.append(np.zeros(k, dtype=bool))
+        ups.append(np.zeros(k, dtype=bool))
+        count += k
+        if name is None:
+            break
+        if k:
+            prev_ports = {m: port(run[-1], rotation, m) for m in ("N", "S")}
+        origin, rotation = place(prev_ports[name])
+        destination = port(origin, rotation, name)
+        prev_ports = {m: port(origin, rotation, m) for m in ("N", "S")}
+        origins.append(origin[None])
+        rotations.append(np.array([rotation]))
+        folds.append(np.array([True]))
+        ups.append(np.array([name == "N"]))
+        count += 1
+
+    state = dict(last=None, folds=0, edge=True, up=False)
+    if n <= 0:
+        return {}, state
+    origins = np.concatenate(origins)
+    rotations = np.concatenate(rotations)
+    folds = np.concatenate(folds)
+    ups = np.concatenate(ups)
+    state.update(
+        last=(origins[-1], int(rotations[-1])),
+        folds=int(folds.sum()),
+        edge=bool(folds[-1]),
+        up=bool(ups[folds][-1]) if folds.any() else False,
+    )
+    runs = {int(r): origins[rotations == r] for r in dict.fromkeys(rotations.tolist())}
+    return runs, state
+
+
 def test_via(
     num_vias=100,
     wire_width=10,
@@ -73,6 +261,7 @@ def test_via(
     wiring1_layer=1,
     wiring2_layer=2,
     via_layer=3,
+    iterative=False,
 ):
     """Via chain test structure.
 
@@ -98,6 +287,11 @@ def test_via(
         Specific layer to put the bottom wiring on.
     via_layer : int
         Specific layer to put the vias on.
+    iterative : bool
+        If True, place the chain one element at a time with connect();
+        otherwise compute the positions directly (same geometry, much
+        faster for long chains). Elements ending on the pad edge (within
+        TOLERANCE) count as inside either way.
 
     Returns
     -------
@@ -141,42 +335,72 @@ def test_via(
     pad1_overlay.xmin = pad1.xmin
     pad1_overlay.ymin = pad1.ymin
 
-    old_port = head.ports["S"]
-    count = 0
     width_via_iter = 2 * via_spacing - 2 * wire_width
 
     pad2.xmin = pad1.xmax + min_pad_spacing
-    up = False
-    down = True
-    edge = True
     current_width = 3 * wire_width + wire_width  # width of nub and 1 overlap
-    obj_old = head
-    obj = head
     via_iterable = _via_iterable(
         via_spacing, wire_width, wiring1_layer, wiring2_layer, via_layer, via_width
     )
-    while (count + 2) <= num_vias:
-        obj = VR.add_ref(via_iterable)
-        obj.connect(port="W", destination=old_port, overlap=wire_width)
-        old_port = obj.ports["E"]
-        edge = False
-        if obj.ymax > pad1.ymax:
-            obj.connect(port="W", destination=obj_old.ports["S"], overlap=wire_width)
-            old_port = obj.ports["S"]
-            current_width += width_via_iter
-            down = True
-            up = False
-            edge = True
-
-        elif obj.ymin < pad1.ymin:
-            obj.connect(port="W", destination=obj_old.ports["N"], overlap=wire_width)
-            old_port = obj.ports["N"]
-            current_width += width_via_iter
-            up = True
-            down = False
-            edge = True
-        count = count + 2
-        obj_old = obj
+    if iterative:
+        old_port = head.ports["S"]
+        count = 0
+        up = False
+        down = True
+        edge = True
+        obj_old = head
+        obj = head
+        while (count + 2) <= num_vias:
+            obj = VR.add_ref(via_iterable)
+            obj.connect(port="W", destination=old_port, overlap=wire_width)
+            old_port = obj.ports["E"]
+            edge = False
+            # an element touching the pad edge stays inside
+            if obj.ymax > pad1.ymax + TOLERANCE:
+                obj.connect(
+                    port="W", destination=obj_old.ports["S"], overlap=wire_width
+                )
+                old_port = obj.ports["S"]
+                current_width += width_via_iter
+                down = True
+                up = False
+                edge = True
+
+            elif obj.ymin < pad1.ymin - TOLERANCE:
+                obj.connect(
+                    port="W", destination=obj_old.ports["N"], overlap=wire_width
+                )
+                old_port = obj.ports["N"]
+                current_width += width_via_iter
+                up = True
+                down = False
+                edge = True
+            count = count + 2
+            obj_old = obj
+        # emit the straight runs of the chain as AREFs
+        arrayize(VR, via_iterable)
+    else:
+        runs, state = _chain_runs(
+            via_iterable,
+            head,
+            max(int(num_vias) // 2, 0),
+            wire_width,
+            pad1.ymin,
+            pad1.ymax,
+        )
+        for rotation, origins in runs.items():
+            place_array(VR, via_iterable, origins, rotation=rotation)
+        current_width += state["folds"] * width_via_iter
+        up = state["up"]
+        down = not up
+        edge = state["edge"]
+        if state["last"] is None:
+            obj = head
+        else:
+            # unplaced reference, only used for its ports
+            obj = DeviceReference(
+                via_iterable, origin=state["last"][0], rotation=state["last"][1]
+            )
 
     if (
         current_width < min_pad_spacing
@@ -227,7 +451,9 @@ def test_via(
     pad2_overlay.xmin = pad2.xmin
     pad2_overlay.ymin = pad2.ymin
 
-    label = VR << pg.text(str(num_vias), layer=pad_layer)
+    label = VR << text_label(str(num_vias), layers=(pad_layer,))
     label.move((pad2.xmin - label.xmax - 5, pad2.ymin - label.ymin))
+    # probe pad centers, for the device metadata (see metadata.py)
+    VR.info["pads"] = [tuple(pad1.center), tuple(pad2.center)]
 
     return VR